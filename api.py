@@ -4,20 +4,69 @@ API сервер для Mini App
 
 Предоставляет эндпоинты для получения данных пользователя,
 статуса рефералов и режима приложения.
+
+Пользователь запроса определяется по подписанной initData Mini App
+(заголовок X-Telegram-Init-Data, см. telegram_auth.py), а не по
+telegram_id из пути или тела.
 """
 
 from aiohttp import web
 from aiohttp.web import middleware
-from datetime import datetime
+from dotenv import load_dotenv
+from datetime import datetime, timedelta
+import asyncio
+import compression
 import database
+import json_codec
+import live
+import loop_watchdog
 import messages
+import metrics
+import ratelimit
+import referral_links
+import scheduler
+import telegram_auth
+import tracing
+import hashlib
 import logging
-import json
+import math
+import os
+import time
+
+load_dotenv()
+
+# Проверка initData Mini App (X-Telegram-Init-Data). API_AUTH=0 — выключить
+# (только для локальной разработки: тогда telegram_id берётся из запроса)
+AUTH_REQUIRED = os.getenv("API_AUTH", "1") != "0"
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Маршруты /api/*, доступные без initData (не привязаны к пользователю)
+PUBLIC_ROUTES = {'/api/health', '/api/mode'}
+# Долгие соединения (SSE): без трассы и гистограммы времени ответа
+STREAMING_ROUTES = {'/api/events/{telegram_id}'}
+
+# /metrics и /debug/traces — только с заголовком Authorization: Bearer <токен>;
+# без токена маршруты не подключаются (в трассах пути с telegram_id и тайминги)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Проверенный пользователь запроса (ставит auth_middleware).
+# web.RequestKey — с aiohttp 3.14 (строковые ключи там дают NotAppKeyWarning)
+if hasattr(web, "RequestKey"):
+    TG_USER = web.RequestKey("tg_user", dict)
+    TELEGRAM_ID = web.RequestKey("telegram_id", int)
+else:
+    TG_USER = "tg_user"
+    TELEGRAM_ID = "telegram_id"
 
 # ═══════════════════════════════════════════════════════════════
 # MIDDLEWARE
 # ═══════════════════════════════════════════════════════════════
 
+def _cors_headers(response):
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, DELETE, OPTIONS'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-Telegram-Init-Data'
+
+
 @middleware
 async def cors_middleware(request, handler):
     """Добавляет CORS заголовки для Mini App."""
@@ -26,9 +75,195 @@ async def cors_middleware(request, handler):
     else:
         response = await handler(request)
     
-    response.headers['Access-Control-Allow-Origin'] = '*'
-    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-Telegram-Init-Data'
+    if not response.prepared:  # потоковые ответы ставят заголовки сами
+        _cors_headers(response)
+    return response
+
+
+def _route(request) -> str:
+    resource = request.match_info.route.resource
+    return resource.canonical if resource else "unmatched"
+
+
+@middleware
+async def tracing_middleware(request, handler):
+    """Каждый запрос — трасса (см. tracing.py), имя — по шаблону маршрута."""
+    route = _route(request)
+    if route in STREAMING_ROUTES:
+        return await handler(request)
+    with tracing.start_trace(f"http {request.method} {route}", path=request.path):
+        return await handler(request)
+
+
+@middleware
+async def metrics_middleware(request, handler):
+    """Время ответа по маршруту (шаблону пути, а не конкретному URL)."""
+    if _route(request) in STREAMING_ROUTES:
+        return await handler(request)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            route=_route(request), method=request.method, status=status,
+        )
+
+
+@middleware
+async def compression_middleware(request, handler):
+    """Сжатие ответов по Accept-Encoding (см. compression.py)."""
+    response = await handler(request)
+    if (not compression.ENABLED or type(response) is not web.Response
+            or response.content_type not in compression.COMPRESSIBLE_TYPES):
+        return response
+    
+    response.headers.add('Vary', 'Accept-Encoding')
+    body = response.body
+    if (response.status == 200 and isinstance(body, bytes) and len(body) >= compression.MIN_SIZE
+            and 'Content-Encoding' not in response.headers):
+        coding = compression.negotiate(request.headers.get('Accept-Encoding', ''))
+        if coding:
+            response.body = compression.compress(body, coding)
+            response.headers['Content-Encoding'] = coding
+    return response
+
+
+RATE_LIMITED = metrics.Counter(
+    "http_rate_limited_total", "API requests rejected with 429", ("scope",))
+
+_WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+def _too_many_requests(retry_after: float, scope: str) -> web.Response:
+    RATE_LIMITED.inc(scope=scope)
+    response = json_response({"success": False, "error": "Too many requests"}, status=429)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _is_api_request(request) -> bool:
+    return request.method != 'OPTIONS' and request.path.startswith('/api/') and request.path != '/api/health'
+
+
+@middleware
+async def ip_rate_limit_middleware(request, handler):
+    """Лимит запросов с одного IP (до проверки initData — подбор подписи тоже ограничен)."""
+    if ratelimit.ENABLED and _is_api_request(request):
+        retry_after = ratelimit.ip_limiter.hit(ratelimit.client_ip(request))
+        if retry_after:
+            return _too_many_requests(retry_after, "ip")
+    return await handler(request)
+
+
+@middleware
+async def user_rate_limit_middleware(request, handler):
+    """Лимит по проверенному пользователю: отдельно чтения и записи."""
+    telegram_id = request.get(TELEGRAM_ID)
+    if ratelimit.ENABLED and telegram_id is not None and _is_api_request(request):
+        if request.method in _WRITE_METHODS:
+            scope, limiter = "user_write", ratelimit.user_write_limiter
+        else:
+            scope, limiter = "user_read", ratelimit.user_read_limiter
+        retry_after = limiter.hit(str(telegram_id))
+        if retry_after:
+            return _too_many_requests(retry_after, scope)
+    return await handler(request)
+
+
+@middleware
+async def auth_middleware(request, handler):
+    """
+    Проверка подписи initData для /api/* (кроме PUBLIC_ROUTES).
+    
+    Проверенный пользователь — request[TG_USER], его id — request[TELEGRAM_ID].
+    Если в пути есть {telegram_id}, он должен совпадать с проверенным.
+    """
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource else ""
+    if not AUTH_REQUIRED or not route.startswith('/api/') or route in PUBLIC_ROUTES:
+        return await handler(request)
+    
+    try:
+        user = telegram_auth.verify(request.headers.get('X-Telegram-Init-Data', ''), BOT_TOKEN)
+    except telegram_auth.InitDataError as e:
+        return json_response({"success": False, "error": f"Unauthorized: {e}"}, status=401)
+    
+    claimed = request.match_info.get('telegram_id')
+    if claimed is not None and claimed != str(user['id']):
+        return json_response({"success": False, "error": "Forbidden"}, status=403)
+    
+    request[TG_USER] = user
+    request[TELEGRAM_ID] = user['id']
+    return await handler(request)
+
+
+def _telegram_id(request, claimed=None) -> int:
+    """
+    Пользователь запроса: из проверенной initData, а без проверки
+    (API_AUTH=0) — claimed из пути или тела. ValueError — если id некорректен.
+    """
+    verified = request.get(TELEGRAM_ID)
+    if verified is not None:
+        return verified
+    if claimed is None:
+        raise ValueError("telegram_id is required")
+    return int(claimed)
+
+
+def _is_admin(request) -> bool:
+    """Проверенный пользователь запроса — админ (по username, как в боте)."""
+    username = (request.get(TG_USER) or {}).get('username') or ''
+    return username.lower() in {u.lower() for u in messages.ADMIN_USERNAMES}
+
+
+# ═══════════════════════════════════════════════════════════════
+# ОТВЕТЫ
+# ═══════════════════════════════════════════════════════════════
+
+def json_response(data, status: int = 200) -> web.Response:
+    """
+    JSON-ответ через json_codec (orjson, если установлен).
+    
+    data — объект для сериализации или уже закодированные bytes.
+    """
+    body = data if isinstance(data, bytes) else json_codec.dumps(data)
+    return web.Response(body=body, status=status, content_type='application/json')
+
+
+# Данные пользователя: клиент всегда перепроверяет кэш (If-None-Match)
+_REVALIDATE = 'private, no-cache'
+
+
+def _not_modified(request, etag: str):
+    """
+    304, если If-None-Match совпадает с etag (слабое сравнение), иначе None.
+    
+    etag — в виде W/"...".
+    """
+    value = etag[3:-1]
+    for candidate in request.if_none_match or ():
+        if candidate.value == value or candidate.value == '*':
+            return web.Response(status=304, headers={'ETag': etag, 'Cache-Control': _REVALIDATE})
+    return None
+
+
+def _cacheable(request, body: bytes, etag: str = None) -> web.Response:
+    """
+    JSON-ответ с ETag (или 304). Без etag — слабый ETag по хэшу тела:
+    данные всё равно читаются, но неизменённый ответ не передаётся.
+    """
+    if etag is None:
+        etag = f'W/"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    response = _not_modified(request, etag) or json_response(body)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = _REVALIDATE
     return response
 
 
@@ -36,91 +271,138 @@ async def cors_middleware(request, handler):
 # ЭНДПОИНТЫ
 # ═══════════════════════════════════════════════════════════════
 
+async def _find_webinar(slug: str = None):
+    """Вебинар по slug или текущий. None — если такого нет."""
+    if slug:
+        return await database.get_webinar_by_slug(slug)
+    return await database.get_current_webinar(scheduler.now_local())
+
+
+async def _request_webinar(request):
+    """Вебинар из ?webinar=<slug> или текущий. None — если такого нет."""
+    return await _find_webinar(request.query.get('webinar'))
+
+
 async def get_user_data(request):
     """
-    GET /api/user/{telegram_id}
+    GET /api/user/{telegram_id}[?webinar=<slug>]
     
     Возвращает данные пользователя для Mini App:
     - user_id, username, full_name
-    - is_registered (зарегистрирован ли на вебинар)
+    - is_registered (зарегистрирован ли на вебинар, по умолчанию — текущий)
     - referrals (количество приведённых друзей)
     - target_referrals (цель — 2)
     - in_raffle (участвует ли в розыгрыше)
     """
     try:
-        telegram_id = int(request.match_info['telegram_id'])
-        data = await database.get_user_referral_info(telegram_id)
+        telegram_id = _telegram_id(request, request.match_info['telegram_id'])
+        webinar = await _request_webinar(request)
+        if not webinar:
+            return json_response({
+                "success": False,
+                "error": "Webinar not found"
+            }, status=404)
+        data = await database.get_user_referral_info(telegram_id, webinar['id'])
         
-        return web.json_response({
+        # Рефералы меняются действиями других пользователей — версии нет,
+        # ETag по содержимому экономит передачу, но не чтение
+        return _cacheable(request, json_codec.dumps({
             "success": True,
             "data": data
-        })
+        }))
     except ValueError:
-        return web.json_response({
+        return json_response({
             "success": False,
             "error": "Invalid telegram_id"
         }, status=400)
     except Exception as e:
         logging.error(f"Error getting user data: {e}")
-        return web.json_response({
+        return json_response({
             "success": False,
             "error": str(e)
         }, status=500)
 
 
+# Ответ /api/mode зависит только от вебинара и текущей секунды — кодируем
+# его один раз в секунду, остальные запросы получают готовые bytes
+_mode_cache = {}  # slug из запроса (или None) -> (секунда, bytes)
+
+
+def _app_mode_data(now: datetime, webinar: dict) -> dict:
+    """Режим приложения для вебинара на момент now."""
+    webinar_dt = database.parse_ts(webinar['starts_at'])
+    
+    # Параметры времени
+    webinar_duration_hours = 2  # Длительность эфира
+    offer_duration_hours = 12   # Время действия скидки
+    
+    webinar_end = webinar_dt + timedelta(hours=webinar_duration_hours)
+    offer_deadline = webinar_end + timedelta(hours=offer_duration_hours)
+    
+    if now < webinar_dt:
+        mode = "before_webinar"
+        seconds_until = (webinar_dt - now).total_seconds()
+        deadline = webinar_dt.isoformat()
+    elif now < webinar_end:
+        mode = "live"
+        seconds_until = 0
+        deadline = None
+    elif now < offer_deadline:
+        mode = "after_webinar"
+        seconds_until = (offer_deadline - now).total_seconds()
+        deadline = offer_deadline.isoformat()
+    else:
+        mode = "offer_expired"
+        seconds_until = 0
+        deadline = None
+    
+    return {
+        "mode": mode,
+        "webinar": webinar['slug'],
+        "webinar_date": webinar_dt.isoformat(),
+        "seconds_until": int(seconds_until),
+        "deadline": deadline,
+        "course_price": webinar['price'] or messages.COURSE_PRICE,
+        "course_price_discount": webinar['price_discount'] or messages.COURSE_PRICE_DISCOUNT
+    }
+
+
+def _encode_app_mode(now: datetime, webinar: dict) -> bytes:
+    """Вычисляет и кодирует режим приложения для вебинара на момент now."""
+    return json_codec.dumps({
+        "success": True,
+        "data": _app_mode_data(now, webinar)
+    })
+
+
 async def get_app_mode(request):
     """
-    GET /api/mode
+    GET /api/mode[?webinar=<slug>]
     
-    Возвращает текущий режим приложения:
+    Возвращает текущий режим приложения (по умолчанию — для текущего вебинара):
     - before_webinar: до начала эфира
     - live: эфир идёт (в течение 2 часов после старта)
     - after_webinar: после эфира (активируется sales page)
     - offer_expired: скидка закончилась
     """
     try:
-        webinar_dt = datetime.strptime(messages.WEBINAR_DATE, "%Y-%m-%d %H:%M:%S")
-        now = datetime.now()
-        
-        # Параметры времени
-        webinar_duration_hours = 2  # Длительность эфира
-        offer_duration_hours = 12   # Время действия скидки
+        now = datetime.now().replace(microsecond=0)
+        key = request.query.get('webinar')
+        cached = _mode_cache.get(key)
+        if cached is None or cached[0] != now:
+            webinar = await _request_webinar(request)
+            if not webinar:
+                return json_response({
+                    "success": False,
+                    "error": "Webinar not found"
+                }, status=404)
+            # Ключи из запроса не копятся: кэш только для известных вебинаров
+            cached = _mode_cache[key] = (now, _encode_app_mode(now, webinar))
         
-        from datetime import timedelta
-        webinar_end = webinar_dt + timedelta(hours=webinar_duration_hours)
-        offer_deadline = webinar_end + timedelta(hours=offer_duration_hours)
-        
-        if now < webinar_dt:
-            mode = "before_webinar"
-            seconds_until = (webinar_dt - now).total_seconds()
-            deadline = webinar_dt.isoformat()
-        elif now < webinar_end:
-            mode = "live"
-            seconds_until = 0
-            deadline = None
-        elif now < offer_deadline:
-            mode = "after_webinar"
-            seconds_until = (offer_deadline - now).total_seconds()
-            deadline = offer_deadline.isoformat()
-        else:
-            mode = "offer_expired"
-            seconds_until = 0
-            deadline = None
-        
-        return web.json_response({
-            "success": True,
-            "data": {
-                "mode": mode,
-                "webinar_date": webinar_dt.isoformat(),
-                "seconds_until": int(seconds_until),
-                "deadline": deadline,
-                "course_price": messages.COURSE_PRICE,
-                "course_price_discount": messages.COURSE_PRICE_DISCOUNT
-            }
-        })
+        return json_response(cached[1])
     except Exception as e:
         logging.error(f"Error getting app mode: {e}")
-        return web.json_response({
+        return json_response({
             "success": False,
             "error": str(e)
         }, status=500)
@@ -134,29 +416,30 @@ async def register_user(request):
     Body: { "telegram_id": 123, "name": "...", "phone": "...", "goal": "..." }
     """
     try:
-        data = await request.json()
-        telegram_id = data.get('telegram_id')
-        
-        if not telegram_id:
-            return web.json_response({
+        data = await request.json(loads=json_codec.loads)
+        try:
+            telegram_id = _telegram_id(request, data.get('telegram_id'))
+        except (ValueError, TypeError):
+            return json_response({
                 "success": False,
                 "error": "telegram_id is required"
             }, status=400)
         
-        # Регистрируем на вебинар
-        await database.set_webinar_registration(telegram_id)
+        # Регистрируем на текущий вебинар и ставим персональную цепочку сообщений
+        await scheduler.register_for_webinar(telegram_id)
+        live.hub.poke()  # запись и реферал пригласившего — в живые обновления
         
         # Получаем обновлённые данные
         user_data = await database.get_user_referral_info(telegram_id)
         
-        return web.json_response({
+        return json_response({
             "success": True,
             "message": "Registered successfully",
             "data": user_data
         })
     except Exception as e:
         logging.error(f"Error registering user: {e}")
-        return web.json_response({
+        return json_response({
             "success": False,
             "error": str(e)
         }, status=500)
@@ -169,30 +452,49 @@ async def get_referral_link(request):
     Возвращает реферальную ссылку для пользователя.
     """
     try:
-        telegram_id = int(request.match_info['telegram_id'])
-        bot_username = "SadhuStas_bot"
-        
-        referral_link = f"https://t.me/{bot_username}?start=ref_{telegram_id}"
-        share_text = "Привет! Я иду на эфир про то, как быстро снять стресс и зарядиться энергией. Это бесплатно, погнали со мной! 👇"
-        
-        return web.json_response({
-            "success": True,
-            "data": {
-                "referral_link": referral_link,
-                "share_text": share_text,
-                "share_url": f"https://t.me/share/url?url={referral_link}&text={share_text}"
-            }
-        })
+        telegram_id = _telegram_id(request, request.match_info['telegram_id'])
+        return json_response(referral_links.get_response_bytes(telegram_id))
     except ValueError:
-        return web.json_response({
+        return json_response({
             "success": False,
             "error": "Invalid telegram_id"
         }, status=400)
 
 
+async def get_referral_links_batch(request):
+    """
+    POST /api/referral/batch
+    
+    Реферальные ссылки для многих пользователей за один запрос.
+    Body: { "telegram_ids": [123, 456, ...] }
+    
+    Чужие id — только админам; обычный пользователь может запросить лишь свой.
+    """
+    try:
+        data = await request.json(loads=json_codec.loads)
+        telegram_ids = [int(i) for i in data.get('telegram_ids', [])]
+        
+        verified = request.get(TELEGRAM_ID)
+        if verified is not None and not _is_admin(request) and set(telegram_ids) - {verified}:
+            return json_response({"success": False, "error": "Forbidden"}, status=403)
+        
+        if len(telegram_ids) > referral_links.MAX_BATCH:
+            return json_response({
+                "success": False,
+                "error": f"Too many telegram_ids (max {referral_links.MAX_BATCH})"
+            }, status=400)
+        
+        return json_response(referral_links.get_batch_response_bytes(telegram_ids))
+    except (ValueError, TypeError, AttributeError):
+        return json_response({
+            "success": False,
+            "error": "Invalid telegram_ids"
+        }, status=400)
+
+
 async def health_check(request):
     """GET /api/health — проверка работоспособности."""
-    return web.json_response({
+    return json_response({
         "success": True,
         "status": "ok",
         "timestamp": datetime.now().isoformat()
@@ -208,14 +510,24 @@ async def get_practice(request):
     GET /api/practice/{telegram_id}
     
     Возвращает прогресс трекера практики.
+    
+    ETag — по версии данных трекера (database.get_practice_version):
+    если у клиента актуальная версия, логи не читаются, ответ — 304.
     """
     try:
-        telegram_id = int(request.match_info['telegram_id'])
+        telegram_id = _telegram_id(request, request.match_info['telegram_id'])
+        
+        # Версия читается до логов: запись между чтениями даст новые логи
+        # со старым ETag, и следующий запрос просто перечитает их
+        etag = f'W/"practice-{telegram_id}-{await database.get_practice_version(telegram_id)}"'
+        not_modified = _not_modified(request, etag)
+        if not_modified:
+            return not_modified
         
-        completed_days = await database.get_completed_days(telegram_id)
         logs = await database.get_practice_logs(telegram_id)
+        completed_days = database.completed_days_from_logs(logs)
         
-        return web.json_response({
+        return _cacheable(request, json_codec.dumps({
             "success": True,
             "data": {
                 "completed_days": completed_days,
@@ -223,15 +535,15 @@ async def get_practice(request):
                 "target_days": 21,
                 "logs": logs
             }
-        })
+        }), etag)
     except ValueError:
-        return web.json_response({
+        return json_response({
             "success": False,
             "error": "Invalid telegram_id"
         }, status=400)
     except Exception as e:
         logging.error(f"Error getting practice: {e}")
-        return web.json_response({
+        return json_response({
             "success": False,
             "error": str(e)
         }, status=500)
@@ -245,13 +557,13 @@ async def save_practice(request):
     Body: { "telegram_id": 123, "date": "2026-01-01", "duration": 300 }
     """
     try:
-        data = await request.json()
-        telegram_id = data.get('telegram_id')
+        data = await request.json(loads=json_codec.loads)
         practice_date = data.get('date', datetime.now().strftime('%Y-%m-%d'))
         duration = data.get('duration', 0)
-        
-        if not telegram_id:
-            return web.json_response({
+        try:
+            telegram_id = _telegram_id(request, data.get('telegram_id'))
+        except (ValueError, TypeError):
+            return json_response({
                 "success": False,
                 "error": "telegram_id is required"
             }, status=400)
@@ -261,7 +573,7 @@ async def save_practice(request):
         # Возвращаем обновлённый прогресс
         completed_days = await database.get_completed_days(telegram_id)
         
-        return web.json_response({
+        return json_response({
             "success": True,
             "message": "Practice saved",
             "data": {
@@ -271,7 +583,7 @@ async def save_practice(request):
         })
     except Exception as e:
         logging.error(f"Error saving practice: {e}")
-        return web.json_response({
+        return json_response({
             "success": False,
             "error": str(e)
         }, status=500)
@@ -284,34 +596,214 @@ async def reset_practice(request):
     Сбрасывает трекер практики.
     """
     try:
-        telegram_id = int(request.match_info['telegram_id'])
+        telegram_id = _telegram_id(request, request.match_info['telegram_id'])
         
         await database.reset_practice_tracker(telegram_id)
         
-        return web.json_response({
+        return json_response({
             "success": True,
             "message": "Practice tracker reset"
         })
     except ValueError:
-        return web.json_response({
+        return json_response({
             "success": False,
             "error": "Invalid telegram_id"
         }, status=400)
     except Exception as e:
         logging.error(f"Error resetting practice: {e}")
-        return web.json_response({
+        return json_response({
             "success": False,
             "error": str(e)
         }, status=500)
 
 
+# ═══════════════════════════════════════════════════════════════
+# ЖИВЫЕ ОБНОВЛЕНИЯ (SSE)
+# ═══════════════════════════════════════════════════════════════
+
+async def live_events(request):
+    """
+    GET /api/events/{telegram_id}[?webinar=<slug>]
+    
+    Поток server-sent events (см. live.py) вместо опроса /api/mode и /api/user:
+    - mode: режим приложения (как data в /api/mode) — при смене режима,
+      даты или цен вебинара;
+    - user: { referrals, target_referrals, in_raffle, is_registered } — при
+      новом реферале или записи;
+    - stream: { stream_link } — при смене ссылки на эфир (только записавшимся).
+    
+    Текущие mode и user приходят сразу после подключения; без событий
+    раз в LIVE_HEARTBEAT секунд приходит комментарий-пинг.
+    """
+    try:
+        telegram_id = _telegram_id(request, request.match_info['telegram_id'])
+    except ValueError:
+        return json_response({
+            "success": False,
+            "error": "Invalid telegram_id"
+        }, status=400)
+    
+    slug = request.query.get('webinar') or None
+    if slug and not await database.get_webinar_by_slug(slug):
+        return json_response({
+            "success": False,
+            "error": "Webinar not found"
+        }, status=404)
+    
+    subscriber = live.hub.subscribe(("webinar", slug), ("user", telegram_id, slug))
+    if subscriber is None:
+        response = json_response({"success": False, "error": "Too many connections"}, status=503)
+        response.headers['Retry-After'] = str(int(live.HEARTBEAT))
+        return response
+    
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # прокси не должен копить поток
+    })
+    _cors_headers(response)
+    try:
+        await response.prepare(request)
+        await response.write(b"retry: %d\n\n" % live.RETRY_MS)
+        while not subscriber.closed:
+            events = await subscriber.next(live.HEARTBEAT)
+            await response.write(b"".join(live.format_event(e, d) for e, d in events) or b": ping\n\n")
+    except ConnectionResetError:
+        pass  # клиент закрыл Mini App
+    finally:
+        live.hub.unsubscribe(subscriber)
+    return response
+
+
+# Последнее разосланное состояние: (тема, событие) -> значение для сравнения
+_live_state = {}
+
+
+async def _poll_live_updates():
+    """Один проход: находит изменения по всем темам с подписчиками и рассылает их."""
+    now = datetime.now().replace(microsecond=0)
+    webinars = {}
+    for topic in live.hub.topics("webinar"):
+        slug = topic[1]
+        webinar = webinars[slug] = await _find_webinar(slug)
+        if not webinar:
+            continue
+        
+        mode = _app_mode_data(now, webinar)
+        # seconds_until меняется каждую секунду — клиент досчитывает его сам
+        key = tuple(v for k, v in mode.items() if k != "seconds_until")
+        if _live_state.get((topic, "mode")) != key or live.hub.last(topic, "mode") is None:
+            _live_state[(topic, "mode")] = key
+            live.hub.publish(topic, "mode", json_codec.dumps(mode))
+        
+        link = webinar['stream_link']
+        if link and _live_state.get((topic, "stream")) != link:
+            _live_state[(topic, "stream")] = link
+            live.hub.publish(topic, "stream", json_codec.dumps({"stream_link": link}),
+                             predicate=lambda subscriber: subscriber.registered)
+    
+    by_webinar = {}
+    for topic in live.hub.topics("user"):
+        by_webinar.setdefault(topic[2], []).append(topic)
+    for slug, topics in by_webinar.items():
+        webinar = webinars.get(slug)
+        if not webinar:
+            continue
+        states = await database.get_live_user_states([t[1] for t in topics], webinar['id'])
+        stream = live.hub.last(("webinar", slug), "stream")
+        for topic in topics:
+            referrals, registered = states.get(topic[1], (0, False))
+            if (_live_state.get((topic, "user")) != (referrals, registered)
+                    or live.hub.last(topic, "user") is None):
+                _live_state[(topic, "user")] = (referrals, registered)
+                live.hub.publish(topic, "user", json_codec.dumps({
+                    "referrals": referrals,
+                    "target_referrals": 2,
+                    "in_raffle": referrals >= 2,
+                    "is_registered": registered,
+                }))
+            for subscriber in live.hub.subscribers(topic):
+                if registered and not subscriber.registered:
+                    subscriber.registered = True
+                    if stream:
+                        subscriber.push("stream", stream)
+    
+    # Состояние тем без подписчиков больше не нужно
+    active = set(live.hub.topics("webinar")) | set(live.hub.topics("user"))
+    for key in [k for k in _live_state if k[0] not in active]:
+        del _live_state[key]
+
+
+async def _live_updates(app):
+    """Фоновый опрос изменений для живых обновлений (один на процесс)."""
+    async def poll():
+        while True:
+            await live.hub.wait_changed(live.POLL_INTERVAL)
+            if not len(live.hub):
+                continue
+            try:
+                await _poll_live_updates()
+            except Exception as e:
+                logging.error(f"Error polling live updates: {e}")
+    
+    task = asyncio.create_task(poll())
+    yield
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+async def _close_live_connections(app):
+    live.hub.close_all()
+
+
+def _check_metrics_token(request):
+    if not METRICS_TOKEN or request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        raise web.HTTPUnauthorized()
+
+
+async def get_metrics(request):
+    """Метрики процесса в формате Prometheus."""
+    _check_metrics_token(request)
+    return web.Response(body=metrics.render().encode(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+async def get_traces(request):
+    """
+    Последние трассы из кольцевого буфера (JSON).
+    
+    ?slow=1 — только медленные (дольше TRACE_SLOW_MS), ?limit=N.
+    """
+    _check_metrics_token(request)
+    only_slow = request.query.get('slow') == '1'
+    try:
+        limit = int(request.query.get('limit', 50))
+    except ValueError:
+        return json_response({'error': 'Invalid limit'}, status=400)
+    return json_response({'traces': tracing.export(only_slow=only_slow, limit=limit)})
+
+
 # ═══════════════════════════════════════════════════════════════
 # НАСТРОЙКА ПРИЛОЖЕНИЯ
 # ═══════════════════════════════════════════════════════════════
 
+async def _start_loop_watchdog(app):
+    loop_watchdog.start()
+
+
 def create_app():
     """Создаёт и настраивает aiohttp приложение."""
-    app = web.Application(middlewares=[cors_middleware])
+    app = web.Application(middlewares=[
+        tracing_middleware, metrics_middleware, cors_middleware, compression_middleware,
+        ip_rate_limit_middleware, auth_middleware, user_rate_limit_middleware,
+    ])
+    app.on_startup.append(_start_loop_watchdog)
+    app.cleanup_ctx.append(_live_updates)
+    app.on_shutdown.append(_close_live_connections)
+    if AUTH_REQUIRED and not BOT_TOKEN:
+        logging.warning("BOT_TOKEN is not set: API requests with initData will be rejected")
     
     # Роуты API
     app.router.add_get('/', health_check)  # Railway health check on root
@@ -319,6 +811,7 @@ def create_app():
     app.router.add_get('/api/user/{telegram_id}', get_user_data)
     app.router.add_get('/api/mode', get_app_mode)
     app.router.add_get('/api/referral/{telegram_id}', get_referral_link)
+    app.router.add_post('/api/referral/batch', get_referral_links_batch)
     app.router.add_post('/api/register', register_user)
     
     # Трекер практики
@@ -326,6 +819,16 @@ def create_app():
     app.router.add_post('/api/practice', save_practice)
     app.router.add_delete('/api/practice/{telegram_id}', reset_practice)
     
+    # Живые обновления (SSE)
+    app.router.add_get('/api/events/{telegram_id}', live_events)
+    
+    # Метрики (Prometheus) и трассы — только при заданном METRICS_TOKEN
+    if METRICS_TOKEN:
+        app.router.add_get('/metrics', get_metrics)
+        app.router.add_get('/debug/traces', get_traces)
+    else:
+        logging.info("METRICS_TOKEN is not set: /metrics and /debug/traces are disabled")
+    
     # Статические файлы для Mini App (React build)
     # app.router.add_static('/app', 'mini-app/dist')
     
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Многопроцессный запуск API сервера для Mini App
+
+Мастер-процесс форкает N воркеров, каждый из которых поднимает своё
+aiohttp приложение (api.create_app) на одном и том же порту:
+- если ОС поддерживает SO_REUSEPORT — каждый воркер сам открывает сокет,
+  и ядро распределяет входящие соединения между ними;
+- иначе (pre-fork) — мастер открывает сокет до форка, воркеры его наследуют.
+
+Воркер после форка заново запускает интерпретатор (os.execv с --worker):
+мастер не импортирует api, а воркер загружает код и .env с нуля — поэтому
+перезапуск по SIGHUP подхватывает новый код и настройки. У каждого
+воркера свой event loop и свои соединения с базой (database.py открывает
+их внутри процесса, от мастера ничего не наследуется).
+
+Сигналы мастеру:
+- SIGHUP          — плавный перезапуск: миграции новой версии кода,
+                    затем воркеры заменяются по одному;
+- SIGTERM/SIGINT  — остановка: воркеры дообрабатывают запросы и выходят.
+
+Запуск:
+    API_WORKERS=4 PORT=8080 python api_server.py
+
+Чтобы бот не поднимал встроенный API на том же порту, в его процессе
+выставьте API_EMBEDDED=0.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from aiohttp import web
+
+import database
+
+HOST = os.getenv("API_HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", 8080))
+WORKERS = int(os.getenv("API_WORKERS", 0)) or os.cpu_count() or 1
+
+# Сколько секунд воркер дообрабатывает запросы при остановке
+SHUTDOWN_TIMEOUT = float(os.getenv("API_SHUTDOWN_TIMEOUT", 10))
+# Сколько ждать, пока новый воркер начнёт слушать порт (импорт приложения)
+STARTUP_TIMEOUT = float(os.getenv("API_STARTUP_TIMEOUT", 60))
+
+REUSE_PORT = hasattr(socket, "SO_REUSEPORT")
+
+
+# ═══════════════════════════════════════════════════════════════
+# ВОРКЕР
+# ═══════════════════════════════════════════════════════════════
+
+async def _serve(sock: socket.socket = None, ready_fd: int = None):
+    """Основной цикл воркера: поднимает сайт и ждёт сигнала остановки."""
+    import api  # только в воркере: мастер не держит код приложения
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    runner = web.AppRunner(api.create_app(), shutdown_timeout=SHUTDOWN_TIMEOUT)
+    await runner.setup()
+    if sock is not None:
+        site = web.SockSite(runner, sock)
+    else:
+        site = web.TCPSite(runner, HOST, PORT, reuse_port=True)
+    await site.start()
+    logging.info(f"API worker {os.getpid()} listening on http://{HOST}:{PORT}")
+    if ready_fd is not None:
+        # Мастер ждёт этого байта, прежде чем остановить старый воркер
+        try:
+            os.write(ready_fd, b"1")
+        except OSError:
+            pass
+        os.close(ready_fd)
+
+    await stop.wait()
+    logging.info(f"API worker {os.getpid()} shutting down...")
+    await runner.cleanup()
+    await database.close_db()
+
+
+def _exec_worker(sock: socket.socket, ready_fd: int):
+    """В дочернем процессе после fork: свежий интерпретатор с текущим кодом."""
+    args = [sys.executable, os.path.abspath(__file__), "--worker", "--ready-fd", str(ready_fd)]
+    if sock is not None:
+        args += ["--sock-fd", str(sock.fileno())]  # сокет pre-fork наследуется через exec
+    try:
+        os.execv(sys.executable, args)
+    except OSError as e:
+        logging.error(f"API worker {os.getpid()} failed to start: {e}")
+    os._exit(1)
+
+
+def _run_worker(sock_fd: int = None, ready_fd: int = None):
+    """Точка входа воркера (api_server.py --worker)."""
+    # Сигналы мастера воркеру не нужны — их переустановит _serve
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    sock = socket.socket(fileno=sock_fd) if sock_fd is not None else None
+    code = 0
+    try:
+        asyncio.run(_serve(sock, ready_fd))
+    except Exception as e:
+        logging.error(f"API worker {os.getpid()} crashed: {e}")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+# ═══════════════════════════════════════════════════════════════
+# МАСТЕР
+# ═══════════════════════════════════════════════════════════════
+
+class Master:
+    """Следит за воркерами: запускает, перезапускает, останавливает."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.pids = set()
+        self.sock = None
+        self.stopping = False
+        self.reloading = False
+
+    def spawn(self, wait_ready: bool = False) -> int:
+        """Запускает воркер; wait_ready — дождаться, пока он начнёт слушать порт."""
+        ready_r, ready_w = os.pipe()
+        os.set_inheritable(ready_w, True)
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            _exec_worker(self.sock, ready_w)
+        os.close(ready_w)
+        self.pids.add(pid)
+        try:
+            if wait_ready:
+                ready, _, _ = select.select([ready_r], [], [], STARTUP_TIMEOUT)
+                # Пустое чтение — воркер вышел, не успев подняться
+                if not ready or not os.read(ready_r, 1):
+                    logging.warning(f"API worker {pid} did not become ready")
+        finally:
+            os.close(ready_r)
+        return pid
+
+    def stop_worker(self, pid: int, wait: bool = True):
+        """Отправляет воркеру SIGTERM и (опционально) ждёт его выхода."""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            self.pids.discard(pid)
+            return
+        if wait:
+            deadline = time.monotonic() + SHUTDOWN_TIMEOUT + 5
+            while time.monotonic() < deadline:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+                if done:
+                    break
+                time.sleep(0.1)
+            else:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            self.pids.discard(pid)
+
+    def reload(self):
+        """Плавный перезапуск: новый воркер поднимается до остановки старого."""
+        logging.info("Reloading API workers...")
+        # Миграции новой версии — отдельным процессом (у мастера код старый)
+        if subprocess.run([sys.executable, os.path.abspath(__file__), "--init-schema"]).returncode != 0:
+            logging.error("Schema migration failed, keeping current workers")
+            return
+        for old_pid in list(self.pids):
+            self.spawn(wait_ready=True)
+            self.stop_worker(old_pid)
+        logging.info(f"Reload complete: {len(self.pids)} workers")
+
+    def reap(self):
+        """Убирает завершившихся воркеров и поднимает замену упавшим."""
+        while self.pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.pids.clear()
+                return
+            if pid == 0:
+                return
+            if pid in self.pids:
+                self.pids.discard(pid)
+                if not self.stopping:
+                    logging.warning(f"API worker {pid} exited ({status}), respawning")
+                    self.spawn()
+
+    def run(self):
+        if not REUSE_PORT:
+            # Pre-fork: сокет общий, воркеры наследуют его
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.bind((HOST, PORT))
+            self.sock.listen(1024)
+            self.sock.set_inheritable(True)
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+
+        for _ in range(self.workers):
+            self.spawn()
+        mode = "SO_REUSEPORT" if REUSE_PORT else "pre-fork"
+        logging.info(f"API master {os.getpid()} started {self.workers} workers ({mode}) on port {PORT}")
+
+        while not self.stopping:
+            if self.reloading:
+                self.reloading = False
+                self.reload()
+            self.reap()
+            time.sleep(0.5)
+
+        logging.info("Stopping API workers...")
+        for pid in list(self.pids):
+            self.stop_worker(pid, wait=False)
+        for pid in list(self.pids):
+            self.stop_worker(pid)
+        if self.sock:
+            self.sock.close()
+
+    def _on_stop(self, signum, frame):
+        self.stopping = True
+
+    def _on_reload(self, signum, frame):
+        self.reloading = True
+
+
+async def init_schema():
+    """
+    Миграции схемы до запуска воркеров.
+
+    Соединения (и пул PostgreSQL) закрываются здесь же: воркеры не должны
+    наследовать соединение мастера — они открывают свои после exec.
+    """
+    await database.init_db()
+    await database.close_db()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(process)d - %(levelname)s - %(message)s"
+    )
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    # Служебные режимы: их запускает сам мастер
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--sock-fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--ready-fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--init-schema", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _run_worker(args.sock_fd, args.ready_fd)
+    elif args.init_schema:
+        asyncio.run(init_schema())
+    else:
+        # Схему создаём один раз в мастере, до форка воркеров
+        asyncio.run(init_schema())
+        Master(WORKERS).run()
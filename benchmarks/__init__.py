@@ -0,0 +1,8 @@
+"""
+Бенчмарки бота и API.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_json
+    python -m benchmarks.bench_database --users 100000
+    python -m benchmarks.load_api --rate 50 --duration 30
+"""
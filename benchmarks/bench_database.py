@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк database.py на синтетической базе реального масштаба
+
+Создаёт отдельную базу (схема — через migrations), наполняет её
+пользователями, записями на вебинар, рекомендациями и логами практики,
+затем вызывает каждую публичную функцию database.py с --concurrency
+параллельными вызовами и пишет JSON-отчёт: задержки (p50/p95/p99/max),
+пропускная способность и ошибки по каждой функции.
+
+Функции, для которых здесь нет сценария (новые), попадают в отчёт
+как "skipped" — их стоит добавить в CASES.
+
+Запуск:
+    python -m benchmarks.bench_database --users 100000
+    python -m benchmarks.bench_database --users 1000000 --report bench_1m.json
+    python -m benchmarks.bench_database --users 100000 --baseline bench_old.json
+
+--baseline — сравнение p95 с прошлым отчётом (регрессии видны сразу).
+
+--database-url — тот же прогон на PostgreSQL (пустая база, например
+локальная): так же сравниваются бэкенды storage.py и проверяется,
+что каждая функция работает на обоих (ошибки — в поле errors).
+
+    python -m benchmarks.bench_database --users 100000 --database-url postgresql://localhost/bench
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import database
+import migrations
+import storage
+
+# Доли синтетических данных (от числа пользователей)
+INACTIVE_SHARE = 0.05
+INVITED_SHARE = 0.3        # пришли по реферальной ссылке (ref_by)
+REGISTERED_SHARE = 0.6     # записаны на основной вебинар
+ATTENDED_SHARE = 0.4       # из записанных — были на эфире
+PURCHASED_SHARE = 0.05     # из записанных — купили
+RECOMMENDER_SHARE = 0.1    # оставили 1-4 рекомендации друзей
+PRACTICE_SHARE = 0.05      # ведут трекер практики (1-21 день)
+
+USER_ID_BASE = 100_000_000
+INSERT_BATCH = 50_000
+
+
+# ═══════════════════════════════════════════════════════════════
+# ДАННЫЕ
+# ═══════════════════════════════════════════════════════════════
+
+def _batched(rows, size: int = INSERT_BATCH):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _datasets(users: int, webinar_id: int, seed: int, counts: Dict[str, int]):
+    """(таблица, колонки, генератор строк) — генераторы читаются по порядку (общий rng)."""
+    rng = random.Random(seed)
+    now = datetime.now()
+
+    def user_rows():
+        for i in range(users):
+            user_id = USER_ID_BASE + i
+            ref_by = USER_ID_BASE + rng.randrange(i) if i and rng.random() < INVITED_SHARE else None
+            yield (user_id, f"user{i}", f"User {i}", now - timedelta(minutes=users - i),
+                   int(rng.random() >= INACTIVE_SHARE), "ref" if ref_by else None, ref_by)
+
+    def registration_rows():
+        for i in range(users):
+            if rng.random() < REGISTERED_SHARE:
+                counts["registrations"] += 1
+                yield (webinar_id, USER_ID_BASE + i, now - timedelta(minutes=i % 10000),
+                       int(rng.random() < ATTENDED_SHARE), int(rng.random() < PURCHASED_SHARE))
+
+    def referral_rows():
+        for i in range(users):
+            if rng.random() < RECOMMENDER_SHARE:
+                for j in range(rng.randint(1, 4)):
+                    counts["referrals"] += 1
+                    yield (USER_ID_BASE + i, f"friend_{i}_{j}", now)
+
+    first_day = date.today() - timedelta(days=21)
+
+    def practice_rows():
+        for i in range(users):
+            if rng.random() < PRACTICE_SHARE:
+                for day in sorted(rng.sample(range(21), rng.randint(1, 21))):
+                    counts["practice_logs"] += 1
+                    yield (USER_ID_BASE + i, (first_day + timedelta(days=day)).isoformat(),
+                           rng.randint(60, 1200), now)
+
+    return [
+        ("users", ("user_id", "username", "full_name", "registered_at", "is_active", "source", "ref_by"),
+         user_rows()),
+        ("registrations", ("webinar_id", "user_id", "registered_at", "attended", "purchased"),
+         registration_rows()),
+        ("referrals", ("referrer_id", "friend_username", "created_at"), referral_rows()),
+        ("practice_logs", ("user_id", "practice_date", "duration_seconds", "created_at"), practice_rows()),
+    ]
+
+
+def populate(path: str, users: int, webinar_id: int, seed: int = 1) -> Dict[str, int]:
+    """Наполнение базы синхронным sqlite3 (так в разы быстрее, чем через API бота)."""
+    counts = {"users": users, "registrations": 0, "referrals": 0, "practice_logs": 0}
+
+    conn = sqlite3.connect(path)
+    try:
+        for table, columns, rows in _datasets(users, webinar_id, seed, counts):
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+            for batch in _batched(rows):
+                conn.executemany(sql, batch)
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return counts
+
+
+async def populate_postgres(dsn: str, users: int, webinar_id: int, seed: int = 1) -> Dict[str, int]:
+    """Наполнение PostgreSQL через COPY (значения — как их пишет storage)."""
+    import asyncpg
+
+    counts = {"users": users, "registrations": 0, "referrals": 0, "practice_logs": 0}
+    conn = await asyncpg.connect(dsn)
+    try:
+        if await conn.fetchval("SELECT EXISTS (SELECT 1 FROM users)"):
+            raise RuntimeError("the benchmark needs an empty database")
+        for table, columns, rows in _datasets(users, webinar_id, seed, counts):
+            for batch in _batched(rows):
+                await conn.copy_records_to_table(
+                    table, columns=columns, records=[[storage.adapt(v) for v in row] for row in batch])
+        await conn.execute("ANALYZE")
+    finally:
+        await conn.close()
+    return counts
+
+
+# ═══════════════════════════════════════════════════════════════
+# СЦЕНАРИИ
+# ═══════════════════════════════════════════════════════════════
+
+@dataclass
+class Case:
+    """Как вызывать функцию: args(ctx) -> (args, kwargs); heavy — полный проход по таблице."""
+    args: Callable[["Context"], tuple] = lambda ctx: ((), {})
+    heavy: bool = False
+
+
+class Context:
+    """Состояние прогона: случайные id из сгенерированной базы."""
+
+    def __init__(self, users: int, webinar_id: int, seed: int = 2):
+        self.users = users
+        self.webinar_id = webinar_id
+        self.rng = random.Random(seed)
+        self._new_ids = iter(range(USER_ID_BASE + users, USER_ID_BASE + 10 * users + 10))
+
+    def user_id(self) -> int:
+        return USER_ID_BASE + self.rng.randrange(self.users)
+
+    def new_user_id(self) -> int:
+        return next(self._new_ids)
+
+    def day(self) -> str:
+        return (date.today() - timedelta(days=self.rng.randrange(21))).isoformat()
+
+
+async def _consume(iterator) -> int:
+    count = 0
+    async for _ in iterator:
+        count += 1
+    return count
+
+
+async def _iter_active_users():
+    return await _consume(database.iter_active_users())
+
+
+async def _iter_registered_users(webinar_id):
+    return await _consume(database.iter_registered_users(webinar_id))
+
+
+async def _iter_segment(name, webinar_id):
+    return await _consume(database.iter_segment(database.SEGMENTS[name](webinar_id)))
+
+
+async def _snapshot_roundtrip(name, webinar_id):
+    """materialize_segment + iter_snapshot + drop_snapshot, как в рассылке по сегменту."""
+    snapshot_id = await database.materialize_segment(database.SEGMENTS[name](webinar_id))
+    try:
+        return await _consume(database.iter_snapshot(snapshot_id))
+    finally:
+        await database.drop_snapshot(snapshot_id)
+
+
+def _schedule_rows(ctx: Context, n: int = 20):
+    due = datetime.now() - timedelta(minutes=1)
+    return [(ctx.user_id(), "bench", f"step_{ctx.rng.randrange(10**6)}", due) for _ in range(n)]
+
+
+CASES: Dict[str, Case] = {
+    "init_db": Case(heavy=True),
+    "close_db": Case(heavy=True),
+    "save_webinar": Case(lambda ctx: (("bench_webinar", datetime.now() + timedelta(days=3)), {})),
+    "deactivate_webinar": Case(lambda ctx: (("bench_webinar",), {})),
+    "get_webinar": Case(lambda ctx: ((ctx.webinar_id,), {})),
+    "get_webinar_by_slug": Case(lambda ctx: ((database.MAIN_WEBINAR,), {})),
+    "get_webinars": Case(),
+    "get_current_webinar": Case(),
+    "add_user": Case(lambda ctx: ((ctx.new_user_id(), "new_user", "New User"), {"ref_by": ctx.user_id()})),
+    "count_user_referrals": Case(lambda ctx: ((ctx.user_id(),), {})),
+    "is_registered": Case(lambda ctx: ((ctx.user_id(), ctx.webinar_id), {})),
+    "get_user_referral_info": Case(lambda ctx: ((ctx.user_id(),), {"webinar_id": ctx.webinar_id})),
+    "get_live_user_states": Case(lambda ctx: (([ctx.user_id() for _ in range(1000)], ctx.webinar_id), {})),
+    "get_user": Case(lambda ctx: ((ctx.user_id(),), {})),
+    "set_webinar_registration": Case(lambda ctx: ((ctx.user_id(),), {"webinar_id": ctx.webinar_id})),
+    "reset_registration": Case(lambda ctx: ((ctx.user_id(),), {"webinar_id": ctx.webinar_id})),
+    "set_attended_webinar": Case(lambda ctx: ((ctx.user_id(),), {"webinar_id": ctx.webinar_id})),
+    "set_purchased": Case(lambda ctx: ((ctx.user_id(), "bench_payment"), {"webinar_id": ctx.webinar_id})),
+    "get_active_users": Case(heavy=True),
+    "get_registered_users": Case(lambda ctx: ((ctx.webinar_id,), {}), heavy=True),
+    "iter_active_users": Case(heavy=True),
+    "iter_registered_users": Case(lambda ctx: ((ctx.webinar_id,), {}), heavy=True),
+    "update_status": Case(lambda ctx: ((ctx.user_id(), True), {})),
+    "count_segment": Case(lambda ctx: ((database.SEGMENTS["attended_not_bought"](ctx.webinar_id),), {}),
+                          heavy=True),
+    "iter_segment": Case(lambda ctx: (("registered_no_referrals", ctx.webinar_id), {}), heavy=True),
+    "materialize_segment": Case(lambda ctx: (("attended_not_bought", ctx.webinar_id), {}), heavy=True),
+    "iter_snapshot": Case(heavy=True),   # вместе с materialize_segment
+    "drop_snapshot": Case(heavy=True),   # вместе с materialize_segment
+    "enqueue_schedule": Case(lambda ctx: ((_schedule_rows(ctx),), {})),
+    "claim_due_schedule": Case(lambda ctx: ((datetime.now(), 20), {})),
+    "clear_funnel_schedule": Case(lambda ctx: (("bench",), {})),
+    "add_referrals": Case(lambda ctx: ((ctx.user_id(), ["@friend_a", "@friend_b"]), {})),
+    "get_user_referrals": Case(lambda ctx: ((ctx.user_id(),), {})),
+    "get_raffle_participants": Case(heavy=True),
+    "get_media": Case(lambda ctx: (("media/bench.mp4",), {})),
+    "save_media": Case(lambda ctx: (("media/bench.mp4", "video", "hash", "file_id"), {})),
+    "delete_media": Case(lambda ctx: (("media/bench_missing.mp4",), {})),
+    "get_all_media": Case(),
+    "get_setting": Case(lambda ctx: (("buyers_count",), {})),
+    "set_setting": Case(lambda ctx: (("bench_key", "value"), {})),
+    "get_stream_link": Case(lambda ctx: ((), {"webinar_id": ctx.webinar_id})),
+    "set_stream_link": Case(lambda ctx: (("https://example.com/live",), {"webinar_id": ctx.webinar_id})),
+    "get_buyers_count": Case(),
+    "increment_buyers_count": Case(),
+    "get_stats": Case(lambda ctx: ((), {"webinar_id": ctx.webinar_id}), heavy=True),
+    "save_practice_log": Case(lambda ctx: ((ctx.user_id(), ctx.day(), 600), {})),
+    "get_practice_logs": Case(lambda ctx: ((ctx.user_id(),), {})),
+    "get_practice_version": Case(lambda ctx: ((ctx.user_id(),), {})),
+    "get_completed_days": Case(lambda ctx: ((ctx.user_id(),), {})),
+    "reset_practice_tracker": Case(lambda ctx: ((ctx.new_user_id(),), {})),
+}
+
+# Функции-потоки и снимки вызываются через обёртки
+RUNNERS = {
+    "iter_active_users": lambda *a, **kw: _iter_active_users(),
+    "iter_registered_users": lambda *a, **kw: _iter_registered_users(*a),
+    "iter_segment": lambda *a, **kw: _iter_segment(*a),
+    "materialize_segment": lambda *a, **kw: _snapshot_roundtrip(*a),
+}
+# Покрываются сценарием materialize_segment
+COVERED_BY = {"iter_snapshot": "materialize_segment", "drop_snapshot": "materialize_segment"}
+
+
+def public_functions() -> List[str]:
+    """Все публичные корутины и асинхронные генераторы database.py."""
+    names = []
+    for name, obj in vars(database).items():
+        if name.startswith("_") or not callable(obj):
+            continue
+        target = inspect.unwrap(obj)
+        if getattr(target, "__module__", None) != database.__name__:
+            continue
+        if inspect.iscoroutinefunction(target) or inspect.isasyncgenfunction(target):
+            names.append(name)
+    return [n for n in names if n != "connect"]
+
+
+# ═══════════════════════════════════════════════════════════════
+# ПРОГОН
+# ═══════════════════════════════════════════════════════════════
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def bench_function(name: str, case: Case, ctx: Context, calls: int, concurrency: int) -> dict:
+    func = RUNNERS.get(name) or getattr(database, name)
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        args, kwargs = case.args(ctx)
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await func(*args, **kwargs)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        "calls": calls,
+        "concurrency": concurrency,
+        "throughput_per_s": round(calls / wall, 1) if wall else None,
+        "mean_ms": ms(sum(latencies) / len(latencies)),
+        "p50_ms": ms(_percentile(latencies, 0.5)),
+        "p95_ms": ms(_percentile(latencies, 0.95)),
+        "p99_ms": ms(_percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1]),
+        "errors": errors,
+    }
+
+
+async def run(users: int, calls: int, heavy_calls: int, concurrency: int,
+              db_path: str, only: Optional[List[str]] = None, seed: int = 1,
+              database_url: str = "") -> dict:
+    database.DB_NAME = db_path
+    database.DATABASE_URL = database_url
+    await database.init_db()
+    webinar = await database.get_webinar_by_slug(database.MAIN_WEBINAR)
+    webinar_id = webinar["id"] if webinar else await database.save_webinar(
+        database.MAIN_WEBINAR, datetime.now() + timedelta(days=1))
+
+    fill_start = time.perf_counter()
+    if database_url:
+        counts = await populate_postgres(database_url, users, webinar_id, seed)
+    else:
+        counts = populate(db_path, users, webinar_id, seed)
+    fill_seconds = time.perf_counter() - fill_start
+    print(f"Populated {counts} in {fill_seconds:.1f}s", file=sys.stderr)
+
+    ctx = Context(users, webinar_id)
+    results = {}
+    for name in public_functions():
+        if only and name not in only:
+            continue
+        case = CASES.get(name)
+        if case is None:
+            results[name] = {"skipped": "no benchmark case"}
+        elif name in COVERED_BY:
+            results[name] = {"covered_by": COVERED_BY[name]}
+        else:
+            n = heavy_calls if case.heavy else calls
+            results[name] = await bench_function(name, case, ctx, n, concurrency)
+        print(f"  {name}: {results[name]}", file=sys.stderr)
+    await database.close_db()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "backend": database.backend().name,
+            "sqlite": sqlite3.sqlite_version,
+            "schema_version": migrations.MIGRATIONS[-1].version,
+            "rows": counts,
+            "populate_seconds": round(fill_seconds, 1),
+            "calls": calls,
+            "heavy_calls": heavy_calls,
+            "concurrency": concurrency,
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, metric: str = "p95_ms") -> List[tuple]:
+    """(функция, было, стало, отношение) по общим функциям."""
+    rows = []
+    for name, result in report["results"].items():
+        old = baseline.get("results", {}).get(name, {})
+        if metric in result and metric in old and old[metric]:
+            rows.append((name, old[metric], result[metric], result[metric] / old[metric]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000, help="пользователей в синтетической базе")
+    parser.add_argument("--calls", type=int, default=500, help="вызовов каждой точечной функции")
+    parser.add_argument("--heavy-calls", type=int, default=5, help="вызовов функций с полным проходом")
+    parser.add_argument("--concurrency", type=int, default=20, help="параллельных вызовов")
+    parser.add_argument("--only", nargs="*", help="только эти функции")
+    parser.add_argument("--db", help="файл базы (по умолчанию временный, удаляется после прогона)")
+    parser.add_argument("--database-url", default="",
+                        help="пустая база PostgreSQL вместо файла SQLite (postgresql://...)")
+    parser.add_argument("--report", default="bench_database.json", help="куда писать JSON-отчёт")
+    parser.add_argument("--baseline", help="прошлый отчёт для сравнения p95")
+    args = parser.parse_args()
+
+    tmpdir = None
+    db_path = args.db
+    if not db_path:
+        tmpdir = tempfile.TemporaryDirectory(prefix="bench_db_")
+        db_path = os.path.join(tmpdir.name, "bench.db")
+    elif os.path.exists(db_path):
+        parser.error(f"{db_path} already exists: the benchmark needs an empty database")
+
+    try:
+        report = asyncio.run(run(args.users, args.calls, args.heavy_calls, args.concurrency,
+                                 db_path, args.only, database_url=args.database_url))
+    finally:
+        if tmpdir:
+            tmpdir.cleanup()
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{'function':<28} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9}")
+    for name, r in report["results"].items():
+        if "calls" in r:
+            errors = f"  errors: {r['errors']}" if r["errors"] else ""
+            print(f"{name:<28} {r['calls']:>6} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+                  f"{r['p99_ms']:>9} {r['throughput_per_s']:>9}{errors}")
+        else:
+            print(f"{name:<28} {next(iter(r.values()))}")
+    print(f"Report: {args.report}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\n{'function':<28} {'p95 was':>9} {'p95 now':>9} {'ratio':>7}")
+        for name, old, new, ratio in compare(report, baseline):
+            flag = "  <-- slower" if ratio > 1.2 else ""
+            print(f"{name:<28} {old:>9} {new:>9} {ratio:>7.2f}{flag}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Микро-бенчмарк JSON бэкендов на реальных формах ответов API
+
+Сравнивает все доступные бэкенды json_codec (json, orjson) на payload'ах
+/api/mode, /api/user/{id}, /api/referral/{id} и /api/practice/{id}
+(21 запись лога с datetime).
+
+Запуск:
+    python -m benchmarks.bench_json [--number 20000]
+"""
+
+import argparse
+import timeit
+from datetime import date, datetime, timedelta
+
+import json_codec
+
+
+def make_payloads() -> dict:
+    """Payload'ы в той же форме, что отдают обработчики api.py."""
+    now = datetime(2026, 1, 5, 19, 0, 0)
+    first_day = date(2026, 1, 6)
+
+    logs = [
+        {
+            "practice_date": first_day + timedelta(days=i),
+            "duration_seconds": 300 + i * 15,
+            "created_at": now + timedelta(days=i, minutes=i),
+        }
+        for i in range(21)
+    ]
+
+    return {
+        "mode": {
+            "success": True,
+            "data": {
+                "mode": "before_webinar",
+                "webinar_date": now.isoformat(),
+                "seconds_until": 86400,
+                "deadline": now.isoformat(),
+                "course_price": 2900,
+                "course_price_discount": 1500,
+            },
+        },
+        "user": {
+            "success": True,
+            "data": {
+                "user_id": 123456789,
+                "username": "sadhu_fan",
+                "full_name": "Иван Петров",
+                "is_registered": True,
+                "referrals": 3,
+                "target_referrals": 2,
+                "in_raffle": True,
+            },
+        },
+        "referral": {
+            "success": True,
+            "data": {
+                "referral_link": "https://t.me/SadhuStas_bot?start=ref_123456789",
+                "share_text": "Привет! Я иду на эфир про то, как быстро снять стресс и зарядиться энергией. Это бесплатно, погнали со мной! 👇",
+                "share_url": "https://t.me/share/url?url=https%3A%2F%2Ft.me%2FSadhuStas_bot%3Fstart%3Dref_123456789",
+            },
+        },
+        "practice": {
+            "success": True,
+            "data": {
+                "completed_days": list(range(1, 22)),
+                "total_days": 21,
+                "target_days": 21,
+                "logs": logs,
+            },
+        },
+    }
+
+
+def run(number: int) -> list:
+    """Возвращает строки результата: (payload, backend, мкс на вызов, размер)."""
+    results = []
+    payloads = make_payloads()
+    for name, payload in payloads.items():
+        for backend, (dumps, _) in json_codec.BACKENDS.items():
+            seconds = timeit.timeit(lambda: dumps(payload), number=number)
+            results.append((name, backend, seconds / number * 1e6, len(dumps(payload))))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="вызовов на каждый замер")
+    args = parser.parse_args()
+
+    print(f"{'payload':<10} {'backend':<8} {'us/call':>9} {'bytes':>7}")
+    for name, backend, usec, size in run(args.number):
+        print(f"{name:<10} {backend:<8} {usec:>9.2f} {size:>7}")
+
+
+if __name__ == "__main__":
+    main()
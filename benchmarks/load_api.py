@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный сценарий API Mini App
+
+Поднимает api.create_app() в этом же процессе (на временной базе,
+наполненной как в bench_database) и воспроизводит поток открытий
+Mini App: каждое открытие — параллельные запросы, как в
+mini-app/src/hooks/useApi.ts,
+
+    GET /api/mode, /api/user/{id}, /api/referral/{id}, /api/practice/{id}
+
+плюс с заданной вероятностью отметка практики (POST /api/practice)
+и запись на вебинар (POST /api/register).
+
+Нагрузка — открытая модель: открытия стартуют с частотой --rate в
+секунду независимо от того, успели ли ответить предыдущие (так очередь
+на сервере видна в хвостах задержек, а не прячется за клиентом).
+
+Отчёт по каждому маршруту: запросы, пропускная способность, p50/p95/p99/max
+и доля ошибок (статус >= 400 или ошибка соединения); --report — JSON
+для сравнения до/после (кэши, пул соединений).
+
+Запуск:
+    python -m benchmarks.load_api --rate 50 --duration 30
+    python -m benchmarks.load_api --rate 200 --duration 60 --users 100000 --report load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import api
+import database
+import ratelimit
+import telegram_auth
+from benchmarks.bench_database import USER_ID_BASE, populate
+
+# Вероятности действий за одно открытие (кроме четырёх GET при открытии)
+SAVE_PRACTICE_SHARE = 0.2
+REGISTER_SHARE = 0.05
+
+# Токен, которым подписывается initData пользователей нагрузки
+BENCH_BOT_TOKEN = "123456:load-test"
+
+
+class Stats:
+    """Задержки и ошибки по маршрутам."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def request(self, client: TestClient, route: str, method: str, path: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            async with client.request(method, path, **kwargs) as response:
+                await response.read()
+                if response.status >= 400:
+                    self.errors[route][str(response.status)] += 1
+        except Exception as e:
+            self.errors[route][type(e).__name__] += 1
+        self.latencies[route].append(time.perf_counter() - start)
+
+    def report(self, duration: float) -> dict:
+        result = {}
+        for route, values in sorted(self.latencies.items()):
+            values.sort()
+            pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 3)
+            errors = sum(self.errors[route].values())
+            result[route] = {
+                "requests": len(values),
+                "throughput_per_s": round(len(values) / duration, 1),
+                "p50_ms": pick(0.5),
+                "p95_ms": pick(0.95),
+                "p99_ms": pick(0.99),
+                "max_ms": round(values[-1] * 1000, 3),
+                "error_rate": round(errors / len(values), 4),
+                "errors": dict(self.errors[route]),
+            }
+        return result
+
+
+async def app_open(client: TestClient, stats: Stats, rng: random.Random, users: int):
+    """Одно открытие Mini App пользователем."""
+    user_id = USER_ID_BASE + rng.randrange(users)
+    # Новая сессия Mini App — новая initData (первый запрос считает HMAC)
+    headers = {"X-Telegram-Init-Data": telegram_auth.sign(
+        {"user": {"id": user_id, "first_name": "Load"}, "query_id": str(rng.getrandbits(64))},
+        BENCH_BOT_TOKEN,
+    )}
+    await asyncio.gather(
+        stats.request(client, "GET /api/mode", "GET", "/api/mode"),
+        stats.request(client, "GET /api/user/{id}", "GET", f"/api/user/{user_id}", headers=headers),
+        stats.request(client, "GET /api/referral/{id}", "GET", f"/api/referral/{user_id}", headers=headers),
+        stats.request(client, "GET /api/practice/{id}", "GET", f"/api/practice/{user_id}", headers=headers),
+    )
+    if rng.random() < SAVE_PRACTICE_SHARE:
+        day = (date.today() - timedelta(days=rng.randrange(21))).isoformat()
+        await stats.request(client, "POST /api/practice", "POST", "/api/practice", headers=headers,
+                            json={"telegram_id": user_id, "date": day, "duration": 600})
+    if rng.random() < REGISTER_SHARE:
+        await stats.request(client, "POST /api/register", "POST", "/api/register", headers=headers,
+                            json={"telegram_id": user_id})
+
+
+async def run(rate: float, duration: float, users: int, db_path: str, seed: int = 1) -> dict:
+    database.DB_NAME = db_path
+    api.BOT_TOKEN = BENCH_BOT_TOKEN
+    await database.init_db()
+    webinar = await database.get_current_webinar()
+    if webinar is None:
+        webinar_id = await database.save_webinar(database.MAIN_WEBINAR, datetime.now() + timedelta(days=1))
+    else:
+        webinar_id = webinar["id"]
+    counts = populate(db_path, users, webinar_id, seed)
+    print(f"Populated {counts}", file=sys.stderr)
+
+    rng = random.Random(seed)
+    stats = Stats()
+    tasks = set()
+    late = 0
+
+    async with TestClient(TestServer(api.create_app())) as client:
+        start = time.perf_counter()
+        interval = 1 / rate
+        n = 0
+        while True:
+            scheduled = start + n * interval
+            if scheduled - start >= duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -interval:
+                late += 1  # генератор не успевает — результат занижает нагрузку
+            task = asyncio.create_task(app_open(client, stats, rng, users))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            n += 1
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "rate": rate,
+            "duration": duration,
+            "elapsed": round(elapsed, 2),
+            "app_opens": n,
+            "late_starts": late,
+            "rows": counts,
+        },
+        "routes": stats.report(elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=50, help="открытий Mini App в секунду")
+    parser.add_argument("--duration", type=float, default=30, help="секунд нагрузки")
+    parser.add_argument("--users", type=int, default=10_000, help="пользователей в синтетической базе")
+    parser.add_argument("--report", help="куда писать JSON-отчёт")
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="не выключать лимиты ratelimit.py (вся нагрузка идёт с одного IP)")
+    args = parser.parse_args()
+    ratelimit.ENABLED = args.rate_limit
+
+    with tempfile.TemporaryDirectory(prefix="load_api_") as tmpdir:
+        report = asyncio.run(run(args.rate, args.duration, args.users, os.path.join(tmpdir, "load.db")))
+
+    meta = report["meta"]
+    print(f"{meta['app_opens']} app opens in {meta['elapsed']}s "
+          f"(target {args.rate}/s, late starts: {meta['late_starts']})")
+    print(f"{'route':<26} {'reqs':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'err %':>6}")
+    for route, r in report["routes"].items():
+        print(f"{route:<26} {r['requests']:>7} {r['throughput_per_s']:>8} {r['p50_ms']:>9} "
+              f"{r['p95_ms']:>9} {r['p99_ms']:>9} {r['max_ms']:>9} {r['error_rate'] * 100:>6.2f}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Report: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
+import startup  # первым: меряет импорты ниже (STARTUP_PROFILE=1)
+
 import asyncio
 import logging
 import os
 import random
+import time
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, types, F
@@ -9,13 +12,22 @@ from aiogram.filters import CommandStart, Command
 from aiogram.types import (
     InlineKeyboardButton, 
     InlineKeyboardMarkup,
-    FSInputFile
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 import database
+import funnel
+import live
+import loop_watchdog
+import media
 import messages
+import metrics
+import outbox
+import referral_links
 import scheduler
+import tracing
+
+startup.imported()
 
 # Load environment variables
 load_dotenv()
@@ -26,6 +38,10 @@ if not TOKEN:
     print("Error: BOT_TOKEN is not set in .env")
 
 dp = Dispatcher()
+# Время обработчиков: handler_seconds{handler=...} на /metrics
+metrics.install_dispatcher(dp)
+# Трасса на каждый апдейт: обработчик, БД, запросы к Bot API
+tracing.install_dispatcher(dp)
 
 # ═══════════════════════════════════════════════════════════════
 # УТИЛИТЫ
@@ -36,15 +52,38 @@ def is_admin(user: types.User) -> bool:
     return user.username and user.username.lower() in [u.lower() for u in ADMIN_USERNAMES]
 
 
+# Повторные нажатия той же кнопки в этом окне игнорируются
+CALLBACK_DEBOUNCE_SECONDS = 2.0
+_recent_callbacks = {}  # (user_id, data) -> time.monotonic()
+
+
+def is_repeated_callback(user_id: int, data: str) -> bool:
+    """True, если пользователь уже нажимал эту кнопку только что."""
+    now = time.monotonic()
+    key = (user_id, data)
+    last = _recent_callbacks.get(key)
+    if last is not None and now - last < CALLBACK_DEBOUNCE_SECONDS:
+        return True
+    _recent_callbacks[key] = now
+    
+    # Чистим устаревшие записи, чтобы словарь не рос
+    if len(_recent_callbacks) > 10000:
+        for k, t in list(_recent_callbacks.items()):
+            if now - t >= CALLBACK_DEBOUNCE_SECONDS:
+                del _recent_callbacks[k]
+    return False
+
+
 async def send_video_note_or_placeholder(bot: Bot, chat_id: int, video_path: str, placeholder: str):
     """Отправка видео-кружка или placeholder текста."""
-    if video_path and os.path.exists(video_path):
-        await bot.send_video_note(chat_id, FSInputFile(video_path))
+    if media.is_available(video_path):
+        await media.send(bot, chat_id, "video_note", video_path)
     else:
         await bot.send_message(chat_id, placeholder)
 
 
-async def send_warmup_video(bot: Bot, chat_id: int, video_file_id: str, caption: str, button_text: str = None, button_url: str = None):
+async def send_warmup_video(bot: Bot, chat_id: int, video_file_id: str, caption: str, button_text: str = None, button_url: str = None,
+                            video_path: str = None):
     """Отправка прогревочного видео с подписью и кнопкой."""
     keyboard = None
     if button_text and button_url:
@@ -53,10 +92,11 @@ async def send_warmup_video(bot: Bot, chat_id: int, video_file_id: str, caption:
         ])
     
     try:
-        if video_file_id:
-            await bot.send_video(
-                chat_id,
-                video_file_id,
+        if media.is_available(video_path, video_file_id):
+            await media.send(
+                bot, chat_id, "video",
+                video_path,
+                fallback_file_id=video_file_id,
                 caption=caption,
                 reply_markup=keyboard,
                 parse_mode="Markdown"
@@ -115,9 +155,10 @@ async def cmd_start(message: types.Message, bot: Bot):
     
     # Отправляем видео с текстом и кнопкой
     try:
-        await bot.send_video(
-            message.chat.id,
-            messages.VIDEO_1_FILE_ID,
+        await media.send(
+            bot, message.chat.id, "video",
+            messages.VIDEO_1_PATH,
+            fallback_file_id=messages.VIDEO_1_FILE_ID,
             caption=messages.WELCOME_TEXT,
             reply_markup=keyboard,
             parse_mode="Markdown"
@@ -154,9 +195,14 @@ async def handle_registration(callback: types.CallbackQuery, bot: Bot):
     
     user_id = callback.from_user.id
     
-    # Проверяем, не зарегистрирован ли уже
-    user = await database.get_user(user_id)
-    if user and user.get('has_registered_webinar'):
+    # Двойное нажатие — первое уже обрабатывается
+    if is_repeated_callback(user_id, callback.data):
+        await callback.answer()
+        return
+    
+    # Запись на текущий вебинар (атомарно: запишет только первый из параллельных
+    # запросов) и персональная цепочка: подтверждение через 30 секунд и дальнейшие шаги
+    if not await scheduler.register_for_webinar(user_id):
         await callback.answer("Вы уже записаны на эфир! ✅", show_alert=True)
         try:
             await callback.message.edit_reply_markup(reply_markup=None)
@@ -164,8 +210,6 @@ async def handle_registration(callback: types.CallbackQuery, bot: Bot):
             pass
         return
     
-    # Регистрируем
-    await database.set_webinar_registration(user_id)
     await callback.answer("Отлично! Вы записаны! 🎉", show_alert=True)
     
     # Обновляем сообщение
@@ -185,9 +229,6 @@ async def handle_registration(callback: types.CallbackQuery, bot: Bot):
         )
     except Exception as e:
         logging.warning(f"Error updating message: {e}")
-    
-    # Запускаем отложенное подтверждение через 30 секунд
-    asyncio.create_task(send_confirmation_delayed(bot, user_id, delay_seconds=30))
 
 
 @dp.message(F.web_app_data)
@@ -204,43 +245,18 @@ async def handle_web_app_data(message: types.Message, bot: Bot):
         if action == 'register_webinar':
             user_id = message.from_user.id
             
-            # Регистрируем в БД
-            await database.set_webinar_registration(user_id)
+            # Регистрируем в БД (повторная отправка из Mini App — без дублей),
+            # видео 2 через 30 секунд и дальнейшие шаги
+            if not await scheduler.register_for_webinar(user_id):
+                await message.reply("Вы уже записаны на эфир! ✅")
+                return
             
             # Мгновенное подтверждение
             await message.reply("✅ **Место забронировано!**\n\nЖди напоминания перед эфиром 📅", parse_mode="Markdown")
             
-            # Отправляем видео 2 через 30 секунд
-            asyncio.create_task(send_confirmation_delayed(bot, user_id, delay_seconds=30))
-            
     except Exception as e:
         logging.error(f"Failed to process Web App data: {e}")
 
-async def send_confirmation_delayed(bot: Bot, user_id: int, delay_seconds: int = 300):
-    """Отправка подтверждения через delay_seconds секунд."""
-    await asyncio.sleep(delay_seconds)
-    
-    try:
-        # Кнопка для открытия Mini App на дашборде
-        from aiogram.types import WebAppInfo
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(
-                text="🎁 Участвовать в розыгрыше", 
-                web_app=WebAppInfo(url="https://mini-app-sharapovs-projects.vercel.app")
-            )]
-        ])
-        
-        # Отправляем видео #2 с текстом и кнопкой
-        await bot.send_video(
-            user_id,
-            messages.VIDEO_2_FILE_ID,
-            caption=messages.WARMUP_2_TEXT,
-            reply_markup=keyboard,
-            parse_mode="Markdown"
-        )
-    except Exception as e:
-        logging.warning(f"Failed to send confirmation to {user_id}: {e}")
-
 
 # ═══════════════════════════════════════════════════════════════
 # РОЗЫГРЫШ — РЕКОМЕНДАЦИИ ДРУЗЕЙ
@@ -345,10 +361,20 @@ async def cmd_stats(message: types.Message):
     if not is_admin(message.from_user):
         return
     
-    stats = await database.get_stats()
+    # /stats [вебинар] — по умолчанию текущий
+    parts = message.text.split(maxsplit=1)
+    if len(parts) > 1:
+        webinar = await database.get_webinar_by_slug(parts[1].strip())
+    else:
+        webinar = await database.get_current_webinar(scheduler.now_local())
+    if not webinar:
+        await message.answer("❌ Вебинар не найден")
+        return
+    
+    stats = await database.get_stats(webinar['id'])
     
     await message.answer(
-        messages.STATS_MESSAGE.format(**stats),
+        messages.STATS_MESSAGE.format(webinar=webinar['slug'], **stats),
         parse_mode="Markdown"
     )
 
@@ -359,14 +385,40 @@ async def cmd_set_stream_link(message: types.Message):
     if not is_admin(message.from_user):
         return
     
-    parts = message.text.split(maxsplit=1)
-    if len(parts) < 2:
-        await message.answer("❌ Использование: `/set_stream_link https://...`", parse_mode="Markdown")
+    # /set_stream_link [вебинар] https://... — по умолчанию текущий вебинар
+    parts = message.text.split()
+    if len(parts) == 2:
+        webinar = await database.get_current_webinar(scheduler.now_local())
+    elif len(parts) == 3:
+        webinar = await database.get_webinar_by_slug(parts[1])
+    else:
+        await message.answer("❌ Использование: `/set_stream_link [вебинар] https://...`", parse_mode="Markdown")
+        return
+    if not webinar:
+        await message.answer("❌ Вебинар не найден")
         return
     
-    link = parts[1].strip()
-    await database.set_stream_link(link)
-    await message.answer(f"✅ Ссылка на эфир установлена:\n{link}")
+    link = parts[-1].strip()
+    await database.set_stream_link(link, webinar['id'])
+    live.hub.poke()  # Mini App со встроенным API узнает о ссылке сразу
+    await message.answer(f"✅ Ссылка на эфир {webinar['slug']} установлена:\n{link}")
+
+
+@dp.message(Command("segments"))
+async def cmd_segments(message: types.Message):
+    """Размеры сегментов аудитории (только для админа)."""
+    if not is_admin(message.from_user):
+        return
+    
+    webinar = await database.get_current_webinar(scheduler.now_local())
+    webinar_id = webinar['id'] if webinar else None
+    
+    lines = [f"👥 **Сегменты** ({webinar['slug'] if webinar else '—'}):\n"]
+    for name, build in database.SEGMENTS.items():
+        count = await database.count_segment(build(webinar_id))
+        lines.append(f"• `{name}`: {count}")
+    
+    await message.answer("\n".join(lines), parse_mode="Markdown")
 
 
 @dp.message(Command("broadcast"))
@@ -381,19 +433,132 @@ async def cmd_broadcast(message: types.Message, bot: Bot):
         return
     
     text = parts[1]
-    users = await database.get_active_users()
-    count = 0
     
-    for user_id in users:
-        try:
-            await bot.send_message(user_id, text, parse_mode="Markdown")
-            count += 1
-            await asyncio.sleep(0.05)  # Антифлуд
-        except Exception as e:
-            logging.warning(f"Broadcast failed for {user_id}: {e}")
-            await database.update_status(user_id, False)
+    # Рассылка по сегменту: /broadcast #attended_not_bought Текст
+    users = database.iter_active_users()
+    if text.startswith("#"):
+        segment, _, rest = text[1:].partition(" ")
+        if segment not in database.SEGMENTS or not rest.strip():
+            await message.answer(
+                f"❌ Сегменты: {', '.join(database.SEGMENTS)}\n"
+                "Использование: `/broadcast #сегмент Текст`",
+                parse_mode="Markdown"
+            )
+            return
+        webinar = await database.get_current_webinar(scheduler.now_local())
+        users = scheduler.iter_segment_snapshot(segment, webinar['id'] if webinar else None)
+        text = rest.strip()
+    
+    with outbox.lane(outbox.BULK), metrics.track_broadcast("admin") as progress:
+        async for user_id in users:
+            try:
+                # Темп задаёт outbox (адаптивно к лимитам Telegram)
+                await bot.send_message(user_id, text, parse_mode="Markdown")
+                progress.on_sent()
+            except Exception as e:
+                progress.on_failed()
+                logging.warning(f"Broadcast failed for {user_id}: {e}")
+                if outbox.is_unreachable(e):
+                    await database.update_status(user_id, False)
+    
+    await message.answer(messages.BROADCAST_CONFIRM.format(count=progress.sent))
+
+
+@dp.message(Command("export"))
+async def cmd_export(message: types.Message, bot: Bot):
+    """Выгрузка таблицы файлом (только для админа)."""
+    if not is_admin(message.from_user):
+        return
+    
+    import tempfile
+    import bulk
+    from aiogram.types import FSInputFile
+    
+    parts = message.text.split()
+    table = parts[1] if len(parts) > 1 else "users"
+    fmt = parts[2] if len(parts) > 2 else "csv"
+    if table not in bulk.TABLES or fmt not in bulk.FORMATS:
+        await message.answer(
+            "❌ Использование: `/export users|referrals|practice_logs|webinars|registrations [csv|ndjson]`",
+            parse_mode="Markdown"
+        )
+        return
+    
+    path = os.path.join(tempfile.gettempdir(), f"{table}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}")
+    try:
+        with open(path, "w", encoding="utf-8", newline="") as out:
+            count = await bulk.export_table(table, out, fmt, with_links=True)
+        await bot.send_document(
+            message.chat.id,
+            FSInputFile(path),
+            caption=f"📦 {table}: {count} строк"
+        )
+    except Exception as e:
+        logging.error(f"Export error: {e}")
+        await message.answer(f"Ошибка выгрузки: {e}")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@dp.message(Command("pacer"))
+async def cmd_pacer(message: types.Message):
+    """Состояние очереди отправки (только для админа)."""
+    if not is_admin(message.from_user):
+        return
+    
+    snap = outbox.limiter.snapshot()
+    queue = ", ".join(f"{k}: {v}" for k, v in snap['queue'].items())
+    errors = ", ".join(f"{k}: {v}" for k, v in snap['errors'].items()) or "нет"
+    await message.answer(
+        f"📤 Скорость: {snap['rate']} сообщ/с\n"
+        f"⏸ Пауза (429): {snap['paused_for']} с\n"
+        f"📥 Очередь: {queue}\n"
+        f"✅ Отправлено: {snap['sent']}\n"
+        f"⚠️ Ошибки: {errors}"
+    )
+
+
+@dp.message(Command("loop"))
+async def cmd_loop(message: types.Message):
+    """Задержка event loop и зависания (только для админа)."""
+    if not is_admin(message.from_user):
+        return
+    
+    dog = loop_watchdog.current()
+    if not dog:
+        await message.answer("⏱ Сторож event loop выключен (LOOP_WATCHDOG=0).")
+        return
     
-    await message.answer(messages.BROADCAST_CONFIRM.format(count=count))
+    lag = ", ".join(f"{k}: {v * 1000:.1f} мс" for k, v in dog.percentiles().items()) or "нет данных"
+    last = dog.last_stall
+    last_text = (
+        f"{datetime.fromtimestamp(last['at']):%d.%m %H:%M:%S} — {last['stalled']} с в {last['task']}"
+        if last else "не было"
+    )
+    await message.answer(
+        f"⏱ Задержка loop: {lag}\n"
+        f"🧊 Зависаний > {dog.threshold} с: {dog.stalls}\n"
+        f"Последнее: {last_text}"
+    )
+
+
+@dp.message(Command("media"))
+async def cmd_media(message: types.Message):
+    """Реестр загруженных медиафайлов (только для админа)."""
+    if not is_admin(message.from_user):
+        return
+    
+    records = await database.get_all_media()
+    if not records:
+        await message.answer("📂 Реестр медиа пуст — файлы загрузятся при первой отправке.")
+        return
+    
+    lines = [
+        f"• `{r['path']}` ({r['kind']}, {r['content_hash'][:8]}) — {r['uploaded_at']}"
+        for r in records
+    ]
+    await message.answer("📂 **Медиа:**\n\n" + "\n".join(lines), parse_mode="Markdown")
 
 
 @dp.message(Command("debug"))
@@ -405,7 +570,8 @@ async def cmd_debug(message: types.Message):
     await message.answer(
         "🔧 **Режим отладки**\n\n"
         "Перешли мне видео — я верну его `file_id`.\n\n"
-        "Этот ID используй для прогрев-серии.",
+        "Для прогрев-серии это не обязательно: файлы из `media/` "
+        "загружаются при первой отправке сами (см. /media).",
         parse_mode="Markdown"
     )
 
@@ -490,7 +656,8 @@ async def cmd_test_warmup(message: types.Message, bot: Bot):
         warmup_data.get('file_id'),
         warmup_data['caption'],
         warmup_data.get('button_text'),
-        warmup_data.get('button_url')
+        warmup_data.get('button_url'),
+        video_path=warmup_data.get('video_path')
     )
     
     await message.answer(f"✅ Отправлено видео #{video_num}")
@@ -516,121 +683,69 @@ async def cmd_test_scenario(message: types.Message, bot: Bot):
 
 
 async def run_test_sequence(bot: Bot, user_id: int):
-    """Отправка полной тестовой серии как в реальности (11 сообщений)."""
+    """Отправка полной тестовой серии как в реальности (шаг 1 минута)."""
+    main_funnel = funnel.get(scheduler.MAIN_FUNNEL)
+    await scheduler.replay_funnel(bot, main_funnel, user_id, step_interval=60)
     
-    async def send_test_video(video_num: int):
-        """Отправить прогревочное видео с правильной кнопкой."""
-        warmup = messages.get_warmup_video(video_num)
-        if not warmup:
-            logging.error(f"Warmup #{video_num} not found")
-            return
-            
-        keyboard = None
-        if warmup.get('button_text'):
-            if warmup.get('callback_data'):
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text=warmup['button_text'], callback_data=warmup['callback_data'])]
-                ])
-            elif warmup.get('button_url'):
-                keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text=warmup['button_text'], url=warmup['button_url'])]
-                ])
-        
-        try:
-            if warmup.get('file_id'):
-                await bot.send_video(
-                    user_id, warmup['file_id'], caption=warmup['caption'],
-                    reply_markup=keyboard, parse_mode="Markdown"
-                )
-            else:
-                await bot.send_message(
-                    user_id, warmup['caption'], reply_markup=keyboard, parse_mode="Markdown"
-                )
-            logging.info(f"Test: Sent video #{video_num} to {user_id}")
-        except Exception as e:
-            logging.error(f"Test: Failed to send video #{video_num}: {e}")
-    
-    async def send_reminder(text: str, button_text: str, button_url: str):
-        """Отправить напоминание с кнопкой."""
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=button_text, url=button_url)]
-        ])
-        await bot.send_message(user_id, text, reply_markup=keyboard, parse_mode="Markdown")
-    
-    async def send_deadline(hours_left: int):
-        """Отправить дедлайн-напоминание с кнопкой оплаты."""
-        if hours_left == 3:
-            text = messages.POST_WEBINAR_DEADLINE_3H.format(buyers_count=50, deadline="07:00")
-            btn = "💳 Купить со скидкой"
-        elif hours_left == 1:
-            text = messages.POST_WEBINAR_DEADLINE_1H.format(buyers_count=50, deadline="07:00")
-            btn = "🔥 Купить сейчас"
-        else:
-            text = messages.POST_WEBINAR_CLOSED
-            btn = None
-        
-        keyboard = None
-        if btn:
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text=btn, url=messages.PAYMENT_LINK)]
-            ])
-        await bot.send_message(user_id, text, reply_markup=keyboard, parse_mode="Markdown")
-    
-    # ═══════════════════════════════════════════════════════════════
-    # ПОЛНАЯ ЦЕПОЧКА (11 сообщений, интервал 1 минута)
-    # ═══════════════════════════════════════════════════════════════
-    
-    # 1. Видео #1 — Анонс (за 5 дней)
-    await asyncio.sleep(60)
-    await send_test_video(1)
-    
-    # 2. Видео #2 — Вовлечение (за 3 дня)
-    await asyncio.sleep(60)
-    await send_test_video(2)
-    
-    # 3. Видео #3 — Завтра эфир (за 1 день)
-    await asyncio.sleep(60)
-    await send_test_video(3)
-    
-    # 4. Видео #4 — Через час (за 1 час)
-    await asyncio.sleep(60)
-    await send_test_video(4)
-    
-    # 5. REMINDER_5MIN — 5 минут до старта
-    await asyncio.sleep(60)
-    await send_reminder(messages.REMINDER_5MIN, "🔴 Перейти к эфиру", messages.CHANNEL_LINK)
-    logging.info(f"Test: Sent 5min reminder to {user_id}")
-    
-    # 6. REMINDER_START — Эфир начался
-    await asyncio.sleep(60)
-    await send_reminder(messages.REMINDER_START_NO_LINK, "🔴 Перейти к эфиру", messages.CHANNEL_LINK)
-    logging.info(f"Test: Sent start reminder to {user_id}")
-    
-    # 7. REMINDER_7MIN — Эфир в разгаре
-    await asyncio.sleep(60)
-    await send_reminder(messages.REMINDER_7MIN, "📺 Подключиться сейчас", messages.CHANNEL_LINK)
-    logging.info(f"Test: Sent 7min reminder to {user_id}")
-    
-    # 8. Видео #5 — Оффер (через 1.5 часа после старта)
-    await asyncio.sleep(60)
-    await send_test_video(5)
-    
-    # 9. Дедлайн 3 часа
-    await asyncio.sleep(60)
-    await send_deadline(3)
-    logging.info(f"Test: Sent 3h deadline to {user_id}")
-    
-    # 10. Дедлайн 1 час
-    await asyncio.sleep(60)
-    await send_deadline(1)
-    logging.info(f"Test: Sent 1h deadline to {user_id}")
-    
-    # 11. Закрытие скидки
-    await asyncio.sleep(60)
-    await send_deadline(0)
-    logging.info(f"Test: Sent offer closed to {user_id}")
-    
-    await bot.send_message(user_id, "✅ **Тестовая серия завершена!** (11 сообщений)", parse_mode="Markdown")
+    await bot.send_message(
+        user_id,
+        f"✅ **Тестовая серия завершена!** ({len(main_funnel.steps)} сообщений)",
+        parse_mode="Markdown"
+    )
+
+
+@dp.message(Command("funnels"))
+async def cmd_funnels(message: types.Message):
+    """Список воронок и ближайших шагов (только для админа)."""
+    if not is_admin(message.from_user):
+        return
+    
+    now = datetime.now(scheduler.scheduler.timezone).replace(tzinfo=None)
+    lines = ["📅 **Воронки:**\n"]
+    for f in funnel.all_funnels():
+        upcoming = f.next_step(now)
+        next_str = f"{upcoming[1].key} — {upcoming[0]:%d.%m %H:%M}" if upcoming else "завершена"
+        lines.append(f"• `{f.name}`: эфир {f.anchor:%d.%m.%Y %H:%M}, далее {next_str}")
+    
+    await message.answer("\n".join(lines), parse_mode="Markdown")
+
+
+@dp.message(Command("funnel_add"))
+async def cmd_funnel_add(message: types.Message, bot: Bot):
+    """Добавление воронки нового вебинара (только для админа)."""
+    if not is_admin(message.from_user):
+        return
+    
+    parts = message.text.split(maxsplit=2)
+    try:
+        name = parts[1]
+        anchor = datetime.strptime(parts[2].strip(), "%Y-%m-%d %H:%M")
+    except (IndexError, ValueError):
+        await message.answer(
+            "❌ Использование: `/funnel_add имя 2026-02-10 19:00`",
+            parse_mode="Markdown"
+        )
+        return
+    
+    count = await scheduler.add_webinar_funnel(bot, name, anchor)
+    await message.answer(f"✅ Воронка {name} добавлена, запланировано шагов: {count}")
+
+
+@dp.message(Command("funnel_remove"))
+async def cmd_funnel_remove(message: types.Message):
+    """Удаление воронки (только для админа)."""
+    if not is_admin(message.from_user):
+        return
+    
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2 or parts[1].strip() == scheduler.MAIN_FUNNEL:
+        await message.answer("❌ Использование: `/funnel_remove имя`", parse_mode="Markdown")
+        return
+    
+    if await scheduler.remove_webinar_funnel(parts[1].strip()):
+        await message.answer(f"✅ Воронка {parts[1].strip()} удалена")
+    else:
+        await message.answer("❌ Воронка не найдена")
 
 
 @dp.message(Command("help"))
@@ -644,13 +759,21 @@ async def cmd_help(message: types.Message):
 /recommend — Участвовать в розыгрыше доски
 
 👨‍💼 **Для админа:**
-/stats — Статистика бота
+/stats — Статистика бота ([вебинар])
 /raffle — Провести розыгрыш
-/set_stream_link — Установить ссылку на эфир
-/broadcast — Массовая рассылка
+/set_stream_link — Установить ссылку на эфир ([вебинар] ссылка)
+/broadcast — Массовая рассылка (#сегмент — по сегменту)
+/segments — Сегменты аудитории
+/pacer — Скорость и очередь отправки
+/loop — Задержка и зависания event loop
+/media — Загруженные медиафайлы
+/export — Выгрузка таблицы (`users|referrals|practice_logs|webinars|registrations [csv|ndjson]`; загрузка — `python bulk.py import`)
 /debug — Получить file_id видео
 /test_warmup N — Тест прогревочного видео
 /test_scenario — ЗАПУСК ТЕСТОВОГО РЕЖИМА (1 мин шаг)
+/funnels — Воронки вебинаров
+/funnel_add — Добавить вебинар (имя, дата)
+/funnel_remove — Снять вебинар с расписания
 """
     await message.answer(help_text, parse_mode="Markdown")
 
@@ -673,38 +796,80 @@ async def handle_unknown(message: types.Message):
 # MAIN
 # ═══════════════════════════════════════════════════════════════
 
+async def on_startup(bot: Bot):
+    """Перед первым опросом Telegram: бот готов отвечать."""
+    # bot.me() кэширует ответ — aiogram не будет запрашивать get_me повторно
+    try:
+        with startup.phase("get_me"):
+            me = await bot.me()
+        referral_links.set_bot_username(me.username)
+    except Exception as e:
+        logging.warning(f"Failed to get bot username: {e}")
+    startup.ready()
+
+
 async def main():
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
     
+    # Сторож event loop: задержки и стек при зависаниях (LOOP_WATCHDOG=0 — выкл.)
+    loop_watchdog.start()
+    
     # Initialize DB
-    await database.init_db()
+    with startup.phase("init_db"):
+        await database.init_db()
     
     # Initialize Bot
     if TOKEN:
         bot = Bot(token=TOKEN)
         
+        # Интервалы запросов к Bot API в трассах (снаружи outbox — с ожиданием токена)
+        tracing.install(bot)
+        
+        # Общий лимит отправки с приоритетами (ответы > подтверждения > рассылки)
+        outbox.install(bot)
+        
         # Setup Scheduler for reminders
-        scheduler.setup_scheduler(bot)
+        # (до опроса: запись на вебинар опирается на загруженные вебинары)
+        with startup.phase("scheduler"):
+            await scheduler.setup_scheduler(bot)
         
-        # Start API server for Mini App
-        import api
-        api_port = int(os.getenv('PORT', 8080))
-        api_runner = await api.start_api_server(host='0.0.0.0', port=api_port)
+        # Start API server for Mini App — в фоне, параллельно с подключением
+        # к Telegram: /start от него не зависит
+        # (API_EMBEDDED=0 — API запущен отдельно через api_server.py)
+        api_task = None
+        if os.getenv('API_EMBEDDED', '1') != '0':
+            api_task = asyncio.create_task(start_embedded_api())
         
+        dp.startup.register(on_startup)
         logging.info("Bot and API server starting...")
         
         try:
             await dp.start_polling(bot)
         finally:
             # Cleanup API server on exit
-            await api_runner.cleanup()
+            api_runner = await api_task if api_task else None
+            if api_runner:
+                await api_runner.cleanup()
+            await database.close_db()
     else:
         logging.warning("BOT_TOKEN not found. Bot will not start polling.")
 
 
+async def start_embedded_api():
+    """Запуск API для Mini App внутри процесса бота (импорт api — только здесь)."""
+    try:
+        with startup.phase("api"):
+            import api
+            api_port = int(os.getenv('PORT', 8080))
+            return await api.start_api_server(host='0.0.0.0', port=api_port)
+    except Exception:
+        logging.exception("Failed to start API server")
+        return None
+
+
 if __name__ == "__main__":
     asyncio.run(main())
 
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""
+Массовая выгрузка и загрузка таблиц (users, referrals, practice_logs,
+webinars, registrations)
+
+Форматы: CSV (с заголовком) и NDJSON (один JSON-объект на строку).
+
+Выгрузка читает одним курсором порциями по CHUNK_SIZE строк — память
+не растёт с размером таблицы. База работает в режиме WAL (см. init_db),
+поэтому долгое чтение не блокирует запись бота.
+
+Загрузка пишет порциями через executemany, коммит после каждой порции —
+блокировка на запись держится только на время одной порции.
+
+Работает с любым бэкендом (storage.py): перенос SQLite → PostgreSQL —
+export без DATABASE_URL, затем import с DATABASE_URL. На PostgreSQL
+выгрузка идёт серверным курсором (storage: backend.stream).
+
+Использование:
+    python bulk.py export users -o users.csv
+    python bulk.py export practice_logs --format ndjson > logs.ndjson
+    python bulk.py import users users.csv [--replace]
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import sys
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, TextIO, Tuple
+
+import database
+import json_codec
+import referral_links
+
+TABLES = ("users", "referrals", "practice_logs", "webinars", "registrations")
+# Ключ строки: порядок выгрузки и дубликат при загрузке
+# (для practice_logs — естественный ключ, по нему же upsert в database.py)
+KEYS = {
+    "users": ("user_id",),
+    "referrals": ("referrer_id", "friend_username"),
+    "practice_logs": ("user_id", "practice_date"),
+    "webinars": ("id",),
+    "registrations": ("webinar_id", "user_id"),
+}
+# Ключи без уникального индекса в схеме: дубликат отсекает NOT EXISTS, а не ON CONFLICT
+NON_UNIQUE_KEYS = {"referrals"}
+# Суррогатный id таблицы с естественным ключом при загрузке не переносится —
+# его назначает база (id из выгрузки заняты в непустой базе другими строками)
+SURROGATE_KEY = "id"
+# Загрузка меняет данные, по версии которых API отдаёт ETag: версия
+# затронутых пользователей растёт в той же транзакции (колонка, выражение)
+VERSIONED = {"practice_logs": ("user_id", database.BUMP_PRACTICE_VERSION)}
+# Типы колонок (см. get_columns) в CAST при загрузке
+_SQL_TYPES = {"int": "BIGINT", "text": "TEXT"}
+FORMATS = ("csv", "ndjson")
+
+CHUNK_SIZE = 1000
+
+
+# ═══════════════════════════════════════════════════════════════
+# УТИЛИТЫ
+# ═══════════════════════════════════════════════════════════════
+
+def _check_table(table: str):
+    if table not in TABLES:
+        raise ValueError(f"Unknown table '{table}', expected one of: {', '.join(TABLES)}")
+
+
+def detect_format(path: Optional[str], default: str = "csv") -> str:
+    """Формат по расширению файла (.csv / .ndjson / .jsonl)."""
+    if path:
+        ext = os.path.splitext(path)[1].lower()
+        if ext in (".ndjson", ".jsonl"):
+            return "ndjson"
+        if ext == ".csv":
+            return "csv"
+    return default
+
+
+async def get_columns(db, table: str) -> Dict[str, str]:
+    """Колонки таблицы: имя -> "int" | "text"."""
+    return await database.backend().columns(db, table)
+
+
+def _import_statements(table: str, columns: List[str], types: Dict[str, str],
+                       replace: bool) -> List[Tuple[str, Callable[[tuple], tuple]]]:
+    """Выражения загрузки строки: (sql, параметры из значений columns)."""
+    keys = KEYS[table]
+    missing = [k for k in keys if k not in columns]
+    if missing:
+        raise ValueError(f"Import {table}: key columns {missing} are missing")
+    names = ", ".join(columns)
+    others = [c for c in columns if c not in keys]
+    key_idx = [columns.index(k) for k in keys]
+    other_idx = [columns.index(c) for c in others]
+
+    if table not in NON_UNIQUE_KEYS:
+        updates = ", ".join(f"{c} = excluded.{c}" for c in others)
+        conflict = f"DO UPDATE SET {updates}" if replace and updates else "DO NOTHING"
+        placeholders = ", ".join("?" for _ in columns)
+        sql = f"INSERT INTO {table} ({names}) VALUES ({placeholders}) ON CONFLICT ({', '.join(keys)}) {conflict}"
+        return [(sql, lambda row: row)]
+
+    match = " AND ".join(f"{k} = ?" for k in keys)
+    statements = []
+    if replace and others:
+        sql = f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in others)} WHERE {match}"
+        statements.append((sql, lambda row: tuple(row[i] for i in other_idx + key_idx)))
+    # Типы явно: в INSERT ... SELECT PostgreSQL не выводит их из колонок
+    values = ", ".join(f"CAST(? AS {_SQL_TYPES[types[c]]})" for c in columns)
+    sql = f"INSERT INTO {table} ({names}) SELECT {values} WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {match})"
+    statements.append((sql, lambda row: row + tuple(row[i] for i in key_idx)))
+    return statements
+
+
+async def _count_rows(db, table: str) -> int:
+    async with db.execute(f"SELECT COUNT(*) FROM {table}") as cursor:
+        return (await cursor.fetchone())[0]
+
+
+def _coerce(value, kind: str):
+    # CSV отдаёт строки: SQLite приводит их сам, PostgreSQL — нет
+    if kind == "int" and isinstance(value, str):
+        return int(value)
+    return value
+
+
+# ═══════════════════════════════════════════════════════════════
+# ВЫГРУЗКА
+# ═══════════════════════════════════════════════════════════════
+
+async def iter_rows(table: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[tuple]:
+    """
+    Потоковое чтение таблицы.
+
+    Первым элементом отдаёт кортеж имён колонок, затем строки.
+    """
+    _check_table(table)
+    async with database.connect() as db:
+        sql = f"SELECT * FROM {table} ORDER BY {', '.join(KEYS[table])}"
+        async with database.backend().stream(db, sql) as cursor:
+            yield tuple(d[0] for d in cursor.description)
+            while True:
+                rows = await cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+
+
+async def export_table(table: str, out: TextIO, fmt: str = "csv", with_links: bool = False) -> int:
+    """
+    Выгрузка таблицы в поток out.
+
+    with_links — для users добавить колонку referral_link.
+    Возвращает количество выгруженных строк.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'")
+    with_links = with_links and table == "users"
+
+    rows = iter_rows(table)
+    columns = await rows.__anext__()
+    if with_links:
+        columns = columns + ("referral_link",)
+        user_idx = columns.index("user_id")
+
+    writer = csv.writer(out) if fmt == "csv" else None
+    if writer:
+        writer.writerow(columns)
+
+    count = 0
+    async for row in rows:
+        if with_links:
+            row = tuple(row) + (referral_links.build_link(row[user_idx]),)
+        if writer:
+            writer.writerow(row)
+        else:
+            out.write(json_codec.dumps(dict(zip(columns, row))).decode("utf-8"))
+            out.write("\n")
+        count += 1
+    return count
+
+
+# ═══════════════════════════════════════════════════════════════
+# ЗАГРУЗКА
+# ═══════════════════════════════════════════════════════════════
+
+def _read_records(src: TextIO, fmt: str) -> Iterable[dict]:
+    """Построчное чтение записей из CSV/NDJSON."""
+    if fmt == "csv":
+        for record in csv.DictReader(src):
+            # Пустая ячейка CSV — NULL
+            yield {k: (v if v != "" else None) for k, v in record.items()}
+    else:
+        for line in src:
+            line = line.strip()
+            if line:
+                yield json_codec.loads(line)
+
+
+async def import_table(table: str, src: TextIO, fmt: str = "csv", replace: bool = False,
+                       chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Загрузка записей в таблицу порциями.
+
+    Колонки, которых нет в таблице (например, referral_link из выгрузки),
+    пропускаются, как и суррогатный id таблиц с естественным ключом
+    (его назначает база). replace=True — перезаписывать строки с тем же
+    ключом (KEYS), иначе существующие строки остаются как есть.
+    Возвращает количество обработанных записей (сколько из них новых — в логе).
+    """
+    _check_table(table)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}'")
+
+    count = 0
+
+    async with database.connect() as db:
+        table_columns = await get_columns(db, table)
+        rows_before = await _count_rows(db, table)
+        columns = None
+        statements = None
+        chunk = []
+
+        async def write(chunk):
+            for sql, params in statements:
+                await db.executemany(sql, [params(row) for row in chunk])
+            if table in VERSIONED:
+                column, bump = VERSIONED[table]
+                idx = columns.index(column)
+                await db.executemany(bump, [(value,) for value in sorted({row[idx] for row in chunk})])
+            await db.commit()
+
+        for record in _read_records(src, fmt):
+            if columns is None:
+                surrogate = SURROGATE_KEY if SURROGATE_KEY not in KEYS[table] else None
+                columns = [c for c in record if c in table_columns and c != surrogate]
+                skipped = [c for c in record if c not in table_columns]
+                if skipped:
+                    logging.warning(f"Import {table}: skipping unknown columns {skipped}")
+                if not columns:
+                    raise ValueError(f"No known columns for table '{table}'")
+                statements = _import_statements(table, columns, table_columns, replace)
+
+            chunk.append(tuple(_coerce(record.get(c), table_columns[c]) for c in columns))
+            if len(chunk) >= chunk_size:
+                await write(chunk)
+                count += len(chunk)
+                chunk = []
+
+        if chunk:
+            await write(chunk)
+            count += len(chunk)
+
+        await database.backend().after_import(db, table)
+        added = await _count_rows(db, table) - rows_before
+
+    logging.info(f"Imported {count} rows into {table} ({added} new)")
+    return count
+
+
+# ═══════════════════════════════════════════════════════════════
+# CLI
+# ═══════════════════════════════════════════════════════════════
+
+async def _main(args):
+    await database.init_db()
+
+    if args.command == "export":
+        fmt = args.format or detect_format(args.output)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8", newline="") as out:
+                count = await export_table(args.table, out, fmt, args.with_links)
+        else:
+            count = await export_table(args.table, sys.stdout, fmt, args.with_links)
+        logging.info(f"Exported {count} rows from {args.table}")
+    else:
+        fmt = args.format or detect_format(args.input)
+        if args.input == "-":
+            await import_table(args.table, sys.stdin, fmt, args.replace)
+        else:
+            with open(args.input, encoding="utf-8", newline="") as src:
+                await import_table(args.table, src, fmt, args.replace)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="выгрузить таблицу")
+    exp.add_argument("table", choices=TABLES)
+    exp.add_argument("-o", "--output", help="файл (по умолчанию stdout)")
+    exp.add_argument("--format", choices=FORMATS)
+    exp.add_argument("--with-links", action="store_true", help="для users: добавить referral_link")
+
+    imp = sub.add_parser("import", help="загрузить таблицу")
+    imp.add_argument("table", choices=TABLES)
+    imp.add_argument("input", help="файл или - для stdin")
+    imp.add_argument("--format", choices=FORMATS)
+    imp.add_argument("--replace", action="store_true", help="перезаписывать существующие строки")
+
+    # Логи — в stderr, чтобы не смешивать с выгрузкой в stdout
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Сжатие ответов API
+
+Кодировка выбирается по Accept-Encoding клиента (с учётом q-значений):
+br — если установлен brotli, иначе gzip. Ответы меньше MIN_SIZE байт
+не сжимаются — заголовки и CPU дороже выигрыша.
+
+    coding = compression.negotiate(request.headers.get("Accept-Encoding", ""))
+    body = compression.compress(body, coding)   # coding: "br" | "gzip"
+
+Middleware — в api.py.
+"""
+
+import gzip
+import os
+from typing import Optional
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+ENABLED = os.getenv("API_COMPRESSION", "1") != "0"
+# Минимальный размер тела для сжатия (байты)
+MIN_SIZE = int(os.getenv("API_COMPRESS_MIN_SIZE", 1024))
+# Уровни: ответы небольшие и сжимаются в цикле событий — без максимальных уровней
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Предпочтение при равных q: лучшее сжатие первым
+CODINGS = ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+
+COMPRESSIBLE_TYPES = {"application/json", "text/plain", "text/html", "text/css", "application/javascript"}
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Кодировка из CODINGS, которую принимает клиент; None — не сжимать."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+
+    best, best_q = None, 0.0
+    for coding in CODINGS:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body: bytes, coding: str) -> bytes:
+    if coding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Декларативные воронки рассылок
+
+Воронка — это якорь (время старта эфира) и список шагов:
+смещение от якоря, ключ контента (см. scheduler.CONTENT) и сегмент
+аудитории (см. scheduler.AUDIENCES). compile_jobs() превращает воронку
+в задачи APScheduler.
+
+У каждого вебинара (database.webinars) своя воронка с именем = slug.
+Одновременно может быть зарегистрировано несколько воронок (вебинаров);
+ближайший шаг по всем воронкам ищется бинарным поиском по общей шкале.
+"""
+
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class FunnelStep:
+    """Шаг воронки."""
+    key: str                 # id шага внутри воронки
+    offset: timedelta        # смещение от якоря (может быть отрицательным)
+    content: str             # ключ контента в scheduler.CONTENT
+    audience: str = "registered"  # сегмент в scheduler.AUDIENCES
+    # Окно, на которое размазывается персональная отправка (drip)
+    spread: timedelta = timedelta(0)
+    # Сколько после времени шага его ещё стоит догнать опоздавшим
+    catch_up: Optional[timedelta] = None
+
+
+# ═══════════════════════════════════════════════════════════════
+# СЦЕНАРИЙ ВЕБИНАРА
+# ═══════════════════════════════════════════════════════════════
+
+# Скидка действует 12 часов с момента отправки Видео 5 (старт + 1.5 часа)
+OFFER_START = timedelta(minutes=90)
+OFFER_END = OFFER_START + timedelta(hours=12)
+
+# Пропущенные видео прогрева догоняют записавшихся позже, пока не ушло «Через час»
+WARMUP_CATCH_UP_UNTIL = -timedelta(hours=1)
+
+WEBINAR_STEPS = (
+    # Прогрев-серия
+    FunnelStep("warmup_1", -timedelta(days=5), "warmup_1", spread=timedelta(minutes=30),  # Анонс
+               catch_up=WARMUP_CATCH_UP_UNTIL + timedelta(days=5)),
+    FunnelStep("warmup_2", -timedelta(days=3), "warmup_2", spread=timedelta(minutes=30),  # Вовлечение
+               catch_up=WARMUP_CATCH_UP_UNTIL + timedelta(days=3)),
+    FunnelStep("warmup_3", -timedelta(days=1), "warmup_3", spread=timedelta(minutes=30),  # Завтра эфир
+               catch_up=WARMUP_CATCH_UP_UNTIL + timedelta(days=1)),
+    FunnelStep("warmup_4", -timedelta(hours=1), "warmup_4", spread=timedelta(minutes=5)),  # Через час
+    FunnelStep("reminder_5min", -timedelta(minutes=5), "reminder_5min", spread=timedelta(minutes=1)),
+    FunnelStep("reminder_start", timedelta(0), "reminder_start", spread=timedelta(minutes=1),
+               catch_up=timedelta(hours=1)),
+    FunnelStep("reminder_7min", timedelta(minutes=7), "reminder_7min", spread=timedelta(minutes=1)),
+    # Пост-эфир (продажа)
+    FunnelStep("warmup_5", OFFER_START, "warmup_5", spread=timedelta(minutes=10),  # Скидка
+               catch_up=timedelta(hours=9)),
+    FunnelStep("deadline_3h", OFFER_END - timedelta(hours=3), "deadline_3h", spread=timedelta(minutes=5)),
+    FunnelStep("deadline_1h", OFFER_END - timedelta(hours=1), "deadline_1h", spread=timedelta(minutes=5)),
+    FunnelStep("offer_closed", OFFER_END, "offer_closed", spread=timedelta(minutes=1)),
+)
+
+# Персональные шаги относительно момента записи на вебинар
+SIGNUP_FUNNEL = "signup"
+SIGNUP_STEPS = (
+    FunnelStep("confirmation", timedelta(seconds=30), "confirmation"),
+)
+
+
+@dataclass
+class Funnel:
+    """Воронка: якорь + шаги (хранятся отсортированными по времени)."""
+    name: str
+    anchor: datetime
+    steps: Tuple[FunnelStep, ...] = WEBINAR_STEPS
+    webinar_id: Optional[int] = None  # вебинар (database.webinars), чья это воронка
+    _times: List[datetime] = field(init=False, repr=False)
+    _by_key: Dict[str, FunnelStep] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.steps = tuple(sorted(self.steps, key=lambda s: s.offset))
+        self._times = [self.anchor + s.offset for s in self.steps]
+        self._by_key = {s.key: s for s in self.steps}
+
+    def step(self, key: str) -> Optional[FunnelStep]:
+        return self._by_key.get(key)
+
+    def run_date(self, step: FunnelStep) -> datetime:
+        return self.anchor + step.offset
+
+    def timeline(self) -> List[Tuple[datetime, FunnelStep]]:
+        """Шаги с абсолютным временем запуска."""
+        return list(zip(self._times, self.steps))
+
+    def next_step(self, now: datetime) -> Optional[Tuple[datetime, FunnelStep]]:
+        """Ближайший шаг после now (O(log n))."""
+        i = bisect_right(self._times, now)
+        if i < len(self.steps):
+            return self._times[i], self.steps[i]
+        return None
+
+    def compressed(self, start: datetime, step_interval: timedelta = None,
+                   factor: float = None, name: str = None) -> "Funnel":
+        """
+        Копия воронки со сжатым временем (для тестов).
+
+        step_interval — шаги идут с равным интервалом, первый через один интервал;
+        factor — реальные интервалы между шагами делятся на factor.
+        """
+        if step_interval is None and not factor:
+            raise ValueError("step_interval or factor is required")
+
+        steps = []
+        for i, s in enumerate(self.steps):
+            if step_interval is not None:
+                offset = step_interval * (i + 1)
+            else:
+                offset = (s.offset - self.steps[0].offset) / factor
+            steps.append(FunnelStep(s.key, offset, s.content, s.audience))  # без spread/catch_up
+        return Funnel(name or f"{self.name}_test", start, tuple(steps), self.webinar_id)
+
+
+# ═══════════════════════════════════════════════════════════════
+# РЕЕСТР ВОРОНОК
+# ═══════════════════════════════════════════════════════════════
+
+_funnels: Dict[str, Funnel] = {}
+
+# Общая шкала всех шагов всех воронок, отсортированная по времени
+_times: List[datetime] = []
+_entries: List[Tuple[str, str]] = []  # (имя воронки, ключ шага)
+
+
+def _rebuild_timeline():
+    items = sorted(
+        (run_date, f.name, step.key)
+        for f in _funnels.values()
+        for run_date, step in f.timeline()
+    )
+    _times[:] = [t for t, _, _ in items]
+    _entries[:] = [(name, key) for _, name, key in items]
+
+
+def register(funnel: Funnel):
+    """Регистрация (или замена) воронки."""
+    _funnels[funnel.name] = funnel
+    _rebuild_timeline()
+
+
+def unregister(name: str) -> Optional[Funnel]:
+    funnel = _funnels.pop(name, None)
+    if funnel:
+        _rebuild_timeline()
+    return funnel
+
+
+def get(name: str) -> Optional[Funnel]:
+    return _funnels.get(name)
+
+
+def all_funnels() -> List[Funnel]:
+    return list(_funnels.values())
+
+
+def next_step(now: datetime) -> Optional[Tuple[datetime, Funnel, FunnelStep]]:
+    """Ближайший шаг по всем воронкам после now (O(log n))."""
+    i = bisect_right(_times, now)
+    if i < len(_times):
+        name, key = _entries[i]
+        funnel = _funnels[name]
+        return _times[i], funnel, funnel.step(key)
+    return None
+
+
+# ═══════════════════════════════════════════════════════════════
+# КОМПИЛЯЦИЯ В ЗАДАЧИ
+# ═══════════════════════════════════════════════════════════════
+
+def job_id(funnel_name: str, step_key: str) -> str:
+    return f"{funnel_name}:{step_key}"
+
+
+def compile_jobs(funnel: Funnel, scheduler, job, *job_args, now: datetime = None,
+                 skip_audiences: Tuple[str, ...] = ()) -> int:
+    """
+    Добавляет в APScheduler задачу на каждый будущий шаг воронки.
+
+    Задача вызывается как job(*job_args, funnel.name, step.key).
+    Шаги с аудиторией из skip_audiences пропускаются (их доставляет drip).
+    Возвращает количество добавленных задач.
+    """
+    if now is None:
+        now = datetime.now(scheduler.timezone).replace(tzinfo=None)
+
+    count = 0
+    for run_date, step in funnel.timeline():
+        if run_date <= now or step.audience in skip_audiences:
+            continue
+        scheduler.add_job(
+            job, 'date', run_date=run_date,
+            args=[*job_args, funnel.name, step.key],
+            id=job_id(funnel.name, step.key), replace_existing=True
+        )
+        count += 1
+    return count
+
+
+def remove_jobs(funnel_name: str, scheduler):
+    """Удаляет все задачи воронки из APScheduler."""
+    prefix = job_id(funnel_name, "")
+    for job in scheduler.get_jobs():
+        if job.id.startswith(prefix):
+            job.remove()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+JSON кодек для ответов API
+
+Быстрый бэкенд — orjson (если установлен), иначе стандартный json.
+Оба бэкенда одинаково сериализуют datetime/date (ISO 8601),
+поэтому логи практики можно отдавать как есть.
+
+Бэкенд выбирается переменной окружения JSON_BACKEND (orjson | json),
+по умолчанию — самый быстрый из доступных.
+"""
+
+import json
+import logging
+import os
+from datetime import date, datetime
+from typing import Any, Callable, Dict
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def _default(obj: Any):
+    """Сериализация типов, которые не знает stdlib json."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+# ═══════════════════════════════════════════════════════════════
+# БЭКЕНДЫ
+# ═══════════════════════════════════════════════════════════════
+
+def _stdlib_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def _stdlib_loads(data) -> Any:
+    return json.loads(data)
+
+
+BACKENDS: Dict[str, tuple] = {
+    "json": (_stdlib_dumps, _stdlib_loads),
+}
+
+if ORJSON_AVAILABLE:
+    def _orjson_dumps(obj: Any) -> bytes:
+        # orjson сам умеет datetime/date; OPT_NON_STR_KEYS — для dict с int-ключами
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    BACKENDS["orjson"] = (_orjson_dumps, orjson.loads)
+
+
+BACKEND: str = ""
+dumps: Callable[[Any], bytes] = _stdlib_dumps
+loads: Callable[[Any], Any] = _stdlib_loads
+
+
+def set_backend(name: str):
+    """Переключение бэкенда (json | orjson)."""
+    global BACKEND, dumps, loads
+    if name not in BACKENDS:
+        logging.warning(f"JSON backend '{name}' is not available, using stdlib json")
+        name = "json"
+    BACKEND = name
+    dumps, loads = BACKENDS[name]
+
+
+set_backend(os.getenv("JSON_BACKEND", "orjson" if ORJSON_AVAILABLE else "json"))
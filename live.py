@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Живые обновления Mini App (server-sent events)
+
+Один хаб на процесс раздаёт события всем открытым соединениям
+GET /api/events/{telegram_id}. Соединение подписано на темы:
+
+    ("webinar", slug)           режим приложения и ссылка на эфир
+    ("user", telegram_id, slug) рефералы и запись пользователя
+
+Подписчик хранит только последнее неотправленное событие каждого типа
+(mode, user, stream): медленный клиент получает актуальное состояние,
+а не очередь устаревших — память на соединение ограничена числом типов.
+Последнее событие темы запоминается и сразу отдаётся новым подписчикам.
+
+Изменения находит один опрос базы на процесс (api.py), а не каждый
+клиент: poke() — проверить сейчас, не дожидаясь интервала (запись
+в этом же процессе: регистрация, /set_stream_link).
+"""
+
+import asyncio
+import os
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+import metrics
+
+# Интервал опроса изменений и пинга соединения (секунды)
+POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", 2))
+HEARTBEAT = float(os.getenv("LIVE_HEARTBEAT", 15))
+MAX_CONNECTIONS = int(os.getenv("LIVE_MAX_CONNECTIONS", 10000))
+# Через сколько миллисекунд EventSource переподключается после обрыва
+RETRY_MS = 5000
+
+
+class Subscriber:
+    """Одно соединение: темы и неотправленные события (по одному на тип)."""
+
+    __slots__ = ("topics", "pending", "wakeup", "closed", "registered")
+
+    def __init__(self, topics: Tuple[Hashable, ...]):
+        self.topics = topics
+        self.pending: Dict[str, bytes] = {}
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.registered = False  # записан ли на вебинар (ссылку на эфир — только им)
+
+    def push(self, event: str, data: bytes):
+        self.pending[event] = data
+        self.wakeup.set()
+
+    async def next(self, timeout: float) -> List[Tuple[str, bytes]]:
+        """Накопившиеся события; [] — если за timeout ничего не пришло."""
+        if not self.pending and not self.closed:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.wakeup.clear()
+        events = list(self.pending.items())
+        self.pending.clear()
+        return events
+
+
+class Hub:
+    """Раздача событий по темам подписчикам одного процесса."""
+
+    def __init__(self):
+        self._topics: Dict[Hashable, Set[Subscriber]] = {}
+        self._last: Dict[Hashable, Dict[str, bytes]] = {}
+        self._count = 0
+        self._poked = False
+        self._changed: Optional[asyncio.Event] = None  # создаётся в цикле опроса
+
+    def subscribe(self, *topics: Hashable) -> Optional[Subscriber]:
+        """Новый подписчик (с последними событиями тем); None — лимит соединений."""
+        if self._count >= MAX_CONNECTIONS:
+            return None
+        subscriber = Subscriber(topics)
+        new_topic = False
+        for topic in topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is None:
+                subscribers = self._topics[topic] = set()
+                new_topic = True
+            subscribers.add(subscriber)
+            for event, data in self._last.get(topic, {}).items():
+                if event != "stream":
+                    subscriber.push(event, data)
+        self._count += 1
+        if new_topic:
+            self.poke()  # состояния новой темы ещё нет — опросить сразу
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        for topic in subscriber.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._topics[topic]
+                self._last.pop(topic, None)
+        self._count -= 1
+
+    def topics(self, kind: str) -> List[Hashable]:
+        """Темы вида (kind, ...), у которых есть подписчики."""
+        return [t for t in self._topics if t[0] == kind]
+
+    def last(self, topic: Hashable, event: str) -> Optional[bytes]:
+        return self._last.get(topic, {}).get(event)
+
+    def publish(self, topic: Hashable, event: str, data: bytes,
+                predicate: Callable[[Subscriber], bool] = None):
+        """Событие всем подписчикам темы (или тем, для кого predicate истинен)."""
+        subscribers = self._topics.get(topic)
+        if subscribers is None:
+            return
+        self._last.setdefault(topic, {})[event] = data
+        for subscriber in subscribers:
+            if predicate is None or predicate(subscriber):
+                subscriber.push(event, data)
+
+    def subscribers(self, topic: Hashable) -> Set[Subscriber]:
+        return self._topics.get(topic, set())
+
+    def poke(self):
+        """Проверить изменения сейчас, не дожидаясь POLL_INTERVAL."""
+        self._poked = True
+        if self._changed is not None:
+            self._changed.set()
+
+    async def wait_changed(self, timeout: float):
+        """Ждёт poke() или timeout (для цикла опроса)."""
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        if not self._poked:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._poked = False
+        self._changed.clear()
+
+    def close_all(self):
+        """Завершить все соединения (остановка сервера)."""
+        for subscribers in self._topics.values():
+            for subscriber in subscribers:
+                subscriber.closed = True
+                subscriber.wakeup.set()
+        self._changed = None
+
+    def __len__(self):
+        return self._count
+
+
+hub = Hub()
+
+CONNECTIONS = metrics.Gauge("live_connections", "Open server-sent event connections",
+                            callback=lambda: len(hub))
+
+
+def format_event(event: str, data: bytes) -> bytes:
+    """Событие в формате text/event-stream (data — JSON в одну строку)."""
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
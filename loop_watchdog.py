@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Сторож event loop
+
+Бот, API и планировщик делят один event loop: любой синхронный вызов
+(SDK ЮKassa, тяжёлый JSON, чтение файла) останавливает всех сразу.
+Сторож это ловит:
+
+    heartbeat  — корутина в loop просыпается каждые LOOP_WATCHDOG_INTERVAL
+                 секунд и записывает задержку пробуждения (lag);
+    поток      — если heartbeat не отметился дольше LOOP_STALL_THRESHOLD,
+                 пока loop ещё стоит, снимает стек потока loop и текущую
+                 задачу и пишет их в лог — виден виновник, а не только факт.
+
+Перцентили задержки — lag_percentiles() (/loop и event_loop_lag_quantile_seconds
+на /metrics), число зависаний — event_loop_stalls_total.
+
+LOOP_WATCHDOG=0 — выключить. Стоимость: одно пробуждение корутины
+и потока раз в LOOP_WATCHDOG_INTERVAL.
+
+    loop_watchdog.start()   # внутри запущенного loop
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, Optional
+
+import metrics
+
+ENABLED = os.getenv("LOOP_WATCHDOG", "1") != "0"
+INTERVAL = float(os.getenv("LOOP_WATCHDOG_INTERVAL", 0.1))
+STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", 0.3))
+# Сколько последних замеров держать для перцентилей (при 0.1 с — 10 минут)
+SAMPLES = int(os.getenv("LOOP_WATCHDOG_SAMPLES", 6000))
+
+QUANTILES = (0.5, 0.9, 0.99)
+# Сколько верхних кадров стека писать в лог
+STACK_DEPTH = 25
+
+LOOP_STALLS = metrics.Counter("event_loop_stalls_total", "Event loop stalls over LOOP_STALL_THRESHOLD")
+
+
+class LoopWatchdog:
+    """Heartbeat в loop + поток, который снимает стек при зависании."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = INTERVAL,
+                 threshold: float = STALL_THRESHOLD, samples: int = SAMPLES):
+        self.loop = loop
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = deque(maxlen=samples)
+        self.stalls = 0
+        self.last_stall: Optional[dict] = None
+        self._beat = time.monotonic()
+        self._loop_thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._task = None
+        self._thread = None
+
+    def start(self):
+        self._task = self.loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            expected = self.loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self.loop.time() - expected)
+            self._beat = time.monotonic()
+            self.samples.append(lag)
+            metrics.LOOP_LAG_SECONDS.observe(lag)
+            if lag > self.threshold:
+                logging.warning(f"Event loop was blocked for {lag:.3f}s")
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled > self.threshold and beat != reported_beat:
+                reported_beat = beat
+                self._report(stalled)
+
+    def _report(self, stalled: float):
+        """Вызывается из потока сторожа, пока loop стоит."""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame, limit=STACK_DEPTH)) if frame else "<no frame>"
+        try:
+            task = asyncio.current_task(self.loop)
+        except RuntimeError:
+            task = None
+        coro = task.get_coro() if task else None
+        where = getattr(coro, "__qualname__", None) or (task.get_name() if task else "<callback>")
+
+        self.stalls += 1
+        LOOP_STALLS.inc()
+        self.last_stall = {"at": time.time(), "stalled": round(stalled, 3), "task": where}
+        logging.warning(f"Event loop stalled for >{stalled:.3f}s in {where}\n{stack}")
+
+    def percentiles(self) -> Dict[str, float]:
+        """Перцентили задержки по последним замерам (секунды)."""
+        data = sorted(self.samples)
+        if not data:
+            return {}
+        result = {f"p{int(q * 100)}": data[min(len(data) - 1, int(q * len(data)))] for q in QUANTILES}
+        result["max"] = data[-1]
+        return result
+
+
+_watchdogs: Dict[int, LoopWatchdog] = {}
+
+
+def start() -> Optional[LoopWatchdog]:
+    """Запуск сторожа для текущего loop (повторный вызов возвращает уже запущенный)."""
+    if not ENABLED:
+        return None
+    loop = asyncio.get_running_loop()
+    dog = _watchdogs.get(id(loop))
+    if dog is None:
+        dog = _watchdogs[id(loop)] = LoopWatchdog(loop)
+        dog.start()
+        logging.info(f"Loop watchdog started (stall threshold {dog.threshold}s)")
+    return dog
+
+
+def current() -> Optional[LoopWatchdog]:
+    try:
+        return _watchdogs.get(id(asyncio.get_running_loop()))
+    except RuntimeError:
+        return None
+
+
+def lag_percentiles() -> Dict[str, float]:
+    dog = current()
+    return dog.percentiles() if dog else {}
+
+
+def _quantile_samples():
+    dog = current() or next(iter(_watchdogs.values()), None)
+    if not dog:
+        return {}
+    percentiles = dog.percentiles()
+    return {str(q): percentiles[f"p{int(q * 100)}"] for q in QUANTILES if percentiles}
+
+
+metrics.Gauge("event_loop_lag_quantile_seconds", "Event loop lag percentiles over recent samples",
+              ("quantile",), callback=_quantile_samples)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Реестр медиафайлов
+
+Локальный файл (видео, кружок, фото) загружается в Telegram один раз:
+file_id из ответа на первую отправку сохраняется в таблице media вместе
+с хэшем содержимого. Дальше файл уходит по file_id — без повторной
+загрузки мегабайт на каждого получателя и без ручного /debug.
+
+Если файл на диске изменился (другой хэш) — он загружается заново.
+Если Telegram перестал принимать file_id (например, сменили бота) —
+запись удаляется и файл загружается заново.
+
+    await media.send(bot, chat_id, "video", "media/video_1.mp4",
+                     fallback_file_id=messages.VIDEO_1_FILE_ID, caption=...)
+
+fallback_file_id используется, пока локального файла нет.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+import database
+
+# Метод отправки для каждого типа медиа
+SEND_METHODS = {
+    "video": "send_video",
+    "video_note": "send_video_note",
+    "photo": "send_photo",
+    "animation": "send_animation",
+    "document": "send_document",
+}
+
+_HASH_CHUNK = 1024 * 1024
+
+# Ответы Telegram на file_id, который больше не принимается (чужой бот,
+# испорченный или устаревший id, id другого типа медиа) — только на них
+# запись забывается и файл загружается заново
+STALE_FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "wrong file_id",
+    "file reference expired",
+    "type of file mismatch",
+)
+
+# path -> (mtime_ns, size, хэш): не перечитываем файл, пока он не менялся
+_hashes: Dict[str, Tuple[int, int, str]] = {}
+# path -> (хэш, file_id)
+_file_ids: Dict[str, Tuple[str, str]] = {}
+# Одна загрузка на файл, даже при параллельных отправках
+_upload_locks: Dict[str, asyncio.Lock] = {}
+
+
+def is_stale_file_id(error: TelegramBadRequest) -> bool:
+    """Telegram отклонил сам file_id (а не подпись, чат и т.п.)."""
+    message = error.message.lower()
+    return any(pattern in message for pattern in STALE_FILE_ID_ERRORS)
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def content_hash(path: str) -> str:
+    """SHA-256 файла (кэшируется по mtime и размеру)."""
+    st = os.stat(path)
+    cached = _hashes.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    digest = await asyncio.to_thread(_hash_file, path)
+    _hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+async def get_file_id(path: str, digest: str) -> Optional[str]:
+    """file_id для текущей версии файла, если она уже загружена."""
+    cached = _file_ids.get(path)
+    if cached is None:
+        record = await database.get_media(path)
+        if record:
+            cached = _file_ids[path] = (record['content_hash'], record['file_id'])
+    if cached and cached[0] == digest:
+        return cached[1]
+    return None
+
+
+async def forget(path: str):
+    """Удаление file_id файла из реестра."""
+    _file_ids.pop(path, None)
+    await database.delete_media(path)
+
+
+def is_available(path: Optional[str], fallback_file_id: Optional[str] = None) -> bool:
+    """Есть ли что отправлять: локальный файл или запасной file_id."""
+    return bool(fallback_file_id) or bool(path and os.path.exists(path))
+
+
+def _extract_file_id(message: Message, kind: str) -> str:
+    if kind == "photo":
+        return message.photo[-1].file_id
+    return getattr(message, kind).file_id
+
+
+async def _upload(bot: Bot, chat_id: int, kind: str, path: str, digest: str, **kwargs) -> Message:
+    lock = _upload_locks.setdefault(path, asyncio.Lock())
+    async with lock:
+        # Пока ждали, файл мог загрузить параллельный запрос
+        file_id = await get_file_id(path, digest)
+        if file_id:
+            return await getattr(bot, SEND_METHODS[kind])(chat_id, file_id, **kwargs)
+
+        message = await getattr(bot, SEND_METHODS[kind])(chat_id, FSInputFile(path), **kwargs)
+        file_id = _extract_file_id(message, kind)
+        await database.save_media(path, kind, digest, file_id)
+        _file_ids[path] = (digest, file_id)
+        logging.info(f"Media uploaded: {path} -> {file_id}")
+        return message
+
+
+async def send(bot: Bot, chat_id: int, kind: str, path: Optional[str],
+               fallback_file_id: Optional[str] = None, **kwargs) -> Message:
+    """
+    Отправка медиа kind (см. SEND_METHODS) из локального файла path.
+
+    kwargs передаются методу отправки (caption, reply_markup, ...).
+    """
+    method = getattr(bot, SEND_METHODS[kind])
+
+    if not (path and os.path.exists(path)):
+        if not fallback_file_id:
+            raise FileNotFoundError(path)
+        return await method(chat_id, fallback_file_id, **kwargs)
+
+    digest = await content_hash(path)
+    file_id = await get_file_id(path, digest)
+    if file_id:
+        try:
+            return await method(chat_id, file_id, **kwargs)
+        except TelegramBadRequest as e:
+            if not is_stale_file_id(e):
+                raise
+            logging.warning(f"Media file_id for {path} rejected ({e}), re-uploading")
+            await forget(path)
+
+    return await _upload(bot, chat_id, kind, path, digest, **kwargs)
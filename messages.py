@@ -85,6 +85,9 @@ RECOMMEND_ALREADY = """
 {friends}
 """
 
+# Текст для кнопки «Поделиться» в Mini App
+REFERRAL_SHARE_TEXT = "Привет! Я иду на эфир про то, как быстро снять стресс и зарядиться энергией. Это бесплатно, погнали со мной! 👇"
+
 # ═══════════════════════════════════════════════════════════════
 # НАПОМИНАНИЯ
 # ═══════════════════════════════════════════════════════════════
@@ -232,8 +235,10 @@ RAFFLE_WINNER = """
 STATS_MESSAGE = """
 📊 **Статистика бота**
 
+📅 Вебинар: {webinar}
 👥 Всего пользователей: {total_users}
 ✅ Записались на эфир: {registered}
+👀 Пришли на эфир: {attended}
 🎯 Участников розыгрыша: {raffle_participants}
 💳 Купили курс: {buyers}
 
@@ -280,7 +285,8 @@ UNKNOWN_COMMAND = """
 CHANNEL_LINK = "https://t.me/telminov_life8"
 ADMIN_USERNAMES = ["evgenii_sharapov", "sadhustas"]  # Список админов
 
-# Настройки эфира
+# Настройки основного эфира (вебинар "main"; дата сверяется при старте бота).
+# Следующие вебинары добавляются через /funnel_add, у каждого своя ссылка и цены.
 WEBINAR_DATE = "2026-01-05 19:00:00"
 STREAM_LINK = None  # Установить через /set_stream_link
 
@@ -295,7 +301,16 @@ PAYMENT_LINK = "https://account5889.edpro.biz/widget/show?id=6"
 # ПРОГРЕВ-СЕРИЯ (ВИДЕО)
 # ═══════════════════════════════════════════════════════════════
 
-# File IDs для прогревочных видео (получены через /debug)
+# Локальные файлы прогревочных видео. При первой отправке файл загружается
+# в Telegram, его file_id сохраняется в реестре media (см. media.py).
+VIDEO_1_PATH = "media/video_1.mp4"
+VIDEO_2_PATH = "media/video_2.mp4"
+VIDEO_3_PATH = "media/video_3.mp4"
+VIDEO_4_PATH = "media/video_4.mp4"
+VIDEO_5_PATH = "media/video_5.mp4"
+
+# File IDs для прогревочных видео (получены через /debug).
+# Используются, пока локального файла нет.
 VIDEO_1_FILE_ID = "BAACAgIAAxkBAAMIaVpmkyHP9X2wxnXti4w4lSdfitIAAhOVAAL48aBKaSkKl5bQWuU4BA"
 VIDEO_2_FILE_ID = "BAACAgIAAxkBAAMKaVpmnr0ELbyuErRnEkYp5OsaFs0AAjiVAAL48aBKX1NS5gZ_VY04BA"
 VIDEO_3_FILE_ID = "BAACAgIAAxkBAAMMaVpmqZBLOLisFRHq_kbnBXN3xeUAAoCVAAL48aBK9urpDNZVO9w4BA"
@@ -348,10 +363,16 @@ WARMUP_5_TEXT = """
 Пора — действуй!
 """
 
-def get_warmup_video(video_num: int):
-    """Возвращает конфиг для прогревочного видео по номеру."""
+def get_warmup_video(video_num: int, webinar_dt: datetime = None, stream_link: str = None):
+    """
+    Возвращает конфиг для прогревочного видео по номеру.
+    
+    webinar_dt и stream_link — дата и ссылка конкретного вебинара
+    (по умолчанию WEBINAR_DATE и STREAM_LINK).
+    """
     if video_num == 1:
         return {
+            "video_path": VIDEO_1_PATH,
             "file_id": VIDEO_1_FILE_ID,
             "caption": WARMUP_1_TEXT,
             "button_text": "✨ Забронировать место",
@@ -359,6 +380,7 @@ def get_warmup_video(video_num: int):
         }
     elif video_num == 2:
         return {
+            "video_path": VIDEO_2_PATH,
             "file_id": VIDEO_2_FILE_ID,
             "caption": WARMUP_2_TEXT,
             "button_text": "🎁 Участвовать в розыгрыше",
@@ -366,7 +388,7 @@ def get_warmup_video(video_num: int):
         }
     elif video_num == 3:
         # Форматируем дату для "Завтра"
-        webinar_dt = datetime.strptime(WEBINAR_DATE, "%Y-%m-%d %H:%M:%S")
+        webinar_dt = webinar_dt or datetime.strptime(WEBINAR_DATE, "%Y-%m-%d %H:%M:%S")
         date_str = webinar_dt.strftime("%d %B")
         
         # Ручной перевод месяцев, если нужно, или просто цифрами
@@ -379,6 +401,7 @@ def get_warmup_video(video_num: int):
         date_formatted = f"{day} {month_name}"
 
         return {
+            "video_path": VIDEO_3_PATH,
             "file_id": VIDEO_3_FILE_ID,
             "caption": WARMUP_3_TEXT.format(date=date_formatted),
             "button_text": None,
@@ -387,13 +410,15 @@ def get_warmup_video(video_num: int):
     elif video_num == 4:
         # Ссылка на эфир или канал
         return {
+            "video_path": VIDEO_4_PATH,
             "file_id": VIDEO_4_FILE_ID,
             "caption": WARMUP_4_TEXT,
             "button_text": "📺 Перейти к эфиру",
-            "button_url": STREAM_LINK or CHANNEL_LINK
+            "button_url": stream_link or STREAM_LINK or CHANNEL_LINK
         }
     elif video_num == 5:
         return {
+            "video_path": VIDEO_5_PATH,
             "file_id": VIDEO_5_FILE_ID,
             "caption": WARMUP_5_TEXT,
             "button_text": "💳 Купить со скидкой",
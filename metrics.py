@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Метрики в формате Prometheus
+
+Реестр счётчиков, гейджей и гистограмм процесса; GET /metrics (api.py)
+отдаёт их текстом, который понимает Prometheus / VictoriaMetrics:
+
+    handler_seconds{handler="cmd_start"}          — обработчики aiogram
+    http_request_seconds{route=..., method=...}   — маршруты API
+    db_call_seconds{function="get_stats"}         — функции database.py
+    db_connections_open                           — соединения с базой в работе
+    broadcast_messages_total{job=..., result=...} — ход рассылок по задачам
+    broadcast_send_rate{job=...}                  — скорость текущей рассылки
+    event_loop_lag_seconds                        — задержка event loop (loop_watchdog)
+    outbox_rate / outbox_queue{lane=...}          — пейсер исходящих
+
+Метрики живут в памяти процесса: при api_server.py с несколькими
+воркерами у каждого воркера свой /metrics.
+"""
+
+import functools
+import logging
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+# Границы корзин гистограмм времени (секунды)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Монотонный счётчик."""
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """
+    Текущее значение. Вместо set()/inc() можно передать callback —
+    функцию без аргументов, которая вызывается при каждом чтении
+    (для метрики без меток — число, с метками — dict {значения меток: число}).
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback: Callable = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def remove(self, **labels):
+        self._values.pop(self._key(labels), None)
+
+    def _current(self) -> Dict[Tuple, float]:
+        if self._callback is None:
+            return self._values
+        try:
+            value = self._callback()
+        except Exception as e:
+            logging.warning(f"Metric {self.name} callback failed: {e}")
+            return {}
+        if isinstance(value, dict):
+            return {k if isinstance(k, tuple) else (k,): v for k, v in value.items()}
+        return {(): value}
+
+    def samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in self._current().items()]
+
+
+class Histogram(_Metric):
+    """Гистограмма с накопительными корзинами (le), суммой и количеством."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # ключ меток -> [счётчики корзин..., сумма, количество]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер длительности блока."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[-1] if state else 0
+
+    def samples(self):
+        lines = []
+        for key, state in self._values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, state):
+                cumulative += n
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus."""
+    return "\n".join(m.render() for m in REGISTRY) + "\n"
+
+
+# ═══════════════════════════════════════════════════════════════
+# МЕТРИКИ ПРИЛОЖЕНИЯ
+# ═══════════════════════════════════════════════════════════════
+
+HANDLER_SECONDS = Histogram(
+    "handler_seconds", "aiogram handler latency", ("handler", "event"))
+HANDLER_ERRORS = Counter(
+    "handler_errors_total", "aiogram handler exceptions", ("handler", "event"))
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "API request latency", ("route", "method", "status"))
+
+DB_CALL_SECONDS = Histogram(
+    "db_call_seconds", "database.py function latency", ("function",))
+DB_CALL_ERRORS = Counter(
+    "db_call_errors_total", "database.py function exceptions", ("function",))
+DB_CONNECTIONS = Gauge(
+    "db_connections_open", "Database connections in use")
+
+BROADCAST_MESSAGES = Counter(
+    "broadcast_messages_total", "Broadcast sends by job and result (sent/failed)", ("job", "result"))
+BROADCAST_IN_PROGRESS = Gauge(
+    "broadcast_in_progress", "1 while the broadcast job is running", ("job",))
+BROADCAST_RATE = Gauge(
+    "broadcast_send_rate", "Messages per second of the running (or last) broadcast", ("job",))
+
+LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds", "Event loop scheduling lag",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+
+def _outbox_rate():
+    import outbox
+    return outbox.limiter.rate
+
+
+def _outbox_queue():
+    import outbox
+    return outbox.limiter.queue_depth()
+
+
+OUTBOX_RATE = Gauge("outbox_rate", "Current outbound send rate (messages/s)", callback=_outbox_rate)
+OUTBOX_QUEUE = Gauge("outbox_queue", "Sends waiting for a token", ("lane",), callback=_outbox_queue)
+
+
+# ═══════════════════════════════════════════════════════════════
+# ИНСТРУМЕНТАЦИЯ
+# ═══════════════════════════════════════════════════════════════
+
+def timed_db(func):
+    """Обёртка функции database.py: время и ошибки по имени функции."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            DB_CALL_ERRORS.inc(function=name)
+            raise
+        finally:
+            DB_CALL_SECONDS.observe(time.perf_counter() - start, function=name)
+
+    return wrapper
+
+
+class HandlerMetricsMiddleware:
+    """Middleware aiogram (inner): время каждого обработчика по имени функции."""
+
+    def __init__(self, event: str):
+        self.event = event
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name, event=self.event)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, handler=name, event=self.event)
+
+
+def install_dispatcher(dp):
+    """Подключает замер обработчиков ко всем типам апдейтов диспетчера."""
+    for event, observer in dp.observers.items():
+        if event not in ("update", "error"):
+            observer.middleware(HandlerMetricsMiddleware(event))
+
+
+class BroadcastTracker:
+    """Ход одной рассылки: счётчики и скорость по метке задачи."""
+
+    def __init__(self, job: str):
+        self.job = job
+        self.sent = 0
+        self.failed = 0
+        self._start = time.monotonic()
+
+    def _update_rate(self):
+        elapsed = time.monotonic() - self._start
+        if elapsed > 0:
+            BROADCAST_RATE.set(round(self.sent / elapsed, 2), job=self.job)
+
+    def on_sent(self):
+        self.sent += 1
+        BROADCAST_MESSAGES.inc(job=self.job, result="sent")
+        self._update_rate()
+
+    def on_failed(self):
+        self.failed += 1
+        BROADCAST_MESSAGES.inc(job=self.job, result="failed")
+
+
+@contextmanager
+def track_broadcast(job: str):
+    """
+    with metrics.track_broadcast("main:warmup_1") as progress:
+        ... progress.on_sent() / progress.on_failed()
+    """
+    tracker = BroadcastTracker(job)
+    BROADCAST_IN_PROGRESS.inc(job=job)
+    try:
+        yield tracker
+    finally:
+        BROADCAST_IN_PROGRESS.dec(job=job)
+        tracker._update_rate()
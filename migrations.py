@@ -0,0 +1,439 @@
+# -*- coding: utf-8 -*-
+"""
+Версионные миграции схемы базы
+
+Каждая миграция — функция с номером версии. Применённые версии
+записываются в таблицу schema_version (с длительностью), при старте
+выполняются только недостающие — без DDL-попыток на каждый запуск.
+
+Обычная миграция выполняется в одной транзакции (BEGIN IMMEDIATE):
+либо применена целиком и записана версия, либо ничего. Параллельный
+процесс (бот и api_server) ждёт блокировку и видит уже применённую версию.
+
+Онлайн-миграция (online=True) для больших таблиц коммитит порциями через
+backfill(): блокировка на запись держится только на время одной порции,
+бот и API продолжают писать между порциями. Такая миграция должна быть
+идемпотентной — если процесс упадёт посередине, она повторится целиком.
+
+Добавить миграцию:
+
+    @migration(7, "practice logs index")
+    async def _practice_logs_index(db):
+        await db.execute("CREATE INDEX ...")
+
+Состояние: python migrations.py
+
+Миграции относятся к SQLite; на PostgreSQL схема и её версии —
+в storage.py (у каждой новой миграции там должна быть пара).
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, List, Tuple
+
+import aiosqlite
+
+import messages
+
+# Строк на порцию онлайн-бэкфилла и пауза между порциями
+BACKFILL_CHUNK_SIZE = 5000
+BACKFILL_PAUSE = 0.01
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[aiosqlite.Connection], Awaitable[None]]
+    online: bool = False  # коммитит порциями сама (см. backfill)
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str, online: bool = False):
+    """Декоратор: регистрирует функцию как миграцию version."""
+    def register(apply):
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, name, apply, online))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return apply
+    return register
+
+
+# ═══════════════════════════════════════════════════════════════
+# ПОМОЩНИКИ
+# ═══════════════════════════════════════════════════════════════
+
+async def get_columns(db: aiosqlite.Connection, table: str) -> List[str]:
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        return [row[1] for row in await cursor.fetchall()]
+
+
+async def add_column(db: aiosqlite.Connection, table: str, column: str, declaration: str) -> bool:
+    """ALTER TABLE ADD COLUMN, если колонки ещё нет."""
+    if column in await get_columns(db, table):
+        return False
+    await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    logging.info(f"Added column {table}.{column}")
+    return True
+
+
+async def backfill(db: aiosqlite.Connection, table: str, sql: str, key: str = "rowid",
+                   chunk_size: int = BACKFILL_CHUNK_SIZE) -> int:
+    """
+    Выполняет sql порциями по chunk_size строк table (по возрастанию key).
+
+    sql получает два параметра — границы (lo, hi]:
+        UPDATE users SET x = ... WHERE user_id > ? AND user_id <= ?
+    Граница порции — ключ chunk_size-й строки после lo (keyset, по индексу),
+    а не lo + chunk_size: ключи бывают разреженными (user_id в Telegram —
+    до ~7e9), и шаг по диапазону дал бы миллионы пустых порций.
+    Каждая порция — отдельная транзакция, между порциями другие
+    соединения успевают записать. Возвращает число затронутых строк.
+    """
+    async with db.execute(f"SELECT MIN({key}), MAX({key}) FROM {table}") as cursor:
+        low, high = await cursor.fetchone()
+    if low is None:
+        return 0
+
+    boundary_sql = f"SELECT {key} FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT 1 OFFSET ?"
+    total = 0
+    started = time.perf_counter()
+    lo = low - 1
+    while lo < high:
+        async with db.execute(boundary_sql, (lo, chunk_size - 1)) as cursor:
+            row = await cursor.fetchone()
+        # Последняя порция — до MAX на момент старта (новые строки пишет уже новый код)
+        hi = high if row is None else min(row[0], high)
+        cursor = await db.execute(sql, (lo, hi))
+        await db.commit()
+        total += max(cursor.rowcount, 0)
+        lo = hi
+        await asyncio.sleep(BACKFILL_PAUSE)
+
+    logging.info(f"Backfill {table}: {total} rows in {time.perf_counter() - started:.2f}s")
+    return total
+
+
+# ═══════════════════════════════════════════════════════════════
+# МИГРАЦИИ
+# ═══════════════════════════════════════════════════════════════
+
+@migration(1, "base schema")
+async def _base_schema(db):
+    # Основная таблица пользователей
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            full_name TEXT,
+            registered_at TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            has_registered_webinar BOOLEAN DEFAULT 0,
+            registered_webinar_at TIMESTAMP,
+            attended_webinar BOOLEAN DEFAULT 0,
+            purchased_course BOOLEAN DEFAULT 0,
+            payment_id TEXT,
+            source TEXT,
+            ref_by INTEGER
+        )
+    """)
+    # Базы, созданные ранними версиями бота (бывшие fix_db.py и fix_db_v2.py)
+    for column, declaration in (
+        ("registered_webinar_at", "TIMESTAMP"),
+        ("attended_webinar", "BOOLEAN DEFAULT 0"),
+        ("purchased_course", "BOOLEAN DEFAULT 0"),
+        ("payment_id", "TEXT"),
+        ("source", "TEXT"),
+        ("ref_by", "INTEGER"),
+    ):
+        await add_column(db, "users", column, declaration)
+
+    # Таблица рекомендаций для розыгрыша
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS referrals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            referrer_id INTEGER,
+            friend_username TEXT,
+            created_at TIMESTAMP,
+            FOREIGN KEY (referrer_id) REFERENCES users(user_id)
+        )
+    """)
+
+    # Таблица настроек (ссылка на эфир и т.д.)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    """)
+
+    # Таблица логов практики (для трекера 21 дня)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS practice_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            practice_date DATE,
+            duration_seconds INTEGER DEFAULT 0,
+            created_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(user_id),
+            UNIQUE(user_id, practice_date)
+        )
+    """)
+
+    # Счётчик покупок (для social proof)
+    await db.execute("INSERT OR IGNORE INTO settings (key, value) VALUES ('buyers_count', '50')")
+
+
+@migration(2, "drip queue")
+async def _drip_queue(db):
+    # Персональная цепочка сообщений (drip) — очередь по времени
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS user_schedule (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            funnel TEXT NOT NULL,
+            step_key TEXT NOT NULL,
+            due_at TIMESTAMP NOT NULL,
+            due_bucket INTEGER NOT NULL,
+            sent_at TIMESTAMP,
+            UNIQUE(user_id, funnel, step_key)
+        )
+    """)
+    await db.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_schedule_due
+        ON user_schedule(due_bucket, id) WHERE sent_at IS NULL
+    """)
+
+
+@migration(3, "segment snapshots")
+async def _segment_snapshots(db):
+    # Снимки сегментов аудитории для рассылок
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS segment_members (
+            snapshot_id TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (snapshot_id, user_id)
+        ) WITHOUT ROWID
+    """)
+    # Индексы для сегментов (счётчики рефералов и рекомендаций)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_users_ref_by ON users(ref_by)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_id)")
+
+
+@migration(4, "media registry")
+async def _media_registry(db):
+    # Реестр медиа: локальный файл -> file_id после первой загрузки
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS media (
+            path TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            uploaded_at TIMESTAMP
+        )
+    """)
+
+
+@migration(5, "webinars and registrations")
+async def _webinars(db):
+    # Вебинары: у каждого свои дата, ссылка на эфир и цены
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS webinars (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            slug TEXT UNIQUE NOT NULL,
+            title TEXT,
+            starts_at TIMESTAMP NOT NULL,
+            stream_link TEXT,
+            price INTEGER,
+            price_discount INTEGER,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP
+        )
+    """)
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_webinars_starts ON webinars(starts_at)")
+
+    # Записи пользователей на вебинары (вместо флагов в users)
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS registrations (
+            webinar_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            registered_at TIMESTAMP,
+            attended BOOLEAN DEFAULT 0,
+            purchased BOOLEAN DEFAULT 0,
+            payment_id TEXT,
+            PRIMARY KEY (webinar_id, user_id),
+            FOREIGN KEY (webinar_id) REFERENCES webinars(id),
+            FOREIGN KEY (user_id) REFERENCES users(user_id)
+        )
+    """)
+    # Аудитория вебинара читается по первичному ключу (webinar_id, user_id),
+    # вебинары пользователя — по этому индексу
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_registrations_user ON registrations(user_id, webinar_id)")
+
+
+@migration(6, "move user flags to registrations", online=True)
+async def _flat_registrations(db):
+    """
+    Перенос модели «один вебинар» в webinars/registrations.
+
+    Флаги users (has_registered_webinar, attended_webinar, purchased_course)
+    переносятся порциями по user_id в registrations основного вебинара,
+    затем в одной транзакции создаётся сам вебинар (из messages.WEBINAR_DATE
+    и settings.stream_link) и вебинары из settings.funnels (/funnel_add).
+    Колонки users остаются как есть, но больше не обновляются.
+    """
+    async with db.execute("SELECT 1 FROM webinars LIMIT 1") as cursor:
+        if await cursor.fetchone():
+            return  # база уже переведена на вебинары
+
+    # Вебинаров ещё нет — основной получит id 1. Прерванный перенос
+    # продолжается: INSERT OR IGNORE по (webinar_id, user_id)
+    main_id = 1
+    await backfill(db, "users", f"""
+        INSERT OR IGNORE INTO registrations (webinar_id, user_id, registered_at, attended, purchased, payment_id)
+        SELECT {main_id}, user_id, COALESCE(registered_webinar_at, registered_at),
+               COALESCE(attended_webinar, 0), COALESCE(purchased_course, 0), payment_id
+        FROM users
+        WHERE user_id > ? AND user_id <= ?
+          AND (has_registered_webinar = 1 OR attended_webinar = 1 OR purchased_course = 1)
+    """, key="user_id")
+
+    async with db.execute("SELECT key, value FROM settings WHERE key IN ('stream_link', 'funnels')") as cursor:
+        legacy = dict(await cursor.fetchall())
+
+    now = datetime.now()
+    await db.execute("BEGIN IMMEDIATE")
+    async with db.execute("SELECT 1 FROM webinars LIMIT 1") as cursor:
+        if await cursor.fetchone():
+            await db.rollback()  # параллельный процесс успел раньше
+            return
+    await db.execute("""
+        INSERT INTO webinars (id, slug, starts_at, stream_link, price, price_discount, created_at)
+        VALUES (?, 'main', ?, ?, ?, ?, ?)
+    """, (main_id, messages.WEBINAR_DATE, legacy.get('stream_link'),
+          messages.COURSE_PRICE, messages.COURSE_PRICE_DISCOUNT, now))
+    for slug, starts_at in json.loads(legacy.get('funnels') or '{}').items():
+        await db.execute("""
+            INSERT OR IGNORE INTO webinars (slug, starts_at, price, price_discount, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (slug, starts_at, messages.COURSE_PRICE, messages.COURSE_PRICE_DISCOUNT, now))
+    await db.execute("DELETE FROM settings WHERE key IN ('stream_link', 'funnels')")
+    await db.commit()
+
+
+@migration(7, "practice versions")
+async def _practice_versions(db):
+    # Версия данных трекера пользователя — для ETag /api/practice/{id}:
+    # растёт при каждой записи и сбросе, чтение логов не нужно для проверки
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS practice_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+
+# ═══════════════════════════════════════════════════════════════
+# ЗАПУСК
+# ═══════════════════════════════════════════════════════════════
+
+async def _ensure_version_table(db: aiosqlite.Connection):
+    await db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at TIMESTAMP,
+            duration_ms INTEGER
+        )
+    """)
+    await db.commit()
+
+
+async def _applied_versions(db: aiosqlite.Connection) -> set:
+    async with db.execute("SELECT version FROM schema_version") as cursor:
+        return {row[0] for row in await cursor.fetchall()}
+
+
+async def _is_applied(db: aiosqlite.Connection, version: int) -> bool:
+    async with db.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)) as cursor:
+        return await cursor.fetchone() is not None
+
+
+async def migrate(db_name: str) -> List[Tuple[int, str, float]]:
+    """
+    Применяет недостающие миграции по порядку.
+
+    Возвращает (версия, имя, секунды) для применённых в этом запуске.
+    """
+    applied_now = []
+    async with aiosqlite.connect(db_name) as db:
+        await _ensure_version_table(db)
+        applied = await _applied_versions(db)
+        pending = [m for m in MIGRATIONS if m.version not in applied]
+        if not pending:
+            logging.info(f"Schema is up to date (version {max(applied, default=0)})")
+            return applied_now
+
+        for m in pending:
+            started = time.perf_counter()
+            if m.online:
+                if await _is_applied(db, m.version):
+                    continue
+                await m.apply(db)
+                await db.execute("BEGIN IMMEDIATE")
+            else:
+                await db.execute("BEGIN IMMEDIATE")
+                # Пока ждали блокировку, миграцию мог применить другой процесс
+                if await _is_applied(db, m.version):
+                    await db.rollback()
+                    continue
+                await m.apply(db)
+
+            duration = time.perf_counter() - started
+            await db.execute("""
+                INSERT OR IGNORE INTO schema_version (version, name, applied_at, duration_ms)
+                VALUES (?, ?, ?, ?)
+            """, (m.version, m.name, datetime.now(), round(duration * 1000)))
+            await db.commit()
+            applied_now.append((m.version, m.name, duration))
+            logging.info(f"Migration {m.version} '{m.name}' applied in {duration * 1000:.0f} ms")
+
+    total = sum(d for _, _, d in applied_now)
+    logging.info(f"Applied {len(applied_now)} migrations in {total:.2f}s")
+    return applied_now
+
+
+async def status(db_name: str) -> List[dict]:
+    """Все миграции: применена ли, когда и сколько длилась."""
+    async with aiosqlite.connect(db_name) as db:
+        await _ensure_version_table(db)
+        db.row_factory = aiosqlite.Row
+        async with db.execute("SELECT * FROM schema_version") as cursor:
+            done = {row['version']: dict(row) for row in await cursor.fetchall()}
+    return [
+        {"version": m.version, "name": m.name, "online": m.online, **done.get(m.version, {})}
+        for m in MIGRATIONS
+    ]
+
+
+def main():
+    import database
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    if "--apply" in sys.argv:
+        asyncio.run(migrate(database.DB_NAME))
+    for row in asyncio.run(status(database.DB_NAME)):
+        applied = f"{row['applied_at']} ({row['duration_ms']} ms)" if row.get('applied_at') else "pending"
+        print(f"{row['version']:>4}  {row['name']:<40} {applied}")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,12 @@
 import { useState, useEffect } from 'react';
 import { useTelegram } from './hooks/useTelegram';
 import { useApi } from './hooks/useApi';
+import { useLiveEvents } from './hooks/useLiveEvents';
 import { WelcomeScreen } from './screens/WelcomeScreen';
 import { DashboardScreen } from './screens/DashboardScreen';
 import { SalesScreen } from './screens/SalesScreen';
 import { ToolsScreen } from './screens/ToolsScreen';
-import type { Screen, AppMode, UserData } from './types/telegram';
+import type { Screen, AppMode, UserData, LiveUserUpdate } from './types/telegram';
 
 function App() {
   const { isReady, userId } = useTelegram();
@@ -20,6 +21,13 @@ function App() {
   const [appMode, setAppMode] = useState<AppMode | null>(null);
   const [, setUserData] = useState<UserData | null>(null);
   const [loading, setLoading] = useState(true);
+  const [liveUser, setLiveUser] = useState<LiveUserUpdate | null>(null);
+
+  // Смена режима и новые рефералы приходят от сервера сами
+  useLiveEvents(isReady ? userId : null, {
+    onMode: setAppMode,
+    onUser: setLiveUser,
+  });
 
   // Загрузка начальных данных
   useEffect(() => {
@@ -92,6 +100,7 @@ function App() {
       return (
         <DashboardScreen
           appMode={appMode}
+          liveUser={liveUser}
           onNavigate={handleNavigate}
         />
       );
@@ -6,9 +6,15 @@ import { useState, useCallback } from 'react';
 import type { UserData, AppMode, ReferralInfo } from '../types/telegram';
 
 // Hardcode API URL to prevent ENV issues
-const API_BASE = 'https://web-production-fbbc.up.railway.app';
+export const API_BASE = 'https://web-production-fbbc.up.railway.app';
 // const API_BASE = import.meta.env.VITE_API_URL || 'http://localhost:8080';
 
+// Подписанные Telegram данные сессии: по ним API узнаёт пользователя
+// (вне Telegram — пустая строка, API ответит 401)
+export function authHeaders(): Record<string, string> {
+    return { 'X-Telegram-Init-Data': window.Telegram?.WebApp?.initData ?? '' };
+}
+
 interface ApiResponse<T> {
     success: boolean;
     data?: T;
@@ -30,6 +36,7 @@ export function useApi() {
             const response = await fetch(`${API_BASE}${endpoint}`, {
                 headers: {
                     'Content-Type': 'application/json',
+                    ...authHeaders(),
                 },
                 ...options,
             });
@@ -103,6 +110,7 @@ export function useApi() {
     const resetPractice = useCallback(async (telegramId: number): Promise<boolean> => {
         const result = await fetch(`${API_BASE}/api/practice/${telegramId}`, {
             method: 'DELETE',
+            headers: authHeaders(),
         });
         const json = await result.json();
         return json.success;
@@ -0,0 +1,77 @@
+/**
+ * Живые обновления от API (server-sent events /api/events/{id})
+ *
+ * Вместо опроса /api/mode и /api/user сервер сам присылает смену режима,
+ * новых рефералов и ссылку на эфир. Читаем поток через fetch, а не
+ * EventSource: ему нужен заголовок X-Telegram-Init-Data.
+ */
+
+import { useEffect, useRef } from 'react';
+import { API_BASE, authHeaders } from './useApi';
+import type { AppMode, LiveUserUpdate } from '../types/telegram';
+
+interface LiveHandlers {
+    onMode?: (mode: AppMode) => void;
+    onUser?: (user: LiveUserUpdate) => void;
+    onStream?: (streamLink: string) => void;
+}
+
+const RECONNECT_MS = 5000;
+
+export function useLiveEvents(telegramId: number | null | undefined, handlers: LiveHandlers) {
+    // Обработчики меняются при каждом рендере — соединение от этого не пересоздаём
+    const handlersRef = useRef(handlers);
+    handlersRef.current = handlers;
+
+    useEffect(() => {
+        if (!telegramId) return;
+        const controller = new AbortController();
+
+        const dispatch = (event: string, data: string) => {
+            const payload = JSON.parse(data);
+            if (event === 'mode') handlersRef.current.onMode?.(payload);
+            else if (event === 'user') handlersRef.current.onUser?.(payload);
+            else if (event === 'stream') handlersRef.current.onStream?.(payload.stream_link);
+        };
+
+        const connect = async () => {
+            while (!controller.signal.aborted) {
+                try {
+                    const response = await fetch(`${API_BASE}/api/events/${telegramId}`, {
+                        headers: authHeaders(),
+                        signal: controller.signal,
+                    });
+                    if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+                    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+                    let buffer = '';
+                    for (;;) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        buffer += value;
+                        let end;
+                        while ((end = buffer.indexOf('\n\n')) >= 0) {
+                            const block = buffer.slice(0, end);
+                            buffer = buffer.slice(end + 2);
+                            let event = 'message';
+                            let data = '';
+                            for (const line of block.split('\n')) {
+                                if (line.startsWith('event: ')) event = line.slice(7);
+                                else if (line.startsWith('data: ')) data += line.slice(6);
+                            }
+                            if (data) dispatch(event, data);
+                        }
+                    }
+                } catch (err) {
+                    if (controller.signal.aborted) return;
+                    console.warn('Live updates disconnected:', err);
+                }
+                // Сервер закрыл поток (перезапуск) или сеть — переподключаемся
+                await new Promise((resolve) => setTimeout(resolve, RECONNECT_MS));
+            }
+        };
+
+        connect();
+        return () => controller.abort();
+    }, [telegramId]);
+}
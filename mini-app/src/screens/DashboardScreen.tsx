@@ -7,14 +7,15 @@ import { useTelegram } from '../hooks/useTelegram';
 import { useApi } from '../hooks/useApi';
 import { ProgressBar } from '../components/ProgressBar';
 import { CountdownTimer } from '../components/CountdownTimer';
-import type { UserData, ReferralInfo, AppMode } from '../types/telegram';
+import type { UserData, ReferralInfo, AppMode, LiveUserUpdate } from '../types/telegram';
 
 interface DashboardScreenProps {
     appMode: AppMode | null;
+    liveUser?: LiveUserUpdate | null;
     onNavigate: (screen: 'sales' | 'tools') => void;
 }
 
-export function DashboardScreen({ appMode, onNavigate }: DashboardScreenProps) {
+export function DashboardScreen({ appMode, liveUser, onNavigate }: DashboardScreenProps) {
     const { userId, shareLink, hapticImpact, shareToStory } = useTelegram();
     const { getUserData, getReferralLink, loading } = useApi();
 
@@ -27,6 +28,13 @@ export function DashboardScreen({ appMode, onNavigate }: DashboardScreenProps) {
         }
     }, [userId]);
 
+    // Новый реферал — из живых обновлений, без повторного запроса
+    useEffect(() => {
+        if (liveUser) {
+            setUserData((prev) => prev && { ...prev, ...liveUser });
+        }
+    }, [liveUser]);
+
     const loadData = async () => {
         if (!userId) return;
 
@@ -98,6 +98,7 @@ export interface UserData {
 
 export interface AppMode {
     mode: 'before_webinar' | 'live' | 'after_webinar' | 'offer_expired';
+    webinar: string;
     webinar_date: string;
     seconds_until: number;
     deadline: string | null;
@@ -105,6 +106,9 @@ export interface AppMode {
     course_price_discount: number;
 }
 
+// Событие user из /api/events — изменившаяся часть UserData
+export type LiveUserUpdate = Pick<UserData, 'referrals' | 'target_referrals' | 'in_raffle' | 'is_registered'>;
+
 export interface ReferralInfo {
     referral_link: string;
     share_text: string;
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Приоритетная очередь исходящих сообщений
+
+Все отправки бота (send_*, edit_*, copy/forward) проходят через общий
+бюджет скорости Telegram. Запросы разбиты на полосы:
+
+    INTERACTIVE    — ответы на /start, кнопки, команды админа
+    TRANSACTIONAL  — подтверждения (видео после записи и т.п.)
+    BULK           — рассылки воронки и /broadcast
+
+Когда бюджета не хватает, токены выдаются строго по приоритету полосы.
+Кроме того, BULK не может выбрать последние BULK_RESERVE токенов —
+они всегда остаются для интерактива, поэтому ответ новому пользователю
+уходит сразу, даже посреди большой рассылки.
+
+Полоса задаётся контекстом (contextvars), по умолчанию — INTERACTIVE:
+
+    with outbox.lane(outbox.BULK):
+        await bot.send_message(...)
+
+Скорость адаптивная (AIMD): старт с OUTBOX_RATE, на каждый 429
+(TelegramRetryAfter) — пауза на retry_after для всех полос и снижение
+скорости вдвое, затем плавный рост на OUTBOX_RATE_INCREASE сообщений/с
+за каждую секунду успешной отправки, до OUTBOX_MAX_RATE. Запрос,
+получивший 429, повторяется сам — вызывающий код его не видит.
+
+Текущие скорость, очередь и ошибки: outbox.limiter.snapshot() (/pacer).
+
+Подключение: outbox.install(bot) — ставит middleware на сессию бота.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+INTERACTIVE = 0
+TRANSACTIONAL = 1
+BULK = 2
+
+LANE_NAMES = {INTERACTIVE: "interactive", TRANSACTIONAL: "transactional", BULK: "bulk"}
+
+# Общий бюджет: начальная скорость (сообщений в секунду) и размер «пачки»
+RATE = float(os.getenv("OUTBOX_RATE", 25))
+BURST = int(os.getenv("OUTBOX_BURST", 10))
+# Токены, которые BULK не трогает
+BULK_RESERVE = int(os.getenv("OUTBOX_BULK_RESERVE", 3))
+
+# Пределы адаптивной скорости и шаг роста (сообщений/с за секунду успеха)
+MIN_RATE = float(os.getenv("OUTBOX_MIN_RATE", 1))
+MAX_RATE = float(os.getenv("OUTBOX_MAX_RATE", 30))
+RATE_INCREASE = float(os.getenv("OUTBOX_RATE_INCREASE", 1))
+
+# Сколько раз повторять запрос после 429
+MAX_RETRIES = int(os.getenv("OUTBOX_MAX_RETRIES", 3))
+
+# Методы API, которые расходуют лимит отправки
+_LIMITED_PREFIXES = ("Send", "Copy", "Forward", "Edit")
+
+_current_lane: ContextVar[int] = ContextVar("outbox_lane", default=INTERACTIVE)
+
+
+@contextmanager
+def lane(value: int):
+    """Отправки внутри блока идут по полосе value."""
+    token = _current_lane.set(value)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def current_lane() -> int:
+    return _current_lane.get()
+
+
+def error_kind(error: Exception) -> str:
+    """Класс ошибки отправки для телеметрии."""
+    if isinstance(error, TelegramRetryAfter):
+        return "retry_after"
+    if isinstance(error, TelegramForbiddenError):
+        return "forbidden"
+    if isinstance(error, TelegramBadRequest):
+        return "bad_request"
+    if isinstance(error, (TelegramNetworkError, TelegramServerError)):
+        return "network"
+    return "other"
+
+
+def is_unreachable(error: Exception) -> bool:
+    """Пользователь недоступен навсегда (заблокировал бота, удалён) — можно деактивировать."""
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    return isinstance(error, TelegramBadRequest) and "chat not found" in str(error).lower()
+
+
+class PriorityLimiter:
+    """Token bucket с очередью ожидающих по приоритету и AIMD-скоростью."""
+
+    def __init__(self, rate: float = RATE, burst: int = BURST, bulk_reserve: int = BULK_RESERVE,
+                 min_rate: float = MIN_RATE, max_rate: float = MAX_RATE,
+                 rate_increase: float = RATE_INCREASE):
+        self.rate = rate
+        self.burst = burst
+        self.bulk_reserve = min(bulk_reserve, burst - 1)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_increase = rate_increase
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._waiters = []  # heap: (lane, seq, future)
+        self._seq = itertools.count()
+        self._handle = None
+        self._handle_at = 0.0  # когда сработает _handle (monotonic)
+        # Телеметрия
+        self.sent = 0
+        self.errors = Counter()
+        self.paused_until = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        # Во время паузы после 429 _updated смотрит в будущее — токены не копятся
+        if now > self._updated:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    # ─── AIMD ───
+
+    def on_success(self):
+        """Аддитивный рост: +rate_increase сообщений/с за секунду успешной отправки."""
+        self.sent += 1
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.rate_increase / self.rate)
+
+    def on_error(self, error: Exception):
+        self.errors[error_kind(error)] += 1
+
+    def on_retry_after(self, retry_after: float):
+        """Мультипликативное снижение и пауза для всех полос."""
+        self.errors["retry_after"] += 1
+        self.rate = max(self.min_rate, self.rate / 2)
+        resume_at = time.monotonic() + retry_after
+        if resume_at > self._updated:
+            self._tokens = 0.0
+            self._updated = resume_at
+            self.paused_until = resume_at
+        logging.warning(f"Telegram flood control: pause {retry_after}s, rate -> {self.rate:.1f}/s")
+
+    def _needed(self, lane_value: int) -> float:
+        """Сколько токенов должно быть в ведре, чтобы полоса могла взять один."""
+        return 1 + (self.bulk_reserve if lane_value == BULK else 0)
+
+    async def acquire(self, lane_value: int = INTERACTIVE):
+        """Ждёт токен для полосы lane_value."""
+        self._refill()
+        # Быстрый путь: никто с таким же или более высоким приоритетом не ждёт
+        ahead = self._waiters and self._waiters[0][0] <= lane_value
+        if not ahead and self._tokens >= self._needed(lane_value):
+            self._tokens -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (lane_value, next(self._seq), future))
+        self._schedule()
+        await future
+
+    def _schedule(self):
+        if not self._waiters:
+            return
+        needed = self._needed(self._waiters[0][0])
+        now = time.monotonic()
+        pause = max(0.0, self._updated - now)
+        delay = pause + max(0.0, (needed - self._tokens) / self.rate)
+        if self._handle is not None:
+            if now + delay >= self._handle_at:
+                return
+            # Во главе очереди полоса выше, чем та, под которую заведён таймер
+            # (интерактив после BULK с его резервом) — ей ждать меньше
+            self._handle.cancel()
+        self._handle_at = now + delay
+        self._handle = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _dispatch(self):
+        self._handle = None
+        self._refill()
+        while self._waiters:
+            lane_value, _, future = self._waiters[0]
+            if future.done():
+                # Ожидание отменили
+                heapq.heappop(self._waiters)
+                continue
+            if self._tokens < self._needed(lane_value):
+                break
+            heapq.heappop(self._waiters)
+            self._tokens -= 1
+            future.set_result(None)
+        self._schedule()
+
+    def queue_depth(self) -> dict:
+        """Количество ожидающих по полосам."""
+        depth = {name: 0 for name in LANE_NAMES.values()}
+        for lane_value, _, future in self._waiters:
+            if not future.done():
+                depth[LANE_NAMES[lane_value]] += 1
+        return depth
+
+    def snapshot(self) -> dict:
+        """Текущее состояние пейсера."""
+        return {
+            "rate": round(self.rate, 2),
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 1),
+            "queue": self.queue_depth(),
+            "sent": self.sent,
+            "errors": dict(self.errors),
+        }
+
+
+limiter = PriorityLimiter()
+
+
+class OutboxMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: отправки ждут токен в своей полосе,
+    429 повторяются после паузы, результат учитывается в AIMD.
+    """
+
+    def __init__(self, limiter_: PriorityLimiter):
+        self.limiter = limiter_
+
+    async def __call__(self, make_request, bot: Bot, method):
+        if not type(method).__name__.startswith(_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        lane_value = current_lane()
+        for attempt in range(MAX_RETRIES + 1):
+            await self.limiter.acquire(lane_value)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.limiter.on_retry_after(e.retry_after)
+                if attempt == MAX_RETRIES:
+                    raise
+                continue
+            except Exception as e:
+                self.limiter.on_error(e)
+                raise
+            self.limiter.on_success()
+            return result
+
+
+def install(bot: Bot):
+    """Подключает общий лимитер к сессии бота."""
+    bot.session.middleware(OutboxMiddleware(limiter))
@@ -11,16 +11,14 @@
 
 import os
 import logging
+from importlib.util import find_spec
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Попытка импортировать yookassa (может не быть установлена)
-try:
-    from yookassa import Configuration, Payment
-    YOOKASSA_AVAILABLE = True
-except ImportError:
-    YOOKASSA_AVAILABLE = False
+# Сам SDK (~0.3 с на импорт) загружается при первом платеже, а не при старте
+YOOKASSA_AVAILABLE = find_spec("yookassa") is not None
+if not YOOKASSA_AVAILABLE:
     logging.warning("yookassa package not installed. Run: pip install yookassa")
 
 # Конфигурация
@@ -44,6 +42,7 @@ def configure():
         logging.warning("YooKassa is not configured. Payments will not work.")
         return False
     
+    from yookassa import Configuration
     Configuration.account_id = SHOP_ID
     Configuration.secret_key = SECRET_KEY
     return True
@@ -73,6 +72,8 @@ async def create_payment(
             'error': 'ЮKassa не настроена'
         }
     
+    from yookassa import Payment
+
     try:
         payment = Payment.create({
             "amount": {
@@ -122,6 +123,8 @@ async def check_payment_status(payment_id: str) -> dict:
     if not configure():
         return {'status': 'error', 'paid': False, 'user_id': None}
     
+    from yookassa import Payment
+
     try:
         payment = Payment.find_one(payment_id)
         
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Ограничение частоты запросов к API
+
+Token bucket на ключ (IP, пользователь): ведро на burst запросов,
+пополняется со скоростью rate в секунду. На ключ хранится два числа
+(токены и время последнего обновления) — O(1) памяти на активного
+клиента. Полные ведра (клиент давно не приходил) периодически
+выметаются, а общее число ключей ограничено max_keys.
+
+    limiter = TokenBucketLimiter(rate=1, burst=5)
+    retry_after = limiter.hit("user:42")   # 0 — можно, иначе секунды до токена
+
+Middleware — в api.py (по IP — до проверки initData, по пользователю — после).
+"""
+
+import os
+import time
+from typing import Dict, List
+
+ENABLED = os.getenv("RATE_LIMIT", "1") != "0"
+
+# По IP: все запросы к /api/* (учитываем, что за NAT оператора много людей)
+IP_RATE = float(os.getenv("RATE_LIMIT_IP_RATE", 50))
+IP_BURST = int(os.getenv("RATE_LIMIT_IP_BURST", 100))
+# По проверенному пользователю: чтения и записи (POST/DELETE — запись в SQLite)
+USER_READ_RATE = float(os.getenv("RATE_LIMIT_USER_READ_RATE", 10))
+USER_READ_BURST = int(os.getenv("RATE_LIMIT_USER_READ_BURST", 30))
+USER_WRITE_RATE = float(os.getenv("RATE_LIMIT_USER_WRITE_RATE", 1))
+USER_WRITE_BURST = int(os.getenv("RATE_LIMIT_USER_WRITE_BURST", 5))
+
+# Сколько прокси перед API добавляют себя в X-Forwarded-For
+# (Railway — 1; 0 — брать адрес соединения)
+PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", 1))
+
+MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100_000))
+SWEEP_INTERVAL = 60.0
+
+
+class TokenBucketLimiter:
+    """Token bucket на ключ с периодическим выметанием неактивных ключей."""
+
+    def __init__(self, rate: float, burst: int, max_keys: int = MAX_KEYS,
+                 sweep_interval: float = SWEEP_INTERVAL):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self._buckets: Dict[str, List[float]] = {}  # ключ -> [токены, время обновления]
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def hit(self, key: str, now: float = None) -> float:
+        """Списывает токен. 0 — запрос разрешён, иначе — сколько секунд ждать."""
+        if now is None:
+            now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                # Переполнение между выметаниями: вытесняем самый старый ключ
+                del self._buckets[next(iter(self._buckets))]
+            bucket = self._buckets[key] = [float(self.burst), now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def _sweep(self, now: float):
+        """Удаляет ключи, чьи ведра уже наполнились бы до краёв."""
+        full_after = self.burst / self.rate
+        idle = [k for k, (_, updated) in self._buckets.items() if now - updated >= full_after]
+        for key in idle:
+            del self._buckets[key]
+        self._next_sweep = now + self.sweep_interval
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+ip_limiter = TokenBucketLimiter(IP_RATE, IP_BURST)
+user_read_limiter = TokenBucketLimiter(USER_READ_RATE, USER_READ_BURST)
+user_write_limiter = TokenBucketLimiter(USER_WRITE_RATE, USER_WRITE_BURST)
+
+
+def client_ip(request) -> str:
+    """Адрес клиента с учётом PROXY_HOPS доверенных прокси."""
+    if PROXY_HOPS:
+        forwarded = [a.strip() for a in request.headers.get("X-Forwarded-For", "").split(",") if a.strip()]
+        if len(forwarded) >= PROXY_HOPS:
+            return forwarded[-PROXY_HOPS]
+    return request.remote or "unknown"
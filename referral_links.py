@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Реферальные ссылки для Mini App и выгрузок
+
+Ссылка вида https://t.me/<bot>?start=ref_<user_id> и готовый share_url
+(https://t.me/share/url?url=...&text=...) с корректным URL-кодированием.
+
+Закодированный JSON для каждого пользователя хранится в ограниченном LRU,
+поэтому повторные запросы не строят строки заново.
+
+Имя бота берётся из BOT_USERNAME; бот при старте уточняет его через
+get_me() и вызывает set_bot_username().
+"""
+
+import os
+from functools import lru_cache
+from typing import Iterable
+from urllib.parse import quote
+
+import json_codec
+import messages
+
+BOT_USERNAME = os.getenv("BOT_USERNAME", "SadhuStas_bot")
+CACHE_SIZE = int(os.getenv("REFERRAL_CACHE_SIZE", 10000))
+
+# Максимум id в одном пакетном запросе
+MAX_BATCH = 1000
+
+# Текст не зависит от пользователя — кодируем один раз
+_share_text_encoded = quote(messages.REFERRAL_SHARE_TEXT, safe="")
+
+
+def set_bot_username(username: str):
+    """Смена имени бота (сбрасывает кэш ссылок)."""
+    global BOT_USERNAME
+    if username and username != BOT_USERNAME:
+        BOT_USERNAME = username
+        _encode_payload.cache_clear()
+
+
+def build_link(user_id: int) -> str:
+    """Реферальная ссылка пользователя."""
+    return f"https://t.me/{BOT_USERNAME}?start=ref_{user_id}"
+
+
+def build_payload(user_id: int) -> dict:
+    """Данные для Mini App: ссылка, текст и share_url."""
+    referral_link = build_link(user_id)
+    return {
+        "referral_link": referral_link,
+        "share_text": messages.REFERRAL_SHARE_TEXT,
+        "share_url": f"https://t.me/share/url?url={quote(referral_link, safe='')}&text={_share_text_encoded}"
+    }
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _encode_payload(user_id: int) -> bytes:
+    return json_codec.dumps(build_payload(user_id))
+
+
+def get_payload_bytes(user_id: int) -> bytes:
+    """Закодированный JSON payload пользователя (из LRU)."""
+    return _encode_payload(user_id)
+
+
+def get_response_bytes(user_id: int) -> bytes:
+    """Готовое тело ответа GET /api/referral/{id}."""
+    return b'{"success":true,"data":' + _encode_payload(user_id) + b'}'
+
+
+def get_batch_response_bytes(user_ids: Iterable[int]) -> bytes:
+    """
+    Готовое тело ответа для пакетного запроса:
+    {"success": true, "data": {"<user_id>": {...}, ...}}
+    """
+    parts = [b'"%d":%s' % (user_id, _encode_payload(user_id)) for user_id in dict.fromkeys(user_ids)]
+    return b'{"success":true,"data":{' + b",".join(parts) + b'}}'
+
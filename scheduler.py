@@ -1,314 +1,511 @@
 """
 Планировщик напоминаний для бота «Гвозди Просто»
 
-Эфир: Настраивается в messages.WEBINAR_DATE
+Вебинары: таблица webinars (основной — из messages.WEBINAR_DATE),
+у каждого своя воронка по сценарию funnel.WEBINAR_STEPS.
 """
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from datetime import datetime, timedelta
 from aiogram import Bot
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
+import asyncio
+import os
 import database
+import funnel
+import media
 import messages
+import metrics
+import outbox
 import logging
 
 scheduler = AsyncIOScheduler(timezone="Europe/Moscow")
 
+# Основная воронка (эфир из messages.WEBINAR_DATE)
+MAIN_FUNNEL = database.MAIN_WEBINAR
 
-async def send_reminder(bot: Bot, text: str, only_registered: bool = True):
-    """Отправка обычного текстового напоминания."""
-    if only_registered:
-        users = await database.get_registered_users()
-    else:
-        users = await database.get_active_users()
-    
-    count = 0
-    for user_id in users:
-        try:
-            await bot.send_message(user_id, text, parse_mode="Markdown")
-            count += 1
-        except Exception as e:
-            logging.warning(f"Failed to send reminder to {user_id}: {e}")
-            await database.update_status(user_id, False)
-    
-    logging.info(f"Reminder sent to {count} users")
 
+# ═══════════════════════════════════════════════════════════════
+# АУДИТОРИИ
+# ═══════════════════════════════════════════════════════════════
 
-async def send_warmup_job(bot: Bot, video_num: int):
-    """Отправка прогревочного видео (1-5)."""
-    warmup_data = messages.get_warmup_video(video_num)
-    if not warmup_data:
-        logging.error(f"Warmup video #{video_num} config not found")
-        return
+async def iter_segment_snapshot(name: str, webinar_id: int = None):
+    """
+    Получатели сегмента database.SEGMENTS[name] по вебинару webinar_id.
+    
+    Состав фиксируется снимком на старте рассылки: пока она идёт,
+    изменения в базе не сдвигают и не дублируют получателей.
+    """
+    snapshot_id = await database.materialize_segment(database.SEGMENTS[name](webinar_id))
+    try:
+        async for user_id in database.iter_snapshot(snapshot_id):
+            yield user_id
+    finally:
+        await database.drop_snapshot(snapshot_id)
 
-    users = await database.get_registered_users()
-    count = 0
-    
-    # Подготовка кнопки (URL или callback)
-    keyboard = None
-    if warmup_data.get('button_text'):
-        if warmup_data.get('callback_data'):
-            # Callback кнопка (вызывает действие в боте)
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text=warmup_data['button_text'], callback_data=warmup_data['callback_data'])]
-            ])
-        elif warmup_data.get('button_url'):
-            # URL кнопка (открывает ссылку)
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text=warmup_data['button_text'], url=warmup_data['button_url'])]
-            ])
-
-    for user_id in users:
-        try:
-            if warmup_data.get('file_id'):
-                await bot.send_video(
-                    user_id,
-                    warmup_data['file_id'],
-                    caption=warmup_data['caption'],
-                    reply_markup=keyboard,
-                    parse_mode="Markdown"
-                )
-            else:
-                await bot.send_message(
-                    user_id,
-                    warmup_data['caption'],
-                    reply_markup=keyboard,
-                    parse_mode="Markdown"
-                )
-            count += 1
-        except Exception as e:
-            logging.warning(f"Failed to send warmup #{video_num} to {user_id}: {e}")
-            await database.update_status(user_id, False)
-            
-    logging.info(f"Warmup #{video_num} sent to {count} users")
 
+# Аудитория шага воронки: поток user_id по воронке f (её вебинару)
+AUDIENCES = {
+    "registered": lambda f: database.iter_registered_users(f.webinar_id),
+    "active": lambda f: database.iter_active_users(),
+    **{name: (lambda f, name=name: iter_segment_snapshot(name, f.webinar_id)) for name in database.SEGMENTS},
+}
 
 
+# ═══════════════════════════════════════════════════════════════
+# КОНТЕНТ ШАГОВ
+# ═══════════════════════════════════════════════════════════════
+# Каждый билдер получает воронку и возвращает
+# {"text": ..., "video_path": ..., "file_id": ... или None, "keyboard": ... или None}
+# (video_path — локальный файл, file_id — запасной, см. media.send)
+
+def _url_keyboard(text: str, url: str):
+    if text and url:
+        return InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text=text, url=url)]
+        ])
+    return None
+
+
+def _warmup_content(video_num: int):
+    async def build(f: funnel.Funnel) -> dict:
+        stream_link = await database.get_stream_link(f.webinar_id) if f.webinar_id else None
+        warmup_data = messages.get_warmup_video(video_num, f.anchor, stream_link)
+        if not warmup_data:
+            raise ValueError(f"Warmup video #{video_num} config not found")
+
+        # Подготовка кнопки (URL или callback)
+        keyboard = None
+        if warmup_data.get('button_text'):
+            if warmup_data.get('callback_data'):
+                # Callback кнопка (вызывает действие в боте)
+                keyboard = InlineKeyboardMarkup(inline_keyboard=[
+                    [InlineKeyboardButton(text=warmup_data['button_text'], callback_data=warmup_data['callback_data'])]
+                ])
+            elif warmup_data.get('button_url'):
+                # URL кнопка (открывает ссылку)
+                keyboard = _url_keyboard(warmup_data['button_text'], warmup_data['button_url'])
+
+        return {
+            "text": warmup_data['caption'],
+            "video_path": warmup_data.get('video_path'),
+            "file_id": warmup_data.get('file_id'),
+            "keyboard": keyboard,
+        }
+    return build
+
+
+def _stream_button_content(text: str, button_text: str):
+    """Напоминание с кнопкой-ссылкой на эфир."""
+    async def build(f: funnel.Funnel) -> dict:
+        stream_link = await database.get_stream_link(f.webinar_id)
+        return {"text": text, "file_id": None, "keyboard": _url_keyboard(button_text, stream_link)}
+    return build
+
+
+async def _start_content(f: funnel.Funnel) -> dict:
+    """Напоминание о старте с ссылкой."""
+    stream_link = await database.get_stream_link(f.webinar_id)
 
-async def send_reminder_with_link(bot: Bot):
-    """Отправка напоминания о старте с ссылкой."""
-    stream_link = await database.get_stream_link()
-    
     if stream_link:
         text = messages.REMINDER_START.format(stream_link=stream_link)
     else:
         text = messages.REMINDER_START_NO_LINK
-    
-    await send_reminder(bot, text)
 
+    return {"text": text, "file_id": None, "keyboard": None}
 
-async def send_reminder_with_button(bot: Bot, text: str, button_text: str = "🔴 Перейти к эфиру"):
-    """Отправка напоминания с кнопкой-ссылкой на эфир."""
-    stream_link = await database.get_stream_link()
-    
-    users = await database.get_registered_users()
-    count = 0
-    
-    # Создаём кнопку с ссылкой
-    keyboard = None
-    if stream_link:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=button_text, url=stream_link)]
-        ])
-    
-    for user_id in users:
-        try:
-            await bot.send_message(
-                user_id, 
-                text, 
-                reply_markup=keyboard,
-                parse_mode="Markdown"
+
+def _deadline_content(hours_left: int):
+    """Пост-эфир предложение с дедлайном и кнопкой оплаты."""
+    async def build(f: funnel.Funnel) -> dict:
+        buyers_count = await database.get_buyers_count()
+
+        # Дедлайн (относительно даты вебинара + 12ч)
+        deadline_str = (f.anchor + timedelta(hours=12)).strftime("%H:%M")
+
+        if hours_left == 3:
+            text = messages.POST_WEBINAR_DEADLINE_3H.format(
+                buyers_count=buyers_count,
+                deadline=deadline_str
             )
-            count += 1
-        except Exception as e:
-            logging.warning(f"Failed to send reminder to {user_id}: {e}")
-            await database.update_status(user_id, False)
-    
-    logging.info(f"Reminder with button sent to {count} users")
+            button_text = "💳 Купить со скидкой"
+        elif hours_left == 1:
+            text = messages.POST_WEBINAR_DEADLINE_1H.format(
+                buyers_count=buyers_count,
+                deadline=deadline_str
+            )
+            button_text = "🔥 Купить сейчас"
+        else:
+            text = messages.POST_WEBINAR_CLOSED
+            button_text = None  # Без кнопки, скидка закончилась
 
+        return {"text": text, "file_id": None, "keyboard": _url_keyboard(button_text, messages.PAYMENT_LINK)}
+    return build
 
 
-async def send_post_webinar_offer(bot: Bot, hours_left: int):
-    """Отправка пост-эфир предложения с дедлайном и кнопкой оплаты."""
-    
-    buyers_count = await database.get_buyers_count()
-    
-    # Вычисляем дедлайн (относительно даты вебинара + 12ч)
-    webinar_dt = datetime.strptime(messages.WEBINAR_DATE, "%Y-%m-%d %H:%M:%S")
-    deadline_dt = webinar_dt + timedelta(hours=12)
-    deadline_str = deadline_dt.strftime("%H:%M")
-    
-    # Ссылка на оплату
-    payment_url = messages.PAYMENT_LINK
-    
-    if hours_left == 3:
-        text = messages.POST_WEBINAR_DEADLINE_3H.format(
-            buyers_count=buyers_count,
-            deadline=deadline_str
-        )
-        button_text = "💳 Купить со скидкой"
-    elif hours_left == 1:
-        text = messages.POST_WEBINAR_DEADLINE_1H.format(
-            buyers_count=buyers_count,
-            deadline=deadline_str
+async def _confirmation_content(f: funnel.Funnel) -> dict:
+    """Подтверждение записи: видео #2 с кнопкой Mini App."""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text="🎁 Участвовать в розыгрыше",
+            web_app=WebAppInfo(url="https://mini-app-sharapovs-projects.vercel.app")
+        )]
+    ])
+    return {
+        "text": messages.WARMUP_2_TEXT,
+        "video_path": messages.VIDEO_2_PATH,
+        "file_id": messages.VIDEO_2_FILE_ID,
+        "keyboard": keyboard,
+    }
+
+
+CONTENT = {
+    "confirmation": _confirmation_content,
+    "warmup_1": _warmup_content(1),
+    "warmup_2": _warmup_content(2),
+    "warmup_3": _warmup_content(3),
+    "warmup_4": _warmup_content(4),
+    "warmup_5": _warmup_content(5),
+    "reminder_5min": _stream_button_content(messages.REMINDER_5MIN, "🔴 Перейти к эфиру"),
+    "reminder_start": _start_content,
+    "reminder_7min": _stream_button_content(messages.REMINDER_7MIN, "📺 Подключиться сейчас"),
+    "deadline_3h": _deadline_content(3),
+    "deadline_1h": _deadline_content(1),
+    "offer_closed": _deadline_content(0),
+}
+
+
+# ═══════════════════════════════════════════════════════════════
+# ОТПРАВКА
+# ═══════════════════════════════════════════════════════════════
+
+async def send_content(bot: Bot, user_id: int, content: dict):
+    """Отправка контента шага одному пользователю."""
+    if media.is_available(content.get('video_path'), content.get('file_id')):
+        await media.send(
+            bot, user_id, "video",
+            content.get('video_path'),
+            fallback_file_id=content.get('file_id'),
+            caption=content['text'],
+            reply_markup=content.get('keyboard'),
+            parse_mode="Markdown"
         )
-        button_text = "🔥 Купить сейчас"
-    elif hours_left == 0:
-        text = messages.POST_WEBINAR_CLOSED
-        button_text = None  # Без кнопки, скидка закончилась
     else:
+        await bot.send_message(
+            user_id,
+            content['text'],
+            reply_markup=content.get('keyboard'),
+            parse_mode="Markdown"
+        )
+
+
+async def broadcast(bot: Bot, content: dict, users, label: str) -> int:
+    """Рассылка контента по потоку user_id. Возвращает число доставленных."""
+    with outbox.lane(outbox.BULK), metrics.track_broadcast(label) as progress:
+        async for user_id in users:
+            try:
+                await send_content(bot, user_id, content)
+                progress.on_sent()
+            except Exception as e:
+                progress.on_failed()
+                logging.warning(f"Failed to send {label} to {user_id}: {e}")
+                if outbox.is_unreachable(e):
+                    await database.update_status(user_id, False)
+    return progress.sent
+
+
+async def run_step(bot: Bot, funnel_name: str, step_key: str):
+    """Задача APScheduler: выполнение шага воронки."""
+    f = funnel.get(funnel_name)
+    step = f.step(step_key) if f else None
+    if not step:
+        logging.error(f"Funnel step {funnel_name}:{step_key} not found")
         return
-    
-    # Создаём кнопку
-    keyboard = None
-    if button_text and payment_url:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=button_text, url=payment_url)]
-        ])
-    
-    # Отправляем всем зарегистрированным
-    users = await database.get_registered_users()
-    count = 0
-    
-    for user_id in users:
+
+    try:
+        content = await CONTENT[step.content](f)
+    except Exception as e:
+        logging.error(f"Failed to build content for {funnel_name}:{step_key}: {e}")
+        return
+
+    users = AUDIENCES[step.audience](f)
+    count = await broadcast(bot, content, users, f"{funnel_name}:{step_key}")
+    logging.info(f"Step {funnel_name}:{step_key} sent to {count} users")
+
+
+async def replay_funnel(bot: Bot, f: funnel.Funnel, user_id: int,
+                        step_interval: float = None, compression: float = None):
+    """
+    Проигрывание воронки одному пользователю (тестовый режим).
+
+    step_interval — пауза между шагами в секундах;
+    compression — реальные интервалы между шагами делятся на это число.
+    """
+    if step_interval is None and not compression:
+        raise ValueError("step_interval or compression is required")
+
+    prev_offset = f.steps[0].offset if f.steps else None
+    for step in f.steps:
+        if step_interval is not None:
+            delay = step_interval
+        else:
+            delay = (step.offset - prev_offset).total_seconds() / compression
+        prev_offset = step.offset
+        await asyncio.sleep(delay)
+
         try:
-            await bot.send_message(
-                user_id, 
-                text, 
-                reply_markup=keyboard,
-                parse_mode="Markdown"
-            )
-            count += 1
+            content = await CONTENT[step.content](f)
+            await send_content(bot, user_id, content)
+            logging.info(f"Test: Sent {step.key} to {user_id}")
         except Exception as e:
-            logging.warning(f"Failed to send deadline reminder to {user_id}: {e}")
-            await database.update_status(user_id, False)
-    
-    logging.info(f"Deadline reminder ({hours_left}h) sent to {count} users")
+            logging.error(f"Test: Failed to send {step.key}: {e}")
 
 
-def setup_scheduler(bot: Bot):
-    """Настройка расписания напоминаний."""
-    
-    webinar_dt = datetime.strptime(messages.WEBINAR_DATE, "%Y-%m-%d %H:%M:%S")
-    
-    logging.info(f"Setting up scheduler for Webinar: {webinar_dt}")
-    
-    # ═══════════════════════════════════════════════════════════════
-    # ПРОГРЕВ-СЕРИЯ
-    # ═══════════════════════════════════════════════════════════════
-    
-    # Видео 1: За 5 дней (Анонс)
-    scheduler.add_job(
-        send_warmup_job, 'date', run_date=webinar_dt - timedelta(days=5),
-        args=[bot, 1], id='warmup_1', replace_existing=True
-    )
-    
-    # Видео 2: За 3 дня (Вовлечение)
-    scheduler.add_job(
-        send_warmup_job, 'date', run_date=webinar_dt - timedelta(days=3),
-        args=[bot, 2], id='warmup_2', replace_existing=True
-    )
-    
-    # Видео 3: За 1 день (Завтра) — ЗАМЕНЯЕТ старый REMINDER_24H
-    scheduler.add_job(
-        send_warmup_job, 'date', run_date=webinar_dt - timedelta(days=1),
-        args=[bot, 3], id='warmup_3', replace_existing=True
-    )
-    
-    # Видео 4: За 1 час — ЗАМЕНЯЕТ старый REMINDER_1H
-    scheduler.add_job(
-        send_warmup_job, 'date', run_date=webinar_dt - timedelta(hours=1),
-        args=[bot, 4], id='warmup_4', replace_existing=True
-    )
-    
-    # За 5 минут — напоминание с кнопкой
-    scheduler.add_job(
-        send_reminder_with_button, 'date', run_date=webinar_dt - timedelta(minutes=5),
-        args=[bot, messages.REMINDER_5MIN, "🔴 Перейти к эфиру"], 
-        id='reminder_5min', replace_existing=True
-    )
-    
-    # СТАРТ ЭФИРА (без изменений)
-    scheduler.add_job(
-        send_reminder_with_link, 'date', run_date=webinar_dt,
-        args=[bot], id='reminder_start', replace_existing=True
-    )
-    
-    # Через 7 минут — напоминание "эфир в разгаре"
-    scheduler.add_job(
-        send_reminder_with_button, 'date', run_date=webinar_dt + timedelta(minutes=7),
-        args=[bot, messages.REMINDER_7MIN, "📺 Подключиться сейчас"], 
-        id='reminder_7min', replace_existing=True
-    )
-    
-    # ═══════════════════════════════════════════════════════════════
-    # ПОСТ-ЭФИР (ПРОДАЖА)
-    # ═══════════════════════════════════════════════════════════════
-    
-    # Видео 5: Через 1.5 часа (Скидка 20%) — ЗАМЕНЯЕТ старый оффер 12ч
-    scheduler.add_job(
-        send_warmup_job, 'date', run_date=webinar_dt + timedelta(minutes=90),
-        args=[bot, 5], id='warmup_5', replace_existing=True
-    )
-    
-    # Дедлайны (вычисляем от конца скидки, который через 12ч после конца эфира ~14ч после старта)
-    # Скидка действует 12 часов ПОСЛЕ ЭФИРА. Эфир ~1.5-2 часа.
-    # Допустим отсчет 12 часов начинается с момента отправки Видео 5 (start + 1.5h)
-    
-    offer_start_dt = webinar_dt + timedelta(minutes=90)
-    offer_end_dt = offer_start_dt + timedelta(hours=12)
-    
-    # Дедлайн 3 часа до конца
-    scheduler.add_job(
-        send_post_webinar_offer, 'date', run_date=offer_end_dt - timedelta(hours=3),
-        args=[bot, 3], id='deadline_3h', replace_existing=True
-    )
-    
-    # Дедлайн 1 час до конца
+# ═══════════════════════════════════════════════════════════════
+# ПЕРСОНАЛЬНАЯ ЦЕПОЧКА (DRIP)
+# ═══════════════════════════════════════════════════════════════
+# Шаги для записавшихся не рассылаются всем разом: каждому пользователю
+# они кладутся в user_schedule со своим временем (время шага + сдвиг
+# внутри step.spread), а один поллер выбирает наступившие строки пачками.
+# Опоздавшие получают подтверждение, все будущие шаги и те пропущенные,
+# у которых ещё не закрылось окно catch_up.
+
+DRIP_AUDIENCES = ("registered",)
+DRIP_POLL_SECONDS = int(os.getenv("DRIP_POLL_SECONDS", 5))
+DRIP_BATCH_SIZE = int(os.getenv("DRIP_BATCH_SIZE", 200))
+
+# Интервал между догоняющими сообщениями опоздавшему
+DRIP_CATCH_UP_INTERVAL = timedelta(minutes=2)
+
+# Шаги относительно момента записи (якорь не используется)
+_signup_funnel = funnel.Funnel(funnel.SIGNUP_FUNNEL, datetime(1970, 1, 1), funnel.SIGNUP_STEPS)
+
+
+def now_local() -> datetime:
+    """Текущее время в часовом поясе планировщика (naive)."""
+    return datetime.now(scheduler.timezone).replace(tzinfo=None)
+
+
+def _jitter(user_id: int, spread: timedelta) -> timedelta:
+    """Детерминированный сдвиг пользователя внутри окна spread."""
+    seconds = int(spread.total_seconds())
+    if seconds <= 0:
+        return timedelta(0)
+    return timedelta(seconds=(user_id * 2654435761) % seconds)
+
+
+def plan_user_schedule(user_id: int, registered_at: datetime, funnels) -> list:
+    """Строки user_schedule для пользователя, записавшегося в registered_at."""
+    rows = [
+        (user_id, _signup_funnel.name, step.key, registered_at + step.offset)
+        for step in _signup_funnel.steps
+    ]
+    for f in funnels:
+        catch_up_at = registered_at
+        for run_date, step in f.timeline():
+            if step.audience not in DRIP_AUDIENCES:
+                continue
+            if run_date > registered_at:
+                rows.append((user_id, f.name, step.key, run_date + _jitter(user_id, step.spread)))
+            elif step.catch_up and registered_at < run_date + step.catch_up:
+                catch_up_at += DRIP_CATCH_UP_INTERVAL
+                rows.append((user_id, f.name, step.key, catch_up_at))
+    return rows
+
+
+async def enqueue_registration(user_id: int, webinar: dict, registered_at: datetime = None):
+    """
+    Планирует персональную цепочку для записавшегося на вебинар.
+
+    Воронка строится по записи вебинара в базе, а не из реестра funnel:
+    реестр заполняет только setup_scheduler в процессе бота, а записывают
+    и воркеры api_server.
+    """
+    rows = plan_user_schedule(user_id, registered_at or now_local(), [webinar_funnel(webinar)])
+    await database.enqueue_schedule(rows)
+
+
+async def register_for_webinar(user_id: int) -> bool:
+    """
+    Запись на текущий вебинар и постановка персональной цепочки.
+    
+    False — пользователь уже записан (повторное нажатие, повторный запрос).
+    """
+    webinar = await database.get_current_webinar(now_local())
+    if not webinar or not await database.set_webinar_registration(user_id, webinar['id']):
+        return False
+    await enqueue_registration(user_id, webinar)
+    return True
+
+
+async def backfill_funnel(funnel_name: str):
+    """Ставит будущие шаги воронки всем уже записавшимся (один раз на якорь)."""
+    f = funnel.get(funnel_name)
+    if not f or f.webinar_id is None:
+        return
+
+    flag = f"drip_backfill:{f.name}:{f.anchor:%Y-%m-%d %H:%M:%S}"
+    if await database.get_setting(flag):
+        return
+
+    # Якорь мог смениться — неотправленные строки старого расписания не нужны
+    await database.clear_funnel_schedule(f.name)
+
+    now = now_local()
+    steps = [
+        (run_date, step) for run_date, step in f.timeline()
+        if step.audience in DRIP_AUDIENCES and run_date > now
+    ]
+
+    total = 0
+    rows = []
+    async for user_id in database.iter_registered_users(f.webinar_id):
+        rows.extend(
+            (user_id, f.name, step.key, run_date + _jitter(user_id, step.spread))
+            for run_date, step in steps
+        )
+        if len(rows) >= 1000:
+            total += await database.enqueue_schedule(rows)
+            rows = []
+    total += await database.enqueue_schedule(rows)
+
+    await database.set_setting(flag, "1")
+    logging.info(f"Drip backfill for '{f.name}': {total} messages queued")
+
+
+async def _build_step_content(funnel_name: str, step_key: str):
+    f = _signup_funnel if funnel_name == _signup_funnel.name else funnel.get(funnel_name)
+    step = f.step(step_key) if f else None
+    if not step:
+        logging.error(f"Drip step {funnel_name}:{step_key} not found")
+        return None
+    try:
+        return await CONTENT[step.content](f)
+    except Exception as e:
+        logging.error(f"Failed to build content for {funnel_name}:{step_key}: {e}")
+        return None
+
+
+async def drain_user_schedule(bot: Bot):
+    """Задача-поллер: отправляет наступившие персональные сообщения пачками."""
+    contents = {}
+    with metrics.track_broadcast("drip") as progress:
+        while True:
+            rows = await database.claim_due_schedule(now_local(), DRIP_BATCH_SIZE)
+            if not rows:
+                break
+
+            for user_id, funnel_name, step_key in rows:
+                key = (funnel_name, step_key)
+                if key not in contents:
+                    contents[key] = await _build_step_content(funnel_name, step_key)
+                if contents[key] is None:
+                    continue
+
+                # Подтверждение записи важнее рассылочных шагов
+                is_signup = funnel_name == _signup_funnel.name
+                try:
+                    with outbox.lane(outbox.TRANSACTIONAL if is_signup else outbox.BULK):
+                        await send_content(bot, user_id, contents[key])
+                    progress.on_sent()
+                except Exception as e:
+                    progress.on_failed()
+                    logging.warning(f"Failed to send {funnel_name}:{step_key} to {user_id}: {e}")
+                    if outbox.is_unreachable(e):
+                        await database.update_status(user_id, False)
+
+    if progress.sent:
+        logging.info(f"Drip: sent {progress.sent} messages")
+
+
+# ═══════════════════════════════════════════════════════════════
+# УПРАВЛЕНИЕ ВОРОНКАМИ
+# ═══════════════════════════════════════════════════════════════
+
+def add_funnel(bot: Bot, f: funnel.Funnel) -> int:
+    """
+    Регистрирует воронку и планирует её будущие шаги.
+    
+    Шаги для записавшихся уходят в персональную очередь (drip),
+    остальные — общими рассылками по времени.
+    """
+    funnel.remove_jobs(f.name, scheduler)
+    funnel.register(f)
+    count = funnel.compile_jobs(f, scheduler, run_step, bot, skip_audiences=DRIP_AUDIENCES)
     scheduler.add_job(
-        send_post_webinar_offer, 'date', run_date=offer_end_dt - timedelta(hours=1),
-        args=[bot, 1], id='deadline_1h', replace_existing=True
+        backfill_funnel, args=[f.name],
+        id=f"drip_backfill:{f.name}", replace_existing=True
     )
+    logging.info(f"Funnel '{f.name}' (anchor {f.anchor}) scheduled: {count} broadcast steps")
+    return len(f.steps)
+
+
+def remove_funnel(name: str) -> bool:
+    """Снимает воронку и её задачи."""
+    funnel.remove_jobs(name, scheduler)
+    return funnel.unregister(name) is not None
+
+
+def webinar_funnel(webinar: dict) -> funnel.Funnel:
+    """Воронка вебинара по стандартному сценарию."""
+    return funnel.Funnel(webinar['slug'], database.parse_ts(webinar['starts_at']), webinar_id=webinar['id'])
+
+
+async def add_webinar_funnel(bot: Bot, name: str, anchor: datetime) -> int:
+    """Создаёт вебинар (или переносит его дату) и планирует его воронку."""
+    webinar_id = await database.save_webinar(name, anchor)
+    return add_funnel(bot, funnel.Funnel(name, anchor, webinar_id=webinar_id))
+
+
+async def remove_webinar_funnel(name: str) -> bool:
+    """Снимает вебинар с расписания (записи на него остаются в базе)."""
+    removed = remove_funnel(name)
+    await database.clear_funnel_schedule(name)
+    return await database.deactivate_webinar(name) or removed
+
+
+async def load_webinars(bot: Bot):
+    """
+    Планирует воронки всех активных вебинаров, которые ещё не закончились.
+    
+    Дата основного вебинара сверяется с messages.WEBINAR_DATE, его воронка
+    регистрируется всегда (на ней строятся тестовые прогоны).
+    """
+    main_dt = datetime.strptime(messages.WEBINAR_DATE, "%Y-%m-%d %H:%M:%S")
+    main_id = await database.save_webinar(MAIN_FUNNEL, main_dt)
+    add_funnel(bot, funnel.Funnel(MAIN_FUNNEL, main_dt, webinar_id=main_id))
+
+    for webinar in await database.get_webinars(since=now_local() - funnel.OFFER_END):
+        if webinar['slug'] != MAIN_FUNNEL:
+            add_funnel(bot, webinar_funnel(webinar))
+
+
+async def setup_scheduler(bot: Bot):
+    """Настройка расписания напоминаний по всем вебинарам."""
+
+    await load_webinars(bot)
     
-    # Закрытие
+    # Поллер персональной очереди
     scheduler.add_job(
-        send_post_webinar_offer, 'date', run_date=offer_end_dt,
-        args=[bot, 0], id='offer_closed', replace_existing=True
+        drain_user_schedule, 'interval', seconds=DRIP_POLL_SECONDS,
+        args=[bot], id='drip_poller', replace_existing=True,
+        max_instances=1, coalesce=True
     )
-    
+
     scheduler.start()
-    logging.info("Scheduler started with webinar reminders for 2026-01-05 19:00 MSK")
+    logging.info(f"Scheduler started with reminders for {len(funnel.all_funnels())} webinars")
 
 
 async def start_test_schedule(bot: Bot):
     """Запуск ТЕСТОВОГО расписания (шаг 1 минута)."""
-    scheduler.remove_all_jobs()
     logging.info("⚠️ STARTING TEST SCHEDULE ⚠️")
-    
-    # Используем timezone-aware datetime для совместимости со scheduler
-    import pytz
-    msk = pytz.timezone('Europe/Moscow')
-    now = datetime.now(msk)
-    
-    # 1. Анонс (через 1 мин)
-    scheduler.add_job(send_warmup_job, 'date', run_date=now + timedelta(minutes=1), args=[bot, 1], id='test_w1')
-    
-    # 2. Вовлечение (через 2 мин)
-    scheduler.add_job(send_warmup_job, 'date', run_date=now + timedelta(minutes=2), args=[bot, 2], id='test_w2')
-    
-    # 3. Завтра эфир (через 3 мин)
-    scheduler.add_job(send_warmup_job, 'date', run_date=now + timedelta(minutes=3), args=[bot, 3], id='test_w3')
-    
-    # 4. Через час (через 4 мин)
-    scheduler.add_job(send_warmup_job, 'date', run_date=now + timedelta(minutes=4), args=[bot, 4], id='test_w4')
-    
-    # 5. СТАРТ ЭФИРА (через 5 мин)
-    scheduler.add_job(send_reminder_with_link, 'date', run_date=now + timedelta(minutes=5), args=[bot], id='test_start')
-    
-    # 6. Оффер после эфира (через 6 мин)
-    scheduler.add_job(send_warmup_job, 'date', run_date=now + timedelta(minutes=6), args=[bot, 5], id='test_w5')
-    
-    logging.info("Test schedule set: 6 steps, 1 min interval")
+
+    now = now_local()
+    main = funnel.get(MAIN_FUNNEL)
+    test = main.compressed(now, step_interval=timedelta(minutes=1))
+    count = add_funnel(bot, test)
+
+    logging.info(f"Test schedule set: {count} steps, 1 min interval")
 
 
 def get_scheduled_jobs():
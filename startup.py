@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Профиль холодного старта
+
+Бот должен отвечать на /start как можно скорее после запуска процесса
+(деплой, рестарт после падения). Модуль меряет два вида затрат:
+
+    импорт модулей       — сколько «своего» времени занял каждый модуль
+                           (без вложенных импортов) и каждый пакет целиком;
+    этапы инициализации  — startup.phase("...") в bot.main: БД, планировщик,
+                           API, подключение к Telegram.
+
+Время до готовности (первый опрос Telegram) сравнивается с бюджетом
+STARTUP_BUDGET (секунды); превышение — предупреждение в лог.
+
+STARTUP_PROFILE=1 — подробный отчёт по импортам и этапам:
+
+    STARTUP_PROFILE=1 python bot.py
+
+Модуль должен импортироваться первым (до aiogram), иначе тяжёлые
+пакеты в профиль не попадут.
+"""
+
+import importlib.abc
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+PROFILE = os.getenv("STARTUP_PROFILE", "0") == "1"
+BUDGET = float(os.getenv("STARTUP_BUDGET", 10))
+# Сколько самых дорогих модулей показывать в отчёте
+TOP_MODULES = int(os.getenv("STARTUP_PROFILE_TOP", 15))
+
+_started = time.perf_counter()
+_phases: List[Tuple[str, float]] = []
+_ready_at = None
+
+# Импорты: модуль -> собственное время (без вложенных импортов)
+_import_self: Dict[str, float] = {}
+_import_stack: List[List[float]] = []  # [начало, время вложенных импортов]
+
+
+# ═══════════════════════════════════════════════════════════════
+# ИМПОРТЫ
+# ═══════════════════════════════════════════════════════════════
+
+class _TimedLoader:
+    """Обёртка загрузчика: меряет exec_module, остальное — как у оригинала."""
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        frame = [time.perf_counter(), 0.0]
+        _import_stack.append(frame)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            _import_stack.pop()
+            total = time.perf_counter() - frame[0]
+            _import_self[module.__name__] = total - frame[1]
+            if _import_stack:
+                _import_stack[-1][1] += total
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Находит модуль обычными средствами и подменяет загрузчик на _TimedLoader."""
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+def _install_import_timer():
+    if not any(isinstance(f, _ImportTimer) for f in sys.meta_path):
+        sys.meta_path.insert(0, _ImportTimer())
+
+
+def _uninstall_import_timer():
+    sys.meta_path[:] = [f for f in sys.meta_path if not isinstance(f, _ImportTimer)]
+
+
+# ═══════════════════════════════════════════════════════════════
+# ЭТАПЫ
+# ═══════════════════════════════════════════════════════════════
+
+@contextmanager
+def phase(name: str):
+    """Замер этапа инициализации."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - start))
+
+
+def imported(name: str = "imports"):
+    """Отметка в конце импортов модуля запуска: этап длиной от старта процесса."""
+    _phases.append((name, elapsed()))
+
+
+def elapsed() -> float:
+    """Секунды с запуска процесса (точнее — с импорта этого модуля)."""
+    return time.perf_counter() - _started
+
+
+def ready():
+    """Бот готов принимать апдейты: проверка бюджета и отчёт."""
+    global _ready_at
+    if _ready_at is not None:
+        return
+    _ready_at = elapsed()
+    _uninstall_import_timer()
+
+    phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in _phases)
+    logging.info(f"Startup: ready in {_ready_at:.2f}s ({phases})")
+    if _ready_at > BUDGET:
+        logging.warning(f"Startup took {_ready_at:.2f}s, budget is {BUDGET:.1f}s "
+                        f"(run with STARTUP_PROFILE=1 for details)")
+    if PROFILE:
+        logging.info(report())
+
+
+def report() -> str:
+    """Текстовый отчёт: пакеты, самые дорогие модули, этапы."""
+    packages = defaultdict(float)
+    for name, seconds in _import_self.items():
+        packages[name.partition(".")[0]] += seconds
+
+    lines = [f"Startup profile ({elapsed():.2f}s since start)", "Imports by package:"]
+    for name, seconds in sorted(packages.items(), key=lambda x: -x[1])[:TOP_MODULES]:
+        lines.append(f"  {seconds * 1000:9.1f} ms  {name}")
+    lines.append("Slowest modules (self time):")
+    for name, seconds in sorted(_import_self.items(), key=lambda x: -x[1])[:TOP_MODULES]:
+        lines.append(f"  {seconds * 1000:9.1f} ms  {name}")
+    lines.append("Init phases:")
+    for name, seconds in sorted(_phases, key=lambda x: -x[1]):
+        lines.append(f"  {seconds * 1000:9.1f} ms  {name}")
+    return "\n".join(lines)
+
+
+if PROFILE:
+    _install_import_timer()
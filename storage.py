@@ -0,0 +1,525 @@
+# -*- coding: utf-8 -*-
+"""
+Бэкенды хранилища: SQLite (файл) и PostgreSQL (asyncpg)
+
+database.py пишет SQL, общий для обоих бэкендов (плейсхолдеры ?,
+upsert через ON CONFLICT), и работает с соединением через то
+подмножество интерфейса aiosqlite, которым пользуется:
+
+    cursor = await db.execute(sql, params)      # или async with db.execute(...) as cursor
+    await cursor.fetchone() / fetchall() / fetchmany(n), cursor.rowcount
+    await db.executemany(sql, rows)
+    await db.commit()
+
+Строки доступны и по индексу, и по имени колонки, dict(row) — словарь.
+
+Курсор execute на PostgreSQL уже прочитал результат целиком. Для обхода
+больших таблиц — backend.stream(): серверный курсор, в памяти одна порция:
+
+    async with backend.stream(db, "SELECT * FROM users") as cursor:
+        rows = await cursor.fetchmany(1000)
+
+- SQLiteBackend — aiosqlite как есть (row_factory = Row);
+- PostgresBackend — соединение из пула asyncpg за адаптером: ? → $n,
+  подготовленные выражения (кэш asyncpg на каждом соединении пула),
+  неявная транзакция до commit(), как в sqlite3.
+
+Бэкенд выбирается по DATABASE_URL (postgresql://...), иначе — файл
+database.DB_NAME:
+
+    backend = storage.get_backend(DATABASE_URL or DB_NAME)
+    db = await backend.connect()
+
+Схема PostgreSQL повторяет схему SQLite после всех миграций
+(migrations.py). Время и даты хранятся текстом в том же формате, что
+пишет SQLite ("YYYY-MM-DD HH:MM:SS"): запросы сравнивают их строками,
+а код разбирает parse_ts — одинаково на обоих бэкендах.
+Новая миграция SQLite должна получить пару в POSTGRES_MIGRATIONS,
+иначе init() на PostgreSQL откажется запускаться.
+
+Перенос данных: bulk.py export из SQLite, затем bulk.py import
+с DATABASE_URL на PostgreSQL.
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import aiosqlite
+
+import messages
+import migrations
+
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    ASYNCPG_AVAILABLE = False
+
+# Пул соединений PostgreSQL (на процесс: у каждого воркера api_server свой)
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+# Подготовленных выражений в кэше каждого соединения
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 256))
+
+POSTGRES_SCHEMES = ("postgres://", "postgresql://")
+
+
+# ═══════════════════════════════════════════════════════════════
+# SQLITE
+# ═══════════════════════════════════════════════════════════════
+
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def connect(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.path)
+        db.row_factory = aiosqlite.Row
+        return db
+
+    async def init(self):
+        async with aiosqlite.connect(self.path) as db:
+            # WAL: долгие чтения (выгрузки, рассылки) не блокируют запись
+            await db.execute("PRAGMA journal_mode=WAL")
+        await migrations.migrate(self.path)
+
+    async def close(self):
+        pass
+
+    @asynccontextmanager
+    async def stream(self, db: aiosqlite.Connection, sql: str, params: Sequence = ()):
+        """Курсор для чтения порциями (курсор sqlite3 и так потоковый)."""
+        async with db.execute(sql, params) as cursor:
+            yield cursor
+
+    async def columns(self, db, table: str) -> Dict[str, str]:
+        """Колонки таблицы: имя -> "int" | "text"."""
+        async with db.execute(f"PRAGMA table_info({table})") as cursor:
+            return {row[1]: "int" if _is_int_type(row[2]) else "text" for row in await cursor.fetchall()}
+
+    async def after_import(self, db, table: str):
+        pass
+
+
+def _is_int_type(declared: str) -> bool:
+    declared = declared.upper()
+    return "INT" in declared or declared == "BOOLEAN"
+
+
+# ═══════════════════════════════════════════════════════════════
+# POSTGRESQL
+# ═══════════════════════════════════════════════════════════════
+
+@lru_cache(maxsize=1024)
+def _translate(sql: str) -> str:
+    """Плейсхолдеры ? → $1, $2, ... (вне строковых литералов)."""
+    out = []
+    n = 0
+    in_string = False
+    for ch in sql:
+        if ch == "'":
+            in_string = not in_string
+        elif ch == "?" and not in_string:
+            n += 1
+            out.append(f"${n}")
+            continue
+        out.append(ch)
+    return "".join(out)
+
+
+def adapt(value):
+    """Параметр в том виде, в каком его сохранил бы sqlite3."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, datetime):
+        return value.isoformat(" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+@lru_cache(maxsize=1024)
+def _returns_rows(sql: str) -> bool:
+    head = sql.lstrip()[:6].upper()
+    return head in ("SELECT", "VALUES") or head.startswith("WITH") or "RETURNING" in sql.upper()
+
+
+class PostgresCursor:
+    """Результат запроса (строки уже прочитаны)."""
+
+    def __init__(self, rows: list, rowcount: int):
+        self._rows = rows
+        self._pos = 0
+        self.rowcount = rowcount
+
+    @property
+    def description(self) -> Optional[Tuple[tuple, ...]]:
+        if not self._rows:
+            return None
+        return tuple((name, None, None, None, None, None, None) for name in self._rows[0].keys())
+
+    async def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        self._pos += 1
+        return self._rows[self._pos - 1]
+
+    async def fetchmany(self, size: int) -> list:
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    async def fetchall(self) -> list:
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+
+class PostgresStreamCursor:
+    """Серверный курсор asyncpg: строки читаются по мере fetchmany."""
+
+    rowcount = -1
+
+    def __init__(self, statement, cursor):
+        self._cursor = cursor
+        self.description = tuple(
+            (attr.name, None, None, None, None, None, None) for attr in statement.get_attributes())
+
+    async def fetchone(self):
+        return await self._cursor.fetchrow()
+
+    async def fetchmany(self, size: int) -> list:
+        return await self._cursor.fetch(size)
+
+    async def fetchall(self) -> list:
+        rows = []
+        while True:
+            chunk = await self._cursor.fetch(1000)
+            if not chunk:
+                return rows
+            rows.extend(chunk)
+
+
+class _Execution:
+    """Как результат aiosqlite execute: можно await и async with."""
+
+    def __init__(self, coro):
+        self._coro = coro
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    async def __aenter__(self) -> PostgresCursor:
+        return await self._coro
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class PostgresConnection:
+    """Соединение пула asyncpg с интерфейсом aiosqlite (см. docstring модуля)."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._transaction = None
+
+    async def _begin(self):
+        # Как sqlite3: транзакция открывается перед первым изменением
+        if self._transaction is None:
+            self._transaction = self._conn.transaction()
+            await self._transaction.start()
+
+    async def _execute(self, sql: str, params: Sequence) -> PostgresCursor:
+        query = _translate(sql)
+        args = [adapt(p) for p in params]
+        if _returns_rows(sql):
+            rows = await self._conn.fetch(query, *args)
+            return PostgresCursor(rows, len(rows))
+        await self._begin()
+        status = await self._conn.execute(query, *args)
+        count = status.rsplit(" ", 1)[-1]
+        return PostgresCursor([], int(count) if count.isdigit() else -1)
+
+    def execute(self, sql: str, params: Sequence = ()) -> _Execution:
+        return _Execution(self._execute(sql, params))
+
+    @asynccontextmanager
+    async def stream(self, sql: str, params: Sequence = ()):
+        """Серверный курсор (живёт только внутри транзакции)."""
+        async with self._conn.transaction():
+            statement = await self._conn.prepare(_translate(sql))
+            cursor = await statement.cursor(*[adapt(p) for p in params])
+            yield PostgresStreamCursor(statement, cursor)
+
+    async def executemany(self, sql: str, rows):
+        await self._begin()
+        await self._conn.executemany(_translate(sql), [[adapt(p) for p in row] for row in rows])
+
+    async def commit(self):
+        if self._transaction is not None:
+            transaction, self._transaction = self._transaction, None
+            await transaction.commit()
+
+    async def rollback(self):
+        if self._transaction is not None:
+            transaction, self._transaction = self._transaction, None
+            await transaction.rollback()
+
+    async def close(self):
+        """Возвращает соединение в пул (незакоммиченное — откатывается)."""
+        try:
+            await self.rollback()
+        finally:
+            await self._pool.release(self._conn)
+
+
+class PostgresBackend:
+    name = "postgres"
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._pool = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def _get_pool(self):
+        if self._pool is None:
+            if not ASYNCPG_AVAILABLE:
+                raise RuntimeError("DATABASE_URL points to PostgreSQL, but asyncpg is not installed")
+            if self._lock is None:
+                self._lock = asyncio.Lock()
+            async with self._lock:
+                if self._pool is None:
+                    self._pool = await asyncpg.create_pool(
+                        self.dsn, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                        statement_cache_size=STATEMENT_CACHE_SIZE,
+                    )
+        return self._pool
+
+    async def connect(self) -> PostgresConnection:
+        pool = await self._get_pool()
+        return PostgresConnection(pool, await pool.acquire())
+
+    async def init(self):
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            await _migrate_postgres(conn)
+
+    async def close(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await pool.close()
+
+    def stream(self, db: PostgresConnection, sql: str, params: Sequence = ()):
+        return db.stream(sql, params)
+
+    async def columns(self, db: PostgresConnection, table: str) -> Dict[str, str]:
+        async with db.execute("""
+            SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ?
+            ORDER BY ordinal_position
+        """, (table,)) as cursor:
+            return {row[0]: "int" if _is_int_type(row[1]) else "text" for row in await cursor.fetchall()}
+
+    async def after_import(self, db: PostgresConnection, table: str):
+        """После загрузки с явными id — сдвинуть последовательность за максимальный id."""
+        async with db.execute("""
+            SELECT pg_get_serial_sequence(?, 'id') FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = ? AND column_name = 'id'
+        """, (table, table)) as cursor:
+            row = await cursor.fetchone()  # нет колонки id (users, registrations) — нет строки
+        sequence = row[0] if row else None
+        if sequence:
+            await db.execute(
+                f"SELECT setval(?, COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)", (sequence,))
+
+
+# ═══════════════════════════════════════════════════════════════
+# СХЕМА POSTGRESQL
+# ═══════════════════════════════════════════════════════════════
+
+# Схема после миграций 1..POSTGRES_BASELINE_VERSION (migrations.py)
+POSTGRES_BASELINE_VERSION = 7
+POSTGRES_SCHEMA: List[str] = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id BIGINT PRIMARY KEY,
+        username TEXT,
+        full_name TEXT,
+        registered_at TEXT,
+        is_active INTEGER DEFAULT 1,
+        has_registered_webinar INTEGER DEFAULT 0,
+        registered_webinar_at TEXT,
+        attended_webinar INTEGER DEFAULT 0,
+        purchased_course INTEGER DEFAULT 0,
+        payment_id TEXT,
+        source TEXT,
+        ref_by BIGINT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS referrals (
+        id BIGSERIAL PRIMARY KEY,
+        referrer_id BIGINT REFERENCES users(user_id),
+        friend_username TEXT,
+        created_at TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS practice_logs (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT,
+        practice_date TEXT,
+        duration_seconds INTEGER DEFAULT 0,
+        created_at TEXT,
+        UNIQUE (user_id, practice_date)
+    )
+    """,
+    "INSERT INTO settings (key, value) VALUES ('buyers_count', '50') ON CONFLICT DO NOTHING",
+    """
+    CREATE TABLE IF NOT EXISTS user_schedule (
+        id BIGSERIAL PRIMARY KEY,
+        user_id BIGINT NOT NULL,
+        funnel TEXT NOT NULL,
+        step_key TEXT NOT NULL,
+        due_at TEXT NOT NULL,
+        due_bucket BIGINT NOT NULL,
+        sent_at TEXT,
+        UNIQUE (user_id, funnel, step_key)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_user_schedule_due ON user_schedule(due_bucket, id) WHERE sent_at IS NULL",
+    """
+    CREATE TABLE IF NOT EXISTS segment_members (
+        snapshot_id TEXT NOT NULL,
+        user_id BIGINT NOT NULL,
+        PRIMARY KEY (snapshot_id, user_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_users_ref_by ON users(ref_by)",
+    "CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_id)",
+    """
+    CREATE TABLE IF NOT EXISTS media (
+        path TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        content_hash TEXT NOT NULL,
+        file_id TEXT NOT NULL,
+        uploaded_at TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS webinars (
+        id BIGSERIAL PRIMARY KEY,
+        slug TEXT UNIQUE NOT NULL,
+        title TEXT,
+        starts_at TEXT NOT NULL,
+        stream_link TEXT,
+        price INTEGER,
+        price_discount INTEGER,
+        is_active INTEGER DEFAULT 1,
+        created_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_webinars_starts ON webinars(starts_at)",
+    """
+    CREATE TABLE IF NOT EXISTS registrations (
+        webinar_id BIGINT NOT NULL REFERENCES webinars(id),
+        user_id BIGINT NOT NULL REFERENCES users(user_id),
+        registered_at TEXT,
+        attended INTEGER DEFAULT 0,
+        purchased INTEGER DEFAULT 0,
+        payment_id TEXT,
+        PRIMARY KEY (webinar_id, user_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_registrations_user ON registrations(user_id, webinar_id)",
+    """
+    CREATE TABLE IF NOT EXISTS practice_versions (
+        user_id BIGINT PRIMARY KEY,
+        version INTEGER NOT NULL
+    )
+    """,
+]
+
+# Миграции после базовой схемы: версия -> выражения (пара к миграции SQLite)
+POSTGRES_MIGRATIONS: Dict[int, List[str]] = {}
+
+# Ключ advisory-блокировки: бот и воркеры API применяют схему по очереди
+_MIGRATION_LOCK = 0x5AD4B07
+
+
+async def _migrate_postgres(conn):
+    uncovered = [m.version for m in migrations.MIGRATIONS
+                 if m.version > POSTGRES_BASELINE_VERSION and m.version not in POSTGRES_MIGRATIONS]
+    if uncovered:
+        raise RuntimeError(f"Migrations {uncovered} have no PostgreSQL counterpart in storage.POSTGRES_MIGRATIONS")
+    names = {m.version: m.name for m in migrations.MIGRATIONS}
+
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", _MIGRATION_LOCK)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT,
+                applied_at TEXT,
+                duration_ms INTEGER
+            )
+        """)
+        applied = {row[0] for row in await conn.fetch("SELECT version FROM schema_version")}
+        now = datetime.now().isoformat(" ")
+
+        if not applied:
+            for statement in POSTGRES_SCHEMA:
+                await conn.execute(statement)
+            # Основной вебинар — как миграция 6 на новой базе SQLite
+            await conn.execute("""
+                INSERT INTO webinars (slug, starts_at, price, price_discount, created_at)
+                VALUES ('main', $1, $2, $3, $4) ON CONFLICT (slug) DO NOTHING
+            """, messages.WEBINAR_DATE, messages.COURSE_PRICE, messages.COURSE_PRICE_DISCOUNT, now)
+            await conn.executemany(
+                "INSERT INTO schema_version (version, name, applied_at, duration_ms) VALUES ($1, $2, $3, 0)",
+                [(v, names.get(v), now) for v in range(1, POSTGRES_BASELINE_VERSION + 1)],
+            )
+            logging.info(f"PostgreSQL schema created (version {POSTGRES_BASELINE_VERSION})")
+
+        for version, statements in sorted(POSTGRES_MIGRATIONS.items()):
+            if version in applied:
+                continue
+            for statement in statements:
+                await conn.execute(statement)
+            await conn.execute(
+                "INSERT INTO schema_version (version, name, applied_at, duration_ms) VALUES ($1, $2, $3, 0)",
+                version, names.get(version), now)
+            logging.info(f"PostgreSQL migration {version} '{names.get(version)}' applied")
+
+
+# ═══════════════════════════════════════════════════════════════
+# ВЫБОР БЭКЕНДА
+# ═══════════════════════════════════════════════════════════════
+
+_backends: Dict[str, object] = {}
+
+
+def is_postgres(target: str) -> bool:
+    return target.startswith(POSTGRES_SCHEMES)
+
+
+def get_backend(target: str):
+    """Бэкенд для DSN PostgreSQL или пути к файлу SQLite (один на target)."""
+    backend = _backends.get(target)
+    if backend is None:
+        backend = _backends[target] = PostgresBackend(target) if is_postgres(target) else SQLiteBackend(target)
+    return backend
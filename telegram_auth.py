@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Проверка initData Telegram Mini App
+
+Telegram подписывает initData (строку query-string, которую Mini App
+получает в Telegram.WebApp.initData) токеном бота:
+
+    secret_key = HMAC_SHA256(key="WebAppData", msg=bot_token)
+    hash       = hex(HMAC_SHA256(key=secret_key, msg=data_check_string))
+
+где data_check_string — все поля, кроме hash, отсортированные по ключу,
+в виде "key=value" через "\\n". См.
+https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+
+Mini App присылает initData в заголовке X-Telegram-Init-Data на каждый
+запрос. Проверенные строки запоминаются (ограниченный TTL-кэш), так что
+HMAC считается один раз за сессию, а не на каждый запрос.
+
+    user = telegram_auth.verify(init_data, bot_token)   # dict пользователя или InitDataError
+"""
+
+import hashlib
+import hmac
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlencode
+
+import json_codec
+
+# Сколько initData считается действительной после auth_date (секунды)
+MAX_AGE = int(os.getenv("INIT_DATA_MAX_AGE", 24 * 3600))
+# Кэш проверенных строк: размер и время жизни записи
+CACHE_SIZE = int(os.getenv("INIT_DATA_CACHE_SIZE", 10000))
+CACHE_TTL = int(os.getenv("INIT_DATA_CACHE_TTL", 3600))
+
+# initData -> (истекает в, пользователь); порядок — от старых к новым
+_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+class InitDataError(ValueError):
+    """initData отсутствует, подделана или устарела."""
+
+
+@lru_cache(maxsize=4)
+def _secret_key(bot_token: str) -> bytes:
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+def parse(init_data: str, bot_token: str, now: float = None) -> dict:
+    """
+    Проверка подписи и срока initData без кэша.
+
+    Возвращает поля initData (user — уже разобранный dict).
+    """
+    if not init_data:
+        raise InitDataError("initData is empty")
+    if not bot_token:
+        raise InitDataError("bot token is not configured")
+
+    fields = dict(parse_qsl(init_data, keep_blank_values=True, strict_parsing=False))
+    received_hash = fields.pop("hash", None)
+    if not received_hash:
+        raise InitDataError("hash is missing")
+
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    expected = hmac.new(_secret_key(bot_token), data_check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, received_hash):
+        raise InitDataError("signature mismatch")
+
+    try:
+        auth_date = int(fields.get("auth_date", 0))
+    except ValueError:
+        raise InitDataError("auth_date is invalid")
+    now = time.time() if now is None else now
+    if MAX_AGE and now - auth_date > MAX_AGE:
+        raise InitDataError("initData is expired")
+
+    if "user" in fields:
+        try:
+            fields["user"] = json_codec.loads(fields["user"])
+        except ValueError:
+            raise InitDataError("user is not valid JSON")
+    fields["auth_date"] = auth_date
+    return fields
+
+
+def verify(init_data: str, bot_token: str) -> dict:
+    """
+    Пользователь (dict с id, first_name, ...) из проверенной initData.
+
+    Успешные проверки кэшируются по самой строке initData — повторный
+    запрос той же сессии не считает HMAC. Ошибки не кэшируются.
+    """
+    now = time.time()
+    cached = _cache.get(init_data)
+    if cached is not None:
+        if cached[0] > now:
+            return cached[1]
+        del _cache[init_data]
+
+    fields = parse(init_data, bot_token, now)
+    user = fields.get("user")
+    if not isinstance(user, dict) or not isinstance(user.get("id"), int):
+        raise InitDataError("user is missing")
+
+    expires = now + CACHE_TTL
+    if MAX_AGE:
+        expires = min(expires, fields["auth_date"] + MAX_AGE)
+    _cache[init_data] = (expires, user)
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return user
+
+
+def sign(fields: dict, bot_token: str) -> str:
+    """
+    initData, подписанная токеном бота (для нагрузочных тестов и отладки).
+
+    fields["user"] может быть dict — он будет закодирован в JSON.
+    """
+    fields = dict(fields)
+    if isinstance(fields.get("user"), dict):
+        fields["user"] = json_codec.dumps(fields["user"]).decode()
+    fields.setdefault("auth_date", str(int(time.time())))
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(fields.items()))
+    fields["hash"] = hmac.new(_secret_key(bot_token), data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
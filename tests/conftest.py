@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+Общие фикстуры тестов
+
+Модули бота лежат в корне репозитория — добавляем его в sys.path.
+Асинхронный код тесты запускают через asyncio.run (без плагинов pytest).
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import loop_watchdog  # noqa: E402
+
+# Сторож переживает loop каждого asyncio.run и сообщал бы о ложных зависаниях
+loop_watchdog.ENABLED = False
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """database.py на временном файле SQLite (DATABASE_URL не используется)."""
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "test.db"))
+    monkeypatch.setattr(database, "DATABASE_URL", "")
+    return database.DB_NAME
+
+
+BOT_TOKEN = "123456:test"
+
+
+@pytest.fixture
+def api_auth(monkeypatch):
+    """Подпись initData для api.py; лимиты частоты выключены."""
+    import api
+    import ratelimit
+    import telegram_auth
+
+    monkeypatch.setattr(api, "BOT_TOKEN", BOT_TOKEN)
+    monkeypatch.setattr(ratelimit, "ENABLED", False)
+
+    def headers(user_id: int, username: str = None) -> dict:
+        user = {"id": user_id, "first_name": "Test"}
+        if username:
+            user["username"] = username
+        return {"X-Telegram-Init-Data": telegram_auth.sign({"user": user}, BOT_TOKEN)}
+    return headers
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""/metrics и /debug/traces закрыты без METRICS_TOKEN."""
+
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import api
+
+PATHS = ("/metrics", "/debug/traces")
+
+
+async def _statuses(headers=None):
+    async with TestClient(TestServer(api.create_app())) as client:
+        statuses = []
+        for path in PATHS:
+            async with client.get(path, headers=headers) as response:
+                statuses.append(response.status)
+        return statuses
+
+
+def test_disabled_without_token(monkeypatch):
+    monkeypatch.setattr(api, "METRICS_TOKEN", None)
+    assert asyncio.run(_statuses()) == [404, 404]
+
+
+def test_require_token(monkeypatch):
+    monkeypatch.setattr(api, "METRICS_TOKEN", "secret")
+    assert asyncio.run(_statuses()) == [401, 401]
+    assert asyncio.run(_statuses({"Authorization": "Bearer wrong"})) == [401, 401]
+    assert asyncio.run(_statuses({"Authorization": "Bearer secret"})) == [200, 200]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""POST /api/referral/batch: чужие id — только админам."""
+
+import asyncio
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import api
+import messages
+
+USER_ID = 424242
+OTHER_ID = 515151
+
+
+async def _batch(headers, telegram_ids):
+    async with TestClient(TestServer(api.create_app())) as client:
+        async with client.post("/api/referral/batch", json={"telegram_ids": telegram_ids},
+                               headers=headers) as response:
+            return response.status, await response.json()
+
+
+def test_user_gets_only_own_link(api_auth):
+    status, body = asyncio.run(_batch(api_auth(USER_ID), [USER_ID]))
+    assert status == 200
+    assert list(body["data"]) == [str(USER_ID)]
+
+    status, body = asyncio.run(_batch(api_auth(USER_ID), [USER_ID, OTHER_ID]))
+    assert status == 403
+    assert body["success"] is False
+
+
+def test_admin_gets_any_links(api_auth):
+    headers = api_auth(USER_ID, messages.ADMIN_USERNAMES[0])
+    status, body = asyncio.run(_batch(headers, [USER_ID, OTHER_ID]))
+    assert status == 200
+    assert set(body["data"]) == {str(USER_ID), str(OTHER_ID)}
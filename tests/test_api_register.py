@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""POST /api/register в процессе без планировщика (воркер api_server)."""
+
+import asyncio
+from datetime import timedelta
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import api
+import database
+import funnel
+import scheduler
+
+USER_ID = 424242
+
+
+async def _register_through_api(headers):
+    await database.init_db()
+    starts_at = scheduler.now_local() + timedelta(days=6)
+    await database.save_webinar(database.MAIN_WEBINAR, starts_at)
+    await database.add_user(USER_ID, "tester", "Test User")
+
+    async with TestClient(TestServer(api.create_app())) as client:
+        async with client.post("/api/register", json={"telegram_id": USER_ID}, headers=headers) as response:
+            assert response.status == 200
+            assert (await response.json())["success"] is True
+
+    async with database.connect() as db:
+        async with db.execute(
+            "SELECT funnel, step_key FROM user_schedule WHERE user_id = ?", (USER_ID,)
+        ) as cursor:
+            rows = {tuple(row) for row in await cursor.fetchall()}
+    await database.close_db()
+    return rows
+
+
+def test_register_queues_webinar_funnel_without_scheduler(sqlite_db, api_auth):
+    assert funnel.all_funnels() == []  # setup_scheduler в этом процессе не вызывался
+
+    rows = asyncio.run(_register_through_api(api_auth(USER_ID)))
+
+    assert (funnel.SIGNUP_FUNNEL, "confirmation") in rows
+    expected = {(database.MAIN_WEBINAR, step.key) for step in funnel.WEBINAR_STEPS
+                if step.audience in scheduler.DRIP_AUDIENCES}
+    assert expected and expected <= rows
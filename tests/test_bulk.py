@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""bulk.py: выгрузка и загрузка в непустую базу."""
+
+import asyncio
+import io
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import api
+import bulk
+import database
+
+
+async def _logs():
+    async with database.connect() as db:
+        async with db.execute(
+            "SELECT id, user_id, practice_date, duration_seconds FROM practice_logs ORDER BY id"
+        ) as cursor:
+            return [tuple(row) for row in await cursor.fetchall()]
+
+
+async def _export_import(source, target, replace):
+    # Выгрузка из одной базы...
+    database.DB_NAME = source
+    await database.init_db()
+    await database.save_practice_log(1, "2026-01-01", 60)
+    await database.save_practice_log(1, "2026-01-02", 60)
+    dump = io.StringIO()
+    await bulk.export_table("practice_logs", dump)
+
+    # ...в другую, где те же id уже заняты другими строками
+    database.DB_NAME = target
+    await database.init_db()
+    await database.save_practice_log(2, "2026-01-01", 30)
+    await database.save_practice_log(1, "2026-01-02", 999)
+    dump.seek(0)
+    count = await bulk.import_table("practice_logs", dump, replace=replace)
+    return count, await _logs()
+
+
+def test_import_practice_logs_into_populated_db(sqlite_db, tmp_path):
+    count, logs = asyncio.run(_export_import(
+        str(tmp_path / "source.db"), str(tmp_path / "target.db"), replace=False))
+
+    assert count == 2
+    assert sorted(row[1:] for row in logs) == [
+        (1, "2026-01-01", 60),   # новая строка — id назначила база
+        (1, "2026-01-02", 999),  # уже была, без --replace не перезаписана
+        (2, "2026-01-01", 30),
+    ]
+    assert len({row[0] for row in logs}) == 3
+
+
+def test_import_practice_logs_replace(sqlite_db, tmp_path):
+    count, logs = asyncio.run(_export_import(
+        str(tmp_path / "source.db"), str(tmp_path / "target.db"), replace=True))
+
+    assert sorted(row[1:] for row in logs) == [
+        (1, "2026-01-01", 60),
+        (1, "2026-01-02", 60),
+        (2, "2026-01-01", 30),
+    ]
+
+
+async def _import_referrals(source, target, replace):
+    database.DB_NAME = source
+    await database.init_db()
+    await database.add_user(1, "a", "A")
+    await database.add_referrals(1, ["@old_friend", "@new_friend"])
+    dump = io.StringIO()
+    await bulk.export_table("referrals", dump)
+
+    # В целевой базе id 1 и 2 заняты чужими рекомендациями, одна из выгрузки уже есть
+    database.DB_NAME = target
+    await database.init_db()
+    await database.add_user(1, "a", "A")
+    await database.add_user(2, "b", "B")
+    await database.add_referrals(2, ["@someone", "@another"])
+    async with database.connect() as db:
+        await db.execute(
+            "INSERT INTO referrals (referrer_id, friend_username, created_at) VALUES (?, ?, ?)",
+            (1, "old_friend", "2020-01-01 00:00:00"))
+        await db.commit()
+    dump.seek(0)
+    count = await bulk.import_table("referrals", dump, replace=replace)
+    async with database.connect() as db:
+        async with db.execute(
+            "SELECT referrer_id, friend_username, created_at FROM referrals ORDER BY referrer_id, friend_username"
+        ) as cursor:
+            rows = [tuple(row) for row in await cursor.fetchall()]
+    return count, rows
+
+
+def test_import_referrals_into_populated_db(sqlite_db, tmp_path):
+    count, rows = asyncio.run(_import_referrals(
+        str(tmp_path / "source.db"), str(tmp_path / "target.db"), replace=False))
+
+    assert count == 2
+    assert [row[:2] for row in rows] == [
+        (1, "new_friend"),  # id из выгрузки занят — строка всё равно загружена
+        (1, "old_friend"),  # дубликат по (referrer_id, friend_username) — не задвоен
+        (2, "another"),
+        (2, "someone"),
+    ]
+    assert rows[1][2] == "2020-01-01 00:00:00"
+
+
+def test_import_referrals_replace_updates_duplicate(sqlite_db, tmp_path):
+    count, rows = asyncio.run(_import_referrals(
+        str(tmp_path / "source.db"), str(tmp_path / "target.db"), replace=True))
+
+    assert len(rows) == 4
+    assert rows[1][:2] == (1, "old_friend") and rows[1][2] != "2020-01-01 00:00:00"
+
+
+async def _practice_etag_after_import(headers):
+    await database.init_db()
+    await database.add_user(1, "a", "A")
+    await database.save_practice_log(1, "2026-01-01", 60)
+
+    async with TestClient(TestServer(api.create_app())) as client:
+        async with client.get("/api/practice/1", headers=headers) as response:
+            etag = response.headers["ETag"]
+        dump = io.StringIO("user_id,practice_date,duration_seconds\n1,2026-01-02,300\n")
+        await bulk.import_table("practice_logs", dump)
+        async with client.get("/api/practice/1", headers={**headers, "If-None-Match": etag}) as response:
+            status = response.status
+            days = (await response.json())["data"]["completed_days"] if status == 200 else None
+    await database.close_db()
+    return status, days
+
+
+def test_import_practice_logs_invalidates_etag(sqlite_db, api_auth):
+    status, days = asyncio.run(_practice_etag_after_import(api_auth(1)))
+    assert status == 200  # не 304 со старыми данными
+    assert len(days) == 2
+
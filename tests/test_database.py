@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""database.py на SQLite."""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import database
+
+
+async def claim_concurrently(users: int, pollers: int, batch: int):
+    await database.init_db()
+    due = datetime.now() - timedelta(minutes=1)
+    await database.enqueue_schedule([(user_id, "f", "s", due) for user_id in range(1, users + 1)])
+
+    async def poller():
+        claimed = []
+        while True:
+            rows = await database.claim_due_schedule(datetime.now(), batch)
+            if not rows:
+                return claimed
+            claimed.extend(rows)
+
+    results = await asyncio.gather(*(poller() for _ in range(pollers)))
+    await database.close_db()
+    return [row for rows in results for row in rows]
+
+
+def test_claim_due_schedule_is_atomic(sqlite_db):
+    claimed = asyncio.run(claim_concurrently(users=200, pollers=4, batch=7))
+    assert len(claimed) == len(set(claimed)) == 200
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Какие ошибки Telegram считаются отклонённым file_id."""
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+
+import media
+
+
+def _error(message):
+    return TelegramBadRequest(method=None, message=message)
+
+
+@pytest.mark.parametrize("message", [
+    "Bad Request: wrong file identifier/HTTP URL specified",
+    "Bad Request: wrong remote file identifier specified: Wrong string length",
+    "Bad Request: wrong file_id or the file is temporarily unavailable",
+    "Bad Request: type of file mismatch",
+])
+def test_stale_file_id_is_reuploaded(message):
+    assert media.is_stale_file_id(_error(message))
+
+
+@pytest.mark.parametrize("message", [
+    "Bad Request: file is too big",
+    "Bad Request: message caption is too long",
+    "Bad Request: chat not found",
+    'Bad Request: can\'t parse entities: Unsupported start tag "file"',
+])
+def test_other_errors_are_not_reuploaded(message):
+    assert not media.is_stale_file_id(_error(message))
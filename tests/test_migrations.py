@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Миграции: онлайн-бэкфилл порциями."""
+
+import asyncio
+
+import aiosqlite
+
+import migrations
+
+
+async def _backfill_sparse(path, ids, chunk_size):
+    async with aiosqlite.connect(path) as db:
+        await db.execute("CREATE TABLE t (user_id INTEGER PRIMARY KEY, done INTEGER DEFAULT 0)")
+        await db.executemany("INSERT INTO t (user_id) VALUES (?)", [(i,) for i in ids])
+        await db.commit()
+
+        chunks = []
+        real_execute = db.execute
+
+        def execute(sql, params=()):
+            if sql.lstrip().startswith("UPDATE"):
+                chunks.append(params)
+            return real_execute(sql, params)
+
+        db.execute = execute
+        total = await migrations.backfill(
+            db, "t", "UPDATE t SET done = 1 WHERE user_id > ? AND user_id <= ?",
+            key="user_id", chunk_size=chunk_size,
+        )
+        db.execute = real_execute
+        async with db.execute("SELECT COUNT(*) FROM t WHERE done = 0") as cursor:
+            left = (await cursor.fetchone())[0]
+        return total, chunks, left
+
+
+def test_backfill_sparse_keys_chunks_by_rows(tmp_path, monkeypatch):
+    """Разреженные user_id Telegram: порций — по числу строк, а не по диапазону ключей."""
+    monkeypatch.setattr(migrations, "BACKFILL_PAUSE", 0)
+    ids = [123456789, 987654321, 5012345678, 7012345678, 7012345679]
+
+    total, chunks, left = asyncio.run(asyncio.wait_for(
+        _backfill_sparse(str(tmp_path / "t.db"), ids, chunk_size=2), timeout=10,
+    ))
+
+    assert total == len(ids)
+    assert left == 0
+    assert chunks == [(123456788, 987654321), (987654321, 7012345678), (7012345678, 7012345679)]
+
+
+def test_backfill_empty_table(tmp_path):
+    total, chunks, left = asyncio.run(_backfill_sparse(str(tmp_path / "t.db"), [], chunk_size=2))
+    assert (total, chunks, left) == (0, [], 0)
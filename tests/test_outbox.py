@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Приоритетный лимитер исходящих сообщений."""
+
+import asyncio
+import time
+
+import outbox
+
+
+async def _bulk_then_interactive():
+    limiter = outbox.PriorityLimiter(rate=10, burst=5, bulk_reserve=3)
+    limiter._tokens = 0.0  # бюджет выбран рассылкой
+    started = time.monotonic()
+    released = {}
+
+    async def send(name, lane):
+        await limiter.acquire(lane)
+        released[name] = time.monotonic() - started
+
+    bulk = asyncio.create_task(send("bulk", outbox.BULK))  # ждёт 1 + резерв = 4 токена (0.4 с)
+    await asyncio.sleep(0.01)
+    interactive = asyncio.create_task(send("interactive", outbox.INTERACTIVE))  # ждёт 1 токен
+    await asyncio.wait_for(asyncio.gather(bulk, interactive), timeout=5)
+    return released
+
+
+def test_interactive_queued_after_bulk_is_released_first():
+    released = asyncio.run(_bulk_then_interactive())
+    assert released["interactive"] < released["bulk"]
+    # Без перевзвода таймера интерактив ждал бы задержку BULK (0.4 с)
+    assert released["interactive"] < 0.25
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+database.py и bulk.py на PostgreSQL
+
+Нужен DATABASE_URL (postgresql://...), иначе модуль пропускается.
+Каждый тест работает в своей схеме (search_path), которая удаляется
+после теста — данные базы не трогаются.
+"""
+
+import asyncio
+import io
+import os
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+
+import bulk  # noqa: E402
+from tests.test_database import claim_concurrently  # noqa: E402
+import database  # noqa: E402
+import migrations  # noqa: E402
+import storage  # noqa: E402
+
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+
+pytestmark = pytest.mark.skipif(
+    not storage.is_postgres(DATABASE_URL), reason="DATABASE_URL (PostgreSQL) is not set")
+
+
+def _with_search_path(dsn: str, schema: str) -> str:
+    # Неизвестные параметры DSN asyncpg передаёт серверу как настройки
+    parts = urlsplit(dsn)
+    query = parse_qsl(parts.query) + [("search_path", schema)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+@pytest.fixture
+def pg_dsn(monkeypatch):
+    schema = f"test_{uuid.uuid4().hex[:12]}"
+
+    async def execute(sql):
+        conn = await asyncpg.connect(DATABASE_URL)
+        try:
+            await conn.execute(sql)
+        finally:
+            await conn.close()
+
+    asyncio.run(execute(f"CREATE SCHEMA {schema}"))
+    dsn = _with_search_path(DATABASE_URL, schema)
+    monkeypatch.setattr(database, "DATABASE_URL", dsn)
+    yield dsn
+    asyncio.run(execute(f"DROP SCHEMA {schema} CASCADE"))
+
+
+def run(coro):
+    """Тест целиком в одном цикле событий, пул закрывается в конце."""
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            await database.close_db()
+    return asyncio.run(wrapper())
+
+
+# ═══════════════════════════════════════════════════════════════
+# СХЕМА И МИГРАЦИИ
+# ═══════════════════════════════════════════════════════════════
+
+async def _sqlite_columns(path):
+    await migrations.migrate(path)
+    backend = storage.SQLiteBackend(path)
+    db = await backend.connect()
+    try:
+        async with db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ) as cursor:
+            tables = [row[0] for row in await cursor.fetchall()]
+        return {t: set(await backend.columns(db, t)) for t in tables}
+    finally:
+        await db.close()
+
+
+def test_schema_matches_sqlite(pg_dsn, tmp_path):
+    expected = asyncio.run(_sqlite_columns(str(tmp_path / "schema.db")))
+
+    async def postgres_columns():
+        await database.init_db()
+        async with database.connect() as db:
+            return {t: set(await bulk.get_columns(db, t)) for t in expected}
+
+    assert run(postgres_columns()) == expected
+
+
+def test_concurrent_init_applies_schema_once(pg_dsn):
+    async def init_twice():
+        # Два процесса (бот и воркер API) — два пула, общая advisory-блокировка
+        backends = [storage.PostgresBackend(pg_dsn), storage.PostgresBackend(pg_dsn)]
+        try:
+            await asyncio.gather(*(b.init() for b in backends))
+            await backends[0].init()  # повторный старт — без изменений
+        finally:
+            for b in backends:
+                await b.close()
+        async with database.connect() as db:
+            async with db.execute("SELECT version FROM schema_version ORDER BY version") as cursor:
+                versions = [row[0] for row in await cursor.fetchall()]
+            async with db.execute("SELECT COUNT(*) FROM webinars WHERE slug = ?", (database.MAIN_WEBINAR,)) as cursor:
+                main = (await cursor.fetchone())[0]
+        return versions, main
+
+    versions, main = run(init_twice())
+    assert versions == list(range(1, storage.POSTGRES_BASELINE_VERSION + 1))
+    assert main == 1
+
+
+# ═══════════════════════════════════════════════════════════════
+# АДАПТЕР СОЕДИНЕНИЯ
+# ═══════════════════════════════════════════════════════════════
+
+def test_placeholders_and_rows(pg_dsn):
+    async def query():
+        async with database.connect() as db:
+            async with db.execute("SELECT '?' AS mark, CAST(? AS TEXT) AS value, ? + 1 AS n", ("x", 41)) as cursor:
+                row = await cursor.fetchone()
+        return row["mark"], row[1], dict(row)["n"]
+
+    assert run(query()) == ("?", "x", 42)
+
+
+def test_uncommitted_write_rolls_back_on_close(pg_dsn):
+    async def write():
+        await database.init_db()
+        async with database.connect() as db:
+            await db.execute("INSERT INTO settings (key, value) VALUES (?, ?)", ("lost", "1"))
+        async with database.connect() as db:
+            await db.execute("INSERT INTO settings (key, value) VALUES (?, ?)", ("kept", "1"))
+            await db.commit()
+        return await database.get_setting("lost"), await database.get_setting("kept")
+
+    assert run(write()) == (None, "1")
+
+
+def test_on_conflict_rowcounts(pg_dsn):
+    """database.py различает «записал» и «уже было» по rowcount — как в SQLite."""
+    async def scenario():
+        await database.init_db()
+        webinar_id = await database.save_webinar("pg_test", datetime.now() + timedelta(days=2))
+        await database.add_user(1001, "a", "A")
+        await database.add_user(1001, "a", "A")  # повтор — без ошибки
+        first = await database.set_webinar_registration(1001, webinar_id)
+        again = await database.set_webinar_registration(1001, webinar_id)
+        missing = await database.set_webinar_registration(1002, webinar_id)  # нет в users
+
+        await database.save_practice_log(1001, "2026-01-01", 60)
+        await database.save_practice_log(1001, "2026-01-01", 120)  # upsert
+        logs = await database.get_practice_logs(1001)
+
+        due = datetime.now() - timedelta(minutes=1)
+        await database.enqueue_schedule([(1001, "f", "s1", due), (1001, "f", "s2", due)])
+        await database.enqueue_schedule([(1001, "f", "s1", due)])  # уже в очереди
+        claimed = await database.claim_due_schedule(datetime.now(), 10)
+
+        deactivated = await database.deactivate_webinar("pg_test")
+        deactivated_again = await database.deactivate_webinar("pg_test")
+        return first, again, missing, logs, claimed, deactivated, deactivated_again
+
+    first, again, missing, logs, claimed, deactivated, deactivated_again = run(scenario())
+    assert (first, again, missing) == (True, False, False)
+    assert [(l["practice_date"], l["duration_seconds"]) for l in logs] == [("2026-01-01", 120)]
+    assert sorted(claimed) == [(1001, "f", "s1"), (1001, "f", "s2")]
+    assert (deactivated, deactivated_again) == (True, False)
+
+
+def test_after_import_sequences(pg_dsn):
+    async def scenario():
+        await database.init_db()
+        backend = database.backend()
+        async with database.connect() as db:
+            await db.execute(
+                "INSERT INTO webinars (id, slug, starts_at) VALUES (?, ?, ?)", (50, "imported", "2026-01-01 19:00:00"))
+            await db.commit()
+            await backend.after_import(db, "webinars")
+            await backend.after_import(db, "users")  # без колонки id — ничего не делает
+            await db.commit()
+        return await database.save_webinar("fresh", datetime(2026, 2, 1, 19))
+
+    assert run(scenario()) == 51
+
+
+def test_claim_due_schedule_skips_locked_rows(pg_dsn):
+    claimed = asyncio.run(claim_concurrently(users=500, pollers=8, batch=7))
+    assert len(claimed) == len(set(claimed)) == 500
+
+
+# ═══════════════════════════════════════════════════════════════
+# ПОТОКОВАЯ ВЫГРУЗКА
+# ═══════════════════════════════════════════════════════════════
+
+def test_iter_rows_streams_with_server_cursor(pg_dsn, monkeypatch):
+    fetched = []
+    fetch = storage.PostgresStreamCursor.fetchmany
+
+    async def fetchmany(self, size):
+        rows = await fetch(self, size)
+        fetched.append(len(rows))
+        return rows
+
+    monkeypatch.setattr(storage.PostgresStreamCursor, "fetchmany", fetchmany)
+
+    async def export():
+        await database.init_db()
+        empty = io.StringIO()
+        await bulk.export_table("users", empty)
+        async with database.connect() as db:
+            await db.executemany(
+                "INSERT INTO users (user_id, username, registered_at) VALUES (?, ?, ?)",
+                [(i, f"u{i}", datetime(2026, 1, 1)) for i in range(1, 2501)],
+            )
+            await db.commit()
+        out = io.StringIO()
+        count = await bulk.export_table("users", out, fmt="ndjson")
+        return empty.getvalue(), count, out.getvalue().splitlines()
+
+    empty, count, lines = run(export())
+    assert empty.startswith("user_id,username,")  # заголовок и у пустой таблицы
+    assert count == len(lines) == 2500
+    assert fetched[-4:] == [1000, 1000, 500, 0]
+
+
+def test_import_sqlite_export_into_populated_postgres(pg_dsn, tmp_path):
+    """Перенос SQLite → PostgreSQL в базу, где уже есть данные (id заняты)."""
+    async def migrate():
+        dumps = {}
+        database.DATABASE_URL = ""
+        database.DB_NAME = str(tmp_path / "source.db")
+        await database.init_db()
+        await database.add_user(1, "a", "A")
+        await database.add_referrals(1, ["@friend"])
+        await database.save_practice_log(1, "2026-01-01", 60)
+        for table in ("users", "referrals", "practice_logs"):
+            dumps[table] = io.StringIO()
+            await bulk.export_table(table, dumps[table])
+
+        database.DATABASE_URL = pg_dsn
+        await database.init_db()
+        await database.add_user(2, "b", "B")
+        await database.add_referrals(2, ["@other"])
+        await database.save_practice_log(2, "2026-01-01", 30)
+        counts = {}
+        for table, dump in dumps.items():
+            dump.seek(0)
+            counts[table] = await bulk.import_table(table, dump)
+        await database.add_referrals(1, ["@late"])  # последовательность id сдвинута за импорт
+        async with database.connect() as db:
+            async with db.execute("SELECT referrer_id, friend_username FROM referrals ORDER BY id") as cursor:
+                referrals = [tuple(row) for row in await cursor.fetchall()]
+        return counts, referrals, await database.get_practice_logs(1)
+
+    counts, referrals, logs = run(migrate())
+    assert counts == {"users": 1, "referrals": 1, "practice_logs": 1}
+    assert referrals == [(2, "other"), (1, "friend")]
+    assert [(l["practice_date"], l["duration_seconds"]) for l in logs] == [("2026-01-01", 60)]
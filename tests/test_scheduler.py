@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Персональная цепочка (drip) для записавшихся позже начала прогрева."""
+
+from datetime import datetime, timedelta
+
+import funnel
+import scheduler
+
+ANCHOR = datetime(2026, 3, 10, 19, 0)
+USER_ID = 777
+
+
+def _plan(registered_at):
+    f = funnel.Funnel("main", ANCHOR, webinar_id=1)
+    rows = scheduler.plan_user_schedule(USER_ID, registered_at, [f])
+    return {step_key: due_at for _, name, step_key, due_at in rows if name == "main"}
+
+
+def test_late_registrant_gets_missed_warmups():
+    registered_at = ANCHOR - timedelta(days=2)
+    plan = _plan(registered_at)
+
+    interval = scheduler.DRIP_CATCH_UP_INTERVAL
+    assert plan["warmup_1"] == registered_at + interval
+    assert plan["warmup_2"] == registered_at + 2 * interval
+    # Будущие шаги — в своё время
+    assert plan["warmup_3"] >= ANCHOR - timedelta(days=1)
+    assert "reminder_start" in plan and "warmup_5" in plan
+
+
+def test_no_warmup_catch_up_right_before_stream():
+    plan = _plan(ANCHOR - timedelta(minutes=30))
+    assert not {"warmup_1", "warmup_2", "warmup_3", "warmup_4"} & set(plan)
+    assert "reminder_5min" in plan
+
+
+def test_registrant_after_start_gets_start_reminder_and_offer():
+    registered_at = ANCHOR + timedelta(minutes=20)
+    plan = _plan(registered_at)
+    assert plan["reminder_start"] == registered_at + scheduler.DRIP_CATCH_UP_INTERVAL
+    assert "warmup_1" not in plan
+    assert "warmup_5" in plan
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""storage.py без PostgreSQL: перевод SQL и параметров, покрытие миграций."""
+
+from datetime import date, datetime
+
+import migrations
+import storage
+
+
+def test_translate_placeholders():
+    assert storage._translate("SELECT * FROM t WHERE a = ? AND b = ?") == \
+        "SELECT * FROM t WHERE a = $1 AND b = $2"
+
+
+def test_translate_keeps_question_marks_in_literals():
+    sql = "SELECT '?', 'it''s ?' FROM t WHERE a = ? AND b LIKE '%?%' AND c = ?"
+    assert storage._translate(sql) == \
+        "SELECT '?', 'it''s ?' FROM t WHERE a = $1 AND b LIKE '%?%' AND c = $2"
+
+
+def test_adapt_matches_sqlite3():
+    assert storage.adapt(True) == 1
+    assert storage.adapt(datetime(2026, 1, 2, 3, 4, 5)) == "2026-01-02 03:04:05"
+    assert storage.adapt(date(2026, 1, 2)) == "2026-01-02"
+    assert storage.adapt("x") == "x"
+
+
+def test_returns_rows():
+    assert storage._returns_rows("  select 1")
+    assert storage._returns_rows("WITH x AS (SELECT 1) SELECT * FROM x")
+    assert storage._returns_rows("UPDATE t SET a = 1 RETURNING id")
+    assert not storage._returns_rows("INSERT INTO t VALUES (?)")
+
+
+def test_every_sqlite_migration_has_postgres_counterpart():
+    uncovered = [m.version for m in migrations.MIGRATIONS
+                 if m.version > storage.POSTGRES_BASELINE_VERSION
+                 and m.version not in storage.POSTGRES_MIGRATIONS]
+    assert uncovered == []
+
+
+def test_backend_selection(tmp_path):
+    assert storage.get_backend("postgresql://u@h/db").name == "postgres"
+    assert storage.get_backend(str(tmp_path / "x.db")).name == "sqlite"
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Трассировка запросов
+
+Трасса — дерево интервалов (spans) одного апдейта Telegram или одного
+запроса к API. Текущая трасса передаётся через contextvars, поэтому
+вложенные вызовы попадают в неё сами:
+
+    update.callback_query                 корень (aiogram, outer middleware)
+      handler.handle_register             обработчик
+        db.set_webinar_registration       функция database.py
+          db.connect                      соединение с базой (открытие или из пула)
+        tg.AnswerCallbackQuery            запрос к Bot API (вместе с ожиданием outbox)
+
+Разница между db.<функция> и db.connect — время самих запросов.
+
+Законченные трассы лежат в кольцевом буфере (TRACE_BUFFER последних),
+медленные (дольше TRACE_SLOW_MS) — в отдельном буфере и в логе.
+Выгрузка JSON: GET /debug/traces (см. api.py), без внешнего коллектора.
+
+Вне трассы (задачи планировщика) span() ничего не делает.
+TRACING=0 — выключить.
+"""
+
+import functools
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+import json_codec
+
+ENABLED = os.getenv("TRACING", "1") != "0"
+# Трасса дольше этого — медленная (миллисекунды)
+SLOW_MS = float(os.getenv("TRACE_SLOW_MS", 500))
+BUFFER = int(os.getenv("TRACE_BUFFER", 200))
+SLOW_BUFFER = int(os.getenv("TRACE_SLOW_BUFFER", 100))
+# Больше интервалов в одной трассе не пишем (например, /broadcast)
+MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 500))
+
+_ids = itertools.count(1)
+_current: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+
+recent: deque = deque(maxlen=BUFFER)
+slow: deque = deque(maxlen=SLOW_BUFFER)
+
+
+class Trace:
+    """Одна трасса: корневой интервал и все вложенные."""
+
+    __slots__ = ("trace_id", "started_at", "spans", "dropped")
+
+    def __init__(self):
+        self.trace_id = f"{os.getpid():x}-{next(_ids):x}"
+        self.started_at = time.time()
+        self.spans: List[Span] = []
+        self.dropped = 0
+
+    @property
+    def root(self) -> "Span":
+        return self.spans[0]
+
+    def to_dict(self) -> dict:
+        root = self.root
+        return {
+            "trace_id": self.trace_id,
+            "name": root.name,
+            "started_at": self.started_at,
+            "duration_ms": root.duration_ms,
+            "attrs": root.attrs,
+            "error": root.error,
+            "dropped_spans": self.dropped,
+            "spans": [
+                {
+                    "id": s.span_id,
+                    "parent": s.parent_id,
+                    "name": s.name,
+                    "offset_ms": round((s.start - root.start) * 1000, 3),
+                    "duration_ms": s.duration_ms,
+                    "attrs": s.attrs,
+                    "error": s.error,
+                }
+                for s in self.spans[1:]
+            ],
+        }
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attrs", "start", "end", "error")
+
+    def __init__(self, trace: Trace, name: str, parent: Optional["Span"], attrs: dict):
+        self.trace = trace
+        self.span_id = len(trace.spans)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.end = None
+        self.error = None
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return round((self.end - self.start) * 1000, 3) if self.end is not None else None
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def _finish(trace: Trace):
+    recent.append(trace)
+    duration = trace.root.duration_ms
+    if duration >= SLOW_MS:
+        slow.append(trace)
+        logging.warning(f"Slow trace {trace.root.name} {duration:.0f}ms: "
+                        f"{json_codec.dumps(trace.to_dict()).decode()}")
+
+
+@contextmanager
+def start_trace(name: str, **attrs):
+    """Корневой интервал новой трассы (апдейт, HTTP-запрос)."""
+    if not ENABLED:
+        yield None
+        return
+    trace = Trace()
+    root = Span(trace, name, None, attrs)
+    trace.spans.append(root)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.error = type(e).__name__
+        raise
+    finally:
+        root.end = time.perf_counter()
+        _current.reset(token)
+        _finish(trace)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Вложенный интервал текущей трассы (вне трассы — ничего не делает)."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    trace = parent.trace
+    if len(trace.spans) >= MAX_SPANS:
+        trace.dropped += 1
+        yield None
+        return
+    child = Span(trace, name, parent, attrs)
+    trace.spans.append(child)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        child.end = time.perf_counter()
+        _current.reset(token)
+
+
+def traced(name: str):
+    """Декоратор корутины: вызов — интервал name."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def export(only_slow: bool = False, limit: int = None) -> List[dict]:
+    """Трассы из буфера (новые первыми) для выгрузки JSON."""
+    traces = list(slow if only_slow else recent)[::-1]
+    return [t.to_dict() for t in traces[:limit]]
+
+
+# ═══════════════════════════════════════════════════════════════
+# AIOGRAM
+# ═══════════════════════════════════════════════════════════════
+
+class UpdateTracingMiddleware:
+    """Outer middleware апдейтов: каждый апдейт — новая трасса."""
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        with start_trace(f"update.{event.event_type}", update_id=event.update_id,
+                         user_id=user.id if user else None):
+            return await handler(event, data)
+
+
+class HandlerTracingMiddleware:
+    """Inner middleware: интервал обработчика (после фильтров)."""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        with span(f"handler.{name}"):
+            return await handler(event, data)
+
+
+def install_dispatcher(dp):
+    dp.update.outer_middleware(UpdateTracingMiddleware())
+    for event, observer in dp.observers.items():
+        if event not in ("update", "error"):
+            observer.middleware(HandlerTracingMiddleware())
+
+
+class BotTracingMiddleware:
+    """
+    Middleware сессии бота: интервал на каждый запрос к Bot API.
+    (Без наследования от aiogram — database.py импортирует этот модуль
+    и не должен тянуть за собой aiogram.)
+    """
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        with span(f"tg.{type(method).__name__}", **({"chat_id": chat_id} if chat_id else {})):
+            return await make_request(bot, method)
+
+
+def install(bot):
+    """Подключает трассировку запросов к Bot API."""
+    bot.session.middleware(BotTracingMiddleware())